@@ -2,19 +2,26 @@
 
 """Belief Manager and world model."""
 
+import hashlib
 import os
-from PIL import Image
-import matplotlib.pyplot as plt
 from typing import List
 from dataclasses import dataclass
 import copy
 
+from contextual_long_term_reasoning.observation_sink import LazyImage, ObservationSink
+
 class WorldModel(object):
-    def __init__(self, mind_palace):
+    def __init__(self, mind_palace, observation_sink=None):
         self.mind_palace = mind_palace
+        # Background writer for show_images, created on first use
+        self.observation_sink = observation_sink
 
+    def get_observation_sink(self):
+        if self.observation_sink is None:
+            self.observation_sink = ObservationSink()
+        return self.observation_sink
 
-    def explore(self, time_instance_to_retrieve: str, p_place_to_search: list, show_images=True):
+    def explore(self, time_instance_to_retrieve: str, p_place_to_search: list, show_images=False):
         print(f"\nExploring the scene at time instance: {time_instance_to_retrieve}...")
         print(f"Searching for places: {p_place_to_search}...")
         print("Retrieving images...")
@@ -36,9 +43,8 @@ class WorldModel(object):
                 print(f"Error: The image file {image_path} does not exist.")
                 continue
             
-            # Open image and append to list
-            image = Image.open(image_path)
-            images.append(image)
+            # Lazy handle, the image is only decoded if someone looks at it
+            images.append(LazyImage(image_path))
             image_paths.append(image_path)
 
         if len(images) == 0:
@@ -46,22 +52,8 @@ class WorldModel(object):
             return [], []
 
         if show_images:
-            # Plot the images in a grid
-            _, axs = plt.subplots(1, len(images), figsize=(12, 12))
-            if len(images) > 1:
-                for img, ax in zip(images, axs):
-                    ax.axis("off")  # Hide axes
-                    ax.imshow(img)  # Display image
-                plt.tight_layout()
-            plt.show()
-
-            # Save images to disk
-            output_dir = "../examples/"
-            if not os.path.exists(output_dir):
-                os.makedirs(output_dir)
-            for idx, img in enumerate(images):
-                img.save(f"{output_dir}{idx:06d}.png")
-            # print(f"Images saved to {output_dir}")
+            # Plot and save the images on the observation sink thread, off the exploration path
+            self.get_observation_sink().submit(images, label=f"{time_instance_to_retrieve}: {p_place_to_search}")
 
         return images, image_paths
     
@@ -77,41 +69,28 @@ class WorldModel(object):
         if robot_place not in scene_graph.place_nodes:
             print(f"Error: Place {robot_place} not found in the scene graph, finding the closest one.")
             # Find the closest place
-            closest_place = None
-            best_id_diff = 1000
-            for node in scene_graph.place_nodes:
-                id_diff = abs(int(node) - int(robot_place))
-                if id_diff < best_id_diff:
-                    best_id_diff = id_diff
-                    closest_place = node
+            closest_place = scene_graph.resolve_place_id(robot_place, self.mind_palace)
             print(f"Closest place found: {closest_place}")
             robot_place = closest_place
-        current_position = copy.deepcopy(scene_graph.place_nodes[robot_place].position)
+        current_place = robot_place
 
         for place_can in p_place_to_search:
             # Get image path
             if place_can not in scene_graph.place_nodes:
                 print(f"Error: Place {place_can} not found in the scene graph, finding the closest one.")
                 # Find the closest place
-                closest_place = None
-                best_id_diff = 1000
-                for node in scene_graph.place_nodes:
-                    id_diff = abs(int(node) - int(place_can))
-                    if id_diff < best_id_diff:
-                        best_id_diff = id_diff
-                        closest_place = node
+                closest_place = scene_graph.resolve_place_id(place_can, self.mind_palace)
                 print(f"Closest place found: {closest_place}")
                 place = closest_place
             else:
                 place = place_can
                             
-            next_position = copy.deepcopy(scene_graph.place_nodes[place].position)
-
-            distance = sum((next_position[i] - current_position[i]) ** 2 for i in range(3)) ** 0.5
+            # Walking distance along the scene's traversal graph
+            distance = scene_graph.place_distance(current_place, place)
             print(distance)
             distance_traveled += distance
 
-            current_position = copy.deepcopy(next_position)
+            current_place = place
             
 
         robot_new_place = p_place_to_search[-1]
@@ -130,11 +109,11 @@ class ActionHistoryEntry:
 @dataclass
 class ObservationHistoryEntry:
     image_paths: List[str]  # Paths to saved images
-    observed_images: List   # Raw or processed image data (list of objects, numpy arrays, etc.)
+    observed_images: List   # Image data, LazyImage handles from WorldModel.explore (load() decodes them)
     insights: str           # Insights or observations derived from the images
 
 class BeliefManager(object):
-    def __init__(self, user_question: str, mind_palace):
+    def __init__(self, user_question: str, mind_palace, object_index=None, change_index=None):
         # Belief consists of the following:
         # 1. User question and possibly updated question with initial reasoning
         # 2. Object or instance to search
@@ -149,6 +128,8 @@ class BeliefManager(object):
         self.y_reasoning_to_search_object = ""
         self.x_robot_location = {"position": [0, 0, 0], "room": "r0"} 
         self.M_mind_palace = mind_palace
+        self.object_index = object_index  # Optional ObjectIndex over the mind palace
+        self.change_index = change_index  # Optional TemporalChangeIndex over the mind palace
         self.H_a_action_history: List[ActionHistoryEntry] = []  # List of action history entries
         self.H_o_observation_history: List[ObservationHistoryEntry] = []  # List of observation history entries
         self.S_exploration_summary: List[str] = []  # Exploration summaries
@@ -158,6 +139,7 @@ class BeliefManager(object):
         self.S_room_exploration_summary: List[str] = []  # Room exploration summaries
         self.H_a_room_exploration_action_history = []  # List of room exploration action history entries
         self.H_a_place_exploration_action_history = []  # List of place exploration action history entries
+        self.H_r_explored_room_ids = []  # Room ids explored in the current episode
 
     def update_history(self, text_image_insight: str, observed_images: list, image_paths: list, 
                        T_episode_to_explore: str, r_room_to_explore: str, 
@@ -203,6 +185,7 @@ class BeliefManager(object):
         self.S_room_exploration_summary = []
         self.H_a_room_exploration_action_history = []
         self.H_a_place_exploration_action_history = []
+        self.H_r_explored_room_ids = []
 
     def update_room_exploration_memory(self, text_image_insight: str, T_episode_to_explore: str, r_room_to_explore: str):
         # update_room_exploration_memory(text_image_insight, T_episode_to_explore, r_room_to_explore)
@@ -214,6 +197,7 @@ class BeliefManager(object):
         )
         self.S_room_exploration_summary.append(action_summary)
         self.H_a_room_exploration_action_history.append(action_summary)
+        self.H_r_explored_room_ids.append(r_room_to_explore)
 
     def update_place_exploration_memory(self, p_goal_poses: list):
         # combine the H_a_room_exploration_action_history with the p_goal_poses
@@ -224,8 +208,48 @@ class BeliefManager(object):
                 self.H_a_place_exploration_action_history.append(p)
         # print("Combined action history: ", self.H_a_place_exploration_action_history, "\n")
 
+    def fork(self):
+        # Belief to explore one episode on its own (e.g. concurrently with other episodes): shares the question,
+        # the mind palace and the indices, copies the histories and starts with an empty room/place memory
+        fork = copy.copy(self)
+        fork.H_a_action_history = list(self.H_a_action_history)
+        fork.H_o_observation_history = list(self.H_o_observation_history)
+        fork.S_exploration_summary = list(self.S_exploration_summary)
+        fork.S_EQA_reasoning_summary = list(self.S_EQA_reasoning_summary)
+        fork.reset_room_and_place_exploration_memory()
+        fork.fork_base = (len(self.H_a_action_history), len(self.H_o_observation_history),
+                          len(self.S_exploration_summary), len(self.S_EQA_reasoning_summary))
+        return fork
+
+    def merge(self, fork):
+        # Append what the fork added since fork()
+        num_actions, num_observations, num_summaries, num_reasoning = fork.fork_base
+        self.H_a_action_history.extend(fork.H_a_action_history[num_actions:])
+        self.H_o_observation_history.extend(fork.H_o_observation_history[num_observations:])
+        self.S_exploration_summary.extend(fork.S_exploration_summary[num_summaries:])
+        self.S_EQA_reasoning_summary.extend(fork.S_EQA_reasoning_summary[num_reasoning:])
+
+    def fork_place_memory(self):
+        # Belief to search one room concurrently with other rooms of the same episode: shares everything but
+        # the place exploration history, which merge_place_memory adds back
+        fork = copy.copy(self)
+        fork.H_a_place_exploration_action_history = list(self.H_a_place_exploration_action_history)
+        return fork
+
+    def merge_place_memory(self, fork):
+        self.update_place_exploration_memory(fork.H_a_place_exploration_action_history)
+
+    def belief_digest(self):
+        # Changes whenever the belief does: the object to search and what the agent found so far
+        digest = hashlib.sha1()
+        for text in [str(self.y_object_to_search), str(self.y_reasoning_to_search_object)] + [str(summary) for summary in self.S_exploration_summary]:
+            digest.update(text.encode("utf-8"))
+            digest.update(b"\0")
+        return digest.hexdigest()
+
     def get_now_episode(self):
-        for episode_name, scene_graph in self.M_mind_palace.items():
+        # Only the episode names, a lazy mind palace must not load every scene graph here
+        for episode_name in self.M_mind_palace:
             if "now" in episode_name:
                 return episode_name
         
\ No newline at end of file
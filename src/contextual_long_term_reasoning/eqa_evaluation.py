@@ -39,7 +39,7 @@ class EQAEvaluation(object):
         )
         try:
             messages = self.oa_interface.prepare_openai_messages(prompt)
-            output = self.oa_interface.call_openai_api(messages=messages)
+            output = self.oa_interface.call_openai_api(messages=messages, call_site="judge")
             print("EQAEvaluation Output: \n\n", output)
 
             json_object = self.oa_interface.answer_to_json(output)
@@ -69,7 +69,7 @@ class EQAEvaluation(object):
         GT_best_path_length = 0
 
         T_episode_to_explore = None
-        for time_instance, _ in belief_manager.M_mind_palace.items():
+        for time_instance in belief_manager.M_mind_palace:
             if 'now' in time_instance:
                 T_episode_to_explore = time_instance
                 break
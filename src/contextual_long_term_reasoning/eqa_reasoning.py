@@ -8,6 +8,18 @@ from contextual_long_term_reasoning.openai_interface import OpenAIInterface
 class EQAReasoning(object):
     def __init__(self):
         self.oa_interface = OpenAIInterface()
+
+    def prepare_observation_messages(self, pre_image_prompt: str, post_image_prompt: str, image_paths: list):
+        messages, image_failures = self.oa_interface.prepare_openai_vision_messages(pre_image_prompt=pre_image_prompt,
+                                                                                    post_image_prompt=post_image_prompt,
+                                                                                    image_paths=image_paths,
+                                                                                    return_image_failures=True)
+        if len(image_paths) > 0 and len(image_failures) == len(image_paths):
+            # The prompt announces an image: say it is missing instead of letting the model guess its content
+            print("EQA Reasoning: No observation image could be used: ", image_failures)
+            messages[0]["content"].insert(1 if pre_image_prompt else 0,
+                                          {"text": "(The image could not be loaded, rely on the observations above.)\n", "type": "text"})
+        return messages
     
     def check_ready_to_answer(self, belief_manager: BeliefManager):
         # If there's no observation yet, assume we are not ready to answer
@@ -55,10 +67,9 @@ class EQAReasoning(object):
         # observation_image_paths = belief_manager.H_o_observation_history[-1].image_paths if len(belief_manager.H_o_observation_history) > 0 else []
 
         try:
-            messages = self.oa_interface.prepare_openai_vision_messages(pre_image_prompt=prompt_0a_check_and_try_to_answer, 
-                                                           post_image_prompt=prompt_0b_check_and_try_to_answer, 
-                                                           image_paths=observation_image_paths)
-            output = self.oa_interface.call_openai_api(messages=messages)
+            messages = self.prepare_observation_messages(prompt_0a_check_and_try_to_answer, prompt_0b_check_and_try_to_answer,
+                                                         observation_image_paths)
+            output = self.oa_interface.call_openai_api(messages=messages, call_site="readiness")
             print("EQA Reasoning check_ready_to_answer Output: \n", output, "\n")
 
             json_object = self.oa_interface.answer_to_json(output)
@@ -115,10 +126,9 @@ class EQAReasoning(object):
         print("EQA Reasoning: observation_image_paths: ", observation_image_paths)
 
         try:
-            messages = self.oa_interface.prepare_openai_vision_messages(pre_image_prompt=prompt_0a_check_and_try_to_answer, 
-                                                           post_image_prompt=prompt_0b_check_and_try_to_answer, 
-                                                           image_paths=observation_image_paths, bool_image_resize_small=True)
-            output = self.oa_interface.call_openai_api(messages=messages)
+            messages = self.prepare_observation_messages(prompt_0a_check_and_try_to_answer, prompt_0b_check_and_try_to_answer,
+                                                         observation_image_paths)
+            output = self.oa_interface.call_openai_api(messages=messages, call_site="answer")
             print("EQA Reasoning answer the question Output: \n\n", output, "\n")
 
             json_object = self.oa_interface.answer_to_json(output)
@@ -161,7 +171,7 @@ class EQAReasoning(object):
 
         try:
             messages = self.oa_interface.prepare_openai_messages(prompt_1_object_identification)
-            output = self.oa_interface.call_openai_api(messages=messages,)
+            output = self.oa_interface.call_openai_api(messages=messages, call_site="object")
             
 
             json_object = self.oa_interface.answer_to_json(output)
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+
+"""Memory and disk cache of ready-to-send image data URLs for vision queries."""
+
+import base64
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+import cv2
+
+IMAGE_CODECS = {
+    # codec: (file extension for cv2.imencode, mime type, cv2 quality flag)
+    "png": (".png", "image/png", None),
+    "jpeg": (".jpg", "image/jpeg", cv2.IMWRITE_JPEG_QUALITY),
+    "webp": (".webp", "image/webp", cv2.IMWRITE_WEBP_QUALITY),
+}
+
+
+def encode_image_payload(path: str, image_size: Optional[int] = None, codec: str = "png", quality: Optional[int] = None):
+    # Returns a base64 data URL, or None if the image cannot be read
+    if codec not in IMAGE_CODECS:
+        raise ValueError(f"Unknown image codec: {codec}. Expected one of {list(IMAGE_CODECS)}")
+    extension, mime_type, quality_flag = IMAGE_CODECS[codec]
+
+    frame = cv2.imread(path)
+    if frame is None:
+        return None
+    if image_size:
+        factor = image_size / max(frame.shape[:2])
+        frame = cv2.resize(frame, dsize=None, fx=factor, fy=factor)
+
+    params = []
+    if quality_flag is not None and quality is not None:
+        params = [quality_flag, int(quality)]
+    success, buffer = cv2.imencode(extension, frame, params)
+    if not success:
+        return None
+    frame = base64.b64encode(buffer).decode("utf-8")
+    return f"data:{mime_type};base64,{frame}"
+
+
+class ImagePayloadCache(object):
+    def __init__(self, cache_dir: Optional[str] = None, max_memory_mb: float = 256.0):
+        self.cache_dir = cache_dir
+        self.max_memory_bytes = int(max_memory_mb * 1024 * 1024)
+
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+
+        self.stats_memory_hits = 0
+        self.stats_disk_hits = 0
+        self.stats_encoded = 0
+
+        if self.cache_dir is not None:
+            os.makedirs(self.cache_dir, exist_ok=True)
+
+    @classmethod
+    def from_env(cls):
+        # OPENAI_IMAGE_CACHE_DIR adds a disk layer shared between runs
+        return cls(cache_dir=os.environ.get("OPENAI_IMAGE_CACHE_DIR") or None,
+                   max_memory_mb=float(os.environ.get("OPENAI_IMAGE_CACHE_MAX_MB", "256")))
+
+    def make_key(self, path: str, image_size: Optional[int], codec: str, quality: Optional[int]):
+        # The mtime and size invalidate the entry whenever the frame on disk changes
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        key = f"{os.path.realpath(path)}|{stat.st_mtime_ns}|{stat.st_size}|{image_size}|{codec}|{quality}"
+        return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+    def key_path(self, key: str):
+        return os.path.join(self.cache_dir, key[:2], key + ".txt")
+
+    def get(self, path: str, image_size: Optional[int] = None, codec: str = "png", quality: Optional[int] = None):
+        key = self.make_key(path, image_size, codec, quality)
+        if key is None:
+            return None
+
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.stats_memory_hits += 1
+                return self._memory[key]
+
+        payload = None
+        if self.cache_dir is not None:
+            try:
+                with open(self.key_path(key), "r") as f:
+                    payload = f.read()
+                with self._lock:
+                    self.stats_disk_hits += 1
+            except OSError:
+                payload = None
+
+        if payload is None:
+            payload = encode_image_payload(path, image_size, codec, quality)
+            if payload is None:
+                return None
+            with self._lock:
+                self.stats_encoded += 1
+            if self.cache_dir is not None:
+                self.write_to_disk(key, payload)
+
+        self.remember(key, payload)
+        return payload
+
+    def write_to_disk(self, key: str, payload: str):
+        path = self.key_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(payload)
+        os.replace(tmp_path, path)
+
+    def remember(self, key: str, payload: str):
+        with self._lock:
+            if key in self._memory:
+                return
+            self._memory[key] = payload
+            self._memory_bytes += len(payload)
+            while self._memory_bytes > self.max_memory_bytes and len(self._memory) > 1:
+                _, evicted = self._memory.popitem(last=False)
+                self._memory_bytes -= len(evicted)
+
+    def get_many(self, image_paths: List[str], image_size: Optional[int] = None, codec: str = "png",
+                 quality: Optional[int] = None, num_workers: int = 4):
+        # Decode, resize and encode on a bounded thread pool (cv2 releases the GIL).
+        # Returns (path, data URL or None, error or None) in the input order.
+        def load(path):
+            try:
+                payload = self.get(path, image_size, codec, quality)
+            except Exception as e:
+                return path, None, f"{type(e).__name__}: {e}"
+            if payload is None:
+                reason = "file not found" if not os.path.exists(path) else "image could not be decoded"
+                return path, None, reason
+            return path, payload, None
+
+        if num_workers <= 1 or len(image_paths) <= 1:
+            return [load(path) for path in image_paths]
+        return list(get_image_executor(num_workers).map(load, image_paths))
+
+    def precompute(self, image_paths: List[str], image_sizes=(512,), codec: str = "png",
+                   quality: Optional[int] = None, num_workers: int = 8):
+        # Bulk encode frames (e.g. when the mind palace is built) so vision queries only hit the cache
+        num_encoded = 0
+        num_requested = 0
+        for image_size in image_sizes:
+            results = self.get_many(image_paths, image_size, codec, quality, num_workers=num_workers)
+            num_encoded += sum(1 for _, payload, _ in results if payload is not None)
+            num_requested += len(results)
+        print(f"ImagePayloadCache: pre-encoded {num_encoded}/{num_requested} images ({codec})")
+        return num_encoded
+
+    def print_stats(self):
+        print(f"ImagePayloadCache: {self.stats_memory_hits} memory hits, {self.stats_disk_hits} disk hits, "
+              f"{self.stats_encoded} encoded, {self._memory_bytes / 1e6:.1f} MB in memory")
+
+
+_shared_image_payload_cache = None
+_shared_image_payload_cache_lock = threading.Lock()
+_image_executors = {}
+
+
+def get_image_executor(num_workers: int):
+    # One long-lived pool per size, shared by every interface, instead of a new pool per request
+    with _shared_image_payload_cache_lock:
+        if num_workers not in _image_executors:
+            _image_executors[num_workers] = ThreadPoolExecutor(max_workers=num_workers,
+                                                               thread_name_prefix="image_payload")
+        return _image_executors[num_workers]
+
+
+def get_shared_image_payload_cache():
+    global _shared_image_payload_cache
+    with _shared_image_payload_cache_lock:
+        if _shared_image_payload_cache is None:
+            _shared_image_payload_cache = ImagePayloadCache.from_env()
+        return _shared_image_payload_cache
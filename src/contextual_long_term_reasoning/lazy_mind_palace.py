@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+
+"""Mind palace mapping that loads episode scene graphs on first access and evicts them by LRU."""
+
+import json
+import os
+import sys
+import threading
+from collections import OrderedDict
+from collections.abc import Mapping
+from concurrent.futures import Future
+from typing import Optional
+
+from contextual_long_term_reasoning.mind_palace_generation import LoadingHabitatSceneGraph, SceneGraph
+from contextual_long_term_reasoning.object_index import object_index_records
+from contextual_long_term_reasoning.place_node_store import PLACE_NODE_STORE_COLUMNS, PlaceNodeStore
+from contextual_long_term_reasoning.temporal_change_index import room_object_counts
+
+
+def estimate_place_nodes_bytes(place_nodes, sample_size: int = 64):
+    # Memory-mapped columns are counted in full (they live in the page cache while in use),
+    # PlaceNode objects are measured on a sample and extrapolated
+    if isinstance(place_nodes, PlaceNodeStore):
+        return sum(getattr(place_nodes, name).nbytes for name in PLACE_NODE_STORE_COLUMNS)
+    if len(place_nodes) == 0:
+        return 0
+    sampled_bytes = 0
+    sampled = 0
+    for place_id in place_nodes:
+        place_node = place_nodes[place_id]
+        sampled_bytes += sys.getsizeof(place_node) + sys.getsizeof(place_node.__dict__)
+        for value in place_node.__dict__.values():
+            sampled_bytes += sys.getsizeof(value)
+            if isinstance(value, (list, tuple)):
+                sampled_bytes += sum(sys.getsizeof(item) for item in value)
+        sampled += 1
+        if sampled >= sample_size:
+            break
+    return int(sampled_bytes / sampled * len(place_nodes))
+
+
+def estimate_scene_graph_bytes(scene_graph: SceneGraph):
+    num_bytes = estimate_place_nodes_bytes(scene_graph.place_nodes) if scene_graph.place_nodes is not None else 0
+    # Derived structures kept warm on the scene graph
+    if scene_graph.place_spatial_index is not None:
+        num_bytes += scene_graph.place_spatial_index.positions.nbytes
+    if scene_graph.place_traversal_graph is not None:
+        traversal_graph = scene_graph.place_traversal_graph
+        if traversal_graph.place_distances is not None:
+            num_bytes += traversal_graph.place_distances.nbytes
+        num_bytes += sum(row.nbytes for row in traversal_graph.place_distance_rows.values())
+    if scene_graph.place_retrieval is not None:
+        num_bytes += scene_graph.place_retrieval.matrix.nbytes
+    return num_bytes
+
+
+def episode_object_summary(scene_graph: SceneGraph):
+    # What the object index and the change index need from one episode, small enough to keep for every episode
+    return {"object_records": object_index_records(scene_graph), "room_object_counts": room_object_counts(scene_graph)}
+
+
+class HabitatEpisodeLoader(object):
+    # Builds the scene graph of one Habitat episode, the way the driver does it eagerly
+    def __init__(self, scene_name, frames_dataset_dir, state_dataset_dir, caption_dataset_dir=None,
+                 recognize_anything_model=None, b_run_RAM=False, b_load_pkl=True, storage_format="pickle",
+                 num_workers=None, b_precompute_traversal_graph=False, image_payload_cache=None):
+        self.scene_name = scene_name
+        self.frames_dataset_dir = frames_dataset_dir
+        self.state_dataset_dir = state_dataset_dir
+        self.caption_dataset_dir = caption_dataset_dir
+        self.recognize_anything_model = recognize_anything_model
+        self.b_run_RAM = b_run_RAM
+        self.b_load_pkl = b_load_pkl
+        self.storage_format = storage_format
+        self.num_workers = num_workers
+        self.b_precompute_traversal_graph = b_precompute_traversal_graph
+        self.image_payload_cache = image_payload_cache  # Pre-encode the frames when set
+
+    def __call__(self):
+        print(f"Loading scene: {self.scene_name}")
+        hbt_scene_loader = LoadingHabitatSceneGraph(self.scene_name, self.frames_dataset_dir, self.state_dataset_dir,
+                                                    self.recognize_anything_model, self.caption_dataset_dir)
+        place_nodes = hbt_scene_loader.load_place_nodes(self.b_run_RAM, self.b_load_pkl, num_workers=self.num_workers,
+                                                        storage_format=self.storage_format)
+        room_nodes = hbt_scene_loader.load_room_nodes(place_nodes)
+        scene_graph = SceneGraph(self.scene_name, self.state_dataset_dir, room_nodes=room_nodes, place_nodes=place_nodes)
+
+        if self.image_payload_cache is not None:
+            hbt_scene_loader.preencode_place_images(place_nodes, self.image_payload_cache)
+        if self.b_precompute_traversal_graph:
+            scene_graph.traversal_graph()
+        return scene_graph
+
+    def object_summary_path(self):
+        return os.path.join(self.state_dataset_dir, 'object_summary_' + self.scene_name + '.json')
+
+    def source_signature(self):
+        # Size and mtime of the stored place nodes, a cached summary is stale once they are rebuilt
+        signature = []
+        place_nodes_path = os.path.join(self.state_dataset_dir, 'place_nodes_' + self.scene_name)
+        for path in (place_nodes_path + '.pkl', place_nodes_path):
+            paths = [os.path.join(path, name) for name in sorted(os.listdir(path))] if os.path.isdir(path) else [path]
+            for file_path in paths:
+                if os.path.isfile(file_path):
+                    stat = os.stat(file_path)
+                    signature.append([os.path.basename(file_path), stat.st_size, stat.st_mtime_ns])
+        return signature
+
+
+class LazyMindPalace(Mapping):
+    # episode name -> SceneGraph, in the order of episode_loaders (newest first, like the eager dict).
+    # Iterating, len() and `in` never load anything; indexing loads the episode on first access.
+    def __init__(self, episode_loaders: dict, max_memory_mb: Optional[float] = None, max_loaded_episodes: Optional[int] = None,
+                 b_pin_now_episode: bool = True):
+        self.episode_loaders = OrderedDict(episode_loaders)
+        self.max_memory_bytes = int(max_memory_mb * 1024 * 1024) if max_memory_mb else None
+        self.max_loaded_episodes = max_loaded_episodes
+        self.b_pin_now_episode = b_pin_now_episode  # Most questions start in "now", never evict it
+
+        self.loaded = OrderedDict()  # episode -> SceneGraph, least recently used first
+        self.summaries = {}  # episode -> episode_object_summary, kept when the scene graph is evicted
+        self.loaded_bytes = {}
+        self.loading = {}  # episode -> Future of the scene graph being built, other threads wait on it
+        self._lock = threading.RLock()
+
+        self.stats_loads = 0
+        self.stats_hits = 0
+        self.stats_evictions = 0
+
+    def __getitem__(self, episode):
+        with self._lock:
+            if episode in self.loaded:
+                self.loaded.move_to_end(episode)
+                self.stats_hits += 1
+                return self.loaded[episode]
+            if episode not in self.episode_loaders:
+                raise KeyError(episode)
+            loading = self.loading.get(episode)
+            b_build = loading is None
+            if b_build:
+                loading = self.loading[episode] = Future()
+        if not b_build:
+            # Another thread is building this episode
+            return loading.result()
+
+        # Build outside the lock, so hits and loads of other episodes are not blocked
+        try:
+            scene_graph = self.episode_loaders[episode]()
+        except Exception as e:
+            with self._lock:
+                del self.loading[episode]
+            loading.set_exception(e)
+            raise e
+        with self._lock:
+            self.loaded[episode] = scene_graph
+            self.loaded_bytes[episode] = estimate_scene_graph_bytes(scene_graph)
+            self.stats_loads += 1
+            del self.loading[episode]
+            self.evict_to_budget(keep=episode)
+        loading.set_result(scene_graph)
+        return scene_graph
+
+    def __iter__(self):
+        return iter(self.episode_loaders)
+
+    def __len__(self):
+        return len(self.episode_loaders)
+
+    def __contains__(self, episode):
+        return episode in self.episode_loaders
+
+    def episode_summary(self, episode):
+        # Object summary of an episode for the object/change indexes. Cached on disk next to the scene when the
+        # loader supports it, so building the indexes does not load every episode on later runs.
+        with self._lock:
+            if episode in self.summaries:
+                return self.summaries[episode]
+        if episode not in self.episode_loaders:
+            raise KeyError(episode)
+        loader = self.episode_loaders[episode]
+        path = loader.object_summary_path() if hasattr(loader, "object_summary_path") else None
+        signature = loader.source_signature() if path is not None else None
+
+        summary = None
+        if path is not None and os.path.exists(path):
+            try:
+                with open(path, 'r') as f:
+                    cached = json.load(f)
+                if cached.get("signature") == signature:
+                    summary = cached["summary"]
+            except (OSError, ValueError, KeyError) as e:
+                print(f"LazyMindPalace: Could not read the object summary of {episode}: {e}")
+        if summary is None:
+            # JSON round trip, so a fresh summary looks like a cached one (lists, string keys)
+            summary = json.loads(json.dumps(episode_object_summary(self[episode])))
+            if path is not None:
+                try:
+                    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+                    with open(tmp_path, 'w') as f:
+                        json.dump({"signature": signature, "summary": summary}, f)
+                    os.replace(tmp_path, path)
+                except OSError as e:
+                    print(f"LazyMindPalace: Could not cache the object summary of {episode}: {e}")
+        with self._lock:
+            self.summaries[episode] = summary
+        return summary
+
+    def is_loaded(self, episode):
+        return episode in self.loaded
+
+    def loaded_episodes(self):
+        return list(self.loaded)
+
+    def memory_bytes(self):
+        with self._lock:
+            # Derived structures (traversal graph, retrieval index) grow after loading, so measure again
+            for episode, scene_graph in self.loaded.items():
+                self.loaded_bytes[episode] = estimate_scene_graph_bytes(scene_graph)
+            return sum(self.loaded_bytes.values())
+
+    def is_pinned(self, episode):
+        return self.b_pin_now_episode and "now" in episode
+
+    def evict(self, episode):
+        with self._lock:
+            if episode in self.loaded:
+                del self.loaded[episode]
+                del self.loaded_bytes[episode]
+                self.stats_evictions += 1
+
+    def evict_to_budget(self, keep=None):
+        with self._lock:
+            def over_budget():
+                if self.max_loaded_episodes is not None and len(self.loaded) > self.max_loaded_episodes:
+                    return True
+                return self.max_memory_bytes is not None and self.memory_bytes() > self.max_memory_bytes
+
+            while over_budget():
+                candidates = [episode for episode in self.loaded if episode != keep and not self.is_pinned(episode)]
+                if len(candidates) == 0:
+                    break
+                print(f"LazyMindPalace: evicting {candidates[0]}")
+                self.evict(candidates[0])
+
+    def print_stats(self):
+        print(f"LazyMindPalace: {len(self.loaded)}/{len(self.episode_loaders)} episodes loaded "
+              f"({self.memory_bytes() / 1e6:.1f} MB), {self.stats_loads} loads, {self.stats_hits} hits, "
+              f"{self.stats_evictions} evictions")
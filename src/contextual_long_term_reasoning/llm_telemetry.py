@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+
+"""Per-call LLM telemetry: tokens, latency, payload size and cost per call site."""
+
+import json
+import os
+import threading
+import time
+from dataclasses import dataclass, asdict, field
+from typing import List, Optional
+
+# USD per 1M (prompt, completion) tokens
+MODEL_PRICES_PER_1M_TOKENS = {
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4-turbo": (10.00, 30.00),
+}
+
+
+def estimate_cost_usd(model: str, prompt_tokens: int, completion_tokens: int):
+    prices = MODEL_PRICES_PER_1M_TOKENS.get(model)
+    if prices is None:
+        # Dated snapshots (e.g. gpt-4o-2024-08-06) are priced like their base model
+        for model_name in sorted(MODEL_PRICES_PER_1M_TOKENS, key=len, reverse=True):
+            if model.startswith(model_name):
+                prices = MODEL_PRICES_PER_1M_TOKENS[model_name]
+                break
+    if prices is None:
+        return 0.0
+    return (prompt_tokens * prices[0] + completion_tokens * prices[1]) / 1e6
+
+
+def measure_messages(messages: list):
+    # Returns (request payload bytes, number of images)
+    request_bytes = 0
+    image_count = 0
+    for message in messages:
+        content = message["content"]
+        if isinstance(content, str):
+            request_bytes += len(content.encode("utf-8"))
+            continue
+        for part in content:
+            if part.get("type") == "text":
+                request_bytes += len(part["text"].encode("utf-8"))
+            elif part.get("type") == "image_url":
+                request_bytes += len(part["image_url"]["url"])
+                image_count += 1
+    return request_bytes, image_count
+
+
+@dataclass
+class LLMCallEvent:
+    call_site: str          # episodic, room, place, vision, readiness, answer, judge, ...
+    model: str
+    prompt_tokens: int
+    completion_tokens: int
+    latency_s: float        # Wall time of the call, including retries and cache lookup
+    request_bytes: int
+    image_count: int
+    cached: bool            # Served from the response cache, nothing was paid
+    cost_usd: float
+    question_id: Optional[str] = None
+    timestamp: float = field(default_factory=time.time)
+    error: Optional[str] = None  # Exception type of a failed call (after retries), None on success
+
+
+def empty_totals():
+    return {"calls": 0, "cached_calls": 0, "errors": 0, "prompt_tokens": 0, "completion_tokens": 0, "latency_s": 0.0,
+            "error_latency_s": 0.0, "request_bytes": 0, "image_count": 0, "cost_usd": 0.0}
+
+
+def add_event_to_totals(totals: dict, event: LLMCallEvent):
+    totals["calls"] += 1
+    totals["cached_calls"] += int(event.cached)
+    totals["errors"] += int(event.error is not None)
+    totals["prompt_tokens"] += event.prompt_tokens
+    totals["completion_tokens"] += event.completion_tokens
+    totals["latency_s"] += event.latency_s
+    if event.error is not None:
+        totals["error_latency_s"] += event.latency_s
+    totals["request_bytes"] += event.request_bytes
+    totals["image_count"] += event.image_count
+    totals["cost_usd"] += event.cost_usd
+
+
+class TelemetryAggregate(object):
+    # Rolling totals, overall and per call site (the raw events are only in the JSONL stream)
+    def __init__(self):
+        self.totals = empty_totals()
+        self.call_sites = {}
+
+    def add(self, event: LLMCallEvent):
+        add_event_to_totals(self.totals, event)
+        add_event_to_totals(self.call_sites.setdefault(event.call_site, empty_totals()), event)
+
+    def summary(self):
+        def rounded(totals):
+            totals = dict(totals)
+            totals["latency_s"] = round(totals["latency_s"], 3)
+            totals["error_latency_s"] = round(totals["error_latency_s"], 3)
+            totals["cost_usd"] = round(totals["cost_usd"], 6)
+            totals["error_rate"] = round(totals["errors"] / totals["calls"], 4) if totals["calls"] > 0 else 0.0
+            return totals
+
+        summary = rounded(self.totals)
+        summary["call_sites"] = {call_site: rounded(self.call_sites[call_site]) for call_site in sorted(self.call_sites)}
+        return summary
+
+
+class LLMTelemetry(object):
+    def __init__(self, events_path: Optional[str] = None):
+        self.run_aggregate = TelemetryAggregate()
+        self.question_aggregates = {}  # question id -> TelemetryAggregate
+        self.question_id = None
+        # Optional JSONL stream with one line per call, for offline analysis
+        self.events_path = events_path
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        return cls(events_path=os.environ.get("LLM_TELEMETRY_EVENTS_PATH") or None)
+
+    def set_question(self, question_id: Optional[str]):
+        self.question_id = question_id
+
+    def record(self, call_site: str, model: str, prompt_tokens: int, completion_tokens: int,
+               latency_s: float, messages: list, cached: bool = False, error: Optional[str] = None):
+        request_bytes, image_count = measure_messages(messages)
+        event = LLMCallEvent(
+            call_site=call_site,
+            model=model,
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            latency_s=latency_s,
+            request_bytes=request_bytes,
+            image_count=image_count,
+            cached=cached,
+            cost_usd=0.0 if cached else estimate_cost_usd(model, prompt_tokens, completion_tokens),
+            question_id=self.question_id,
+            error=error,
+        )
+        with self._lock:
+            self.run_aggregate.add(event)
+            self.question_aggregates.setdefault(event.question_id, TelemetryAggregate()).add(event)
+            if self.events_path is not None:
+                with open(self.events_path, "a") as f:
+                    f.write(json.dumps(asdict(event)) + "\n")
+        return event
+
+    def summarize(self, events: List[LLMCallEvent]):
+        # Summary of a list of events, e.g. read back from the JSONL stream
+        aggregate = TelemetryAggregate()
+        for event in events:
+            aggregate.add(event)
+        return aggregate.summary()
+
+    def question_summary(self, question_id: Optional[str] = None):
+        if question_id is None:
+            question_id = self.question_id
+        with self._lock:
+            return self.question_aggregates.get(question_id, TelemetryAggregate()).summary()
+
+    def run_summary(self):
+        with self._lock:
+            return self.run_aggregate.summary()
+
+    def print_summary(self, summary: dict):
+        print(f"LLM calls: {summary['calls']} ({summary['cached_calls']} cached, {summary['errors']} failed), "
+              f"tokens: {summary['prompt_tokens']} prompt / {summary['completion_tokens']} completion, "
+              f"latency: {summary['latency_s']:.1f}s, cost: ${summary['cost_usd']:.4f}")
+        for call_site, site_summary in summary["call_sites"].items():
+            print(f"  {call_site}: {site_summary['calls']} calls ({site_summary['errors']} failed), {site_summary['latency_s']:.1f}s, "
+                  f"{site_summary['prompt_tokens']} prompt tokens, {site_summary['image_count']} images, "
+                  f"${site_summary['cost_usd']:.4f}")
+
+
+_shared_telemetry = None
+_shared_telemetry_lock = threading.Lock()
+
+
+def get_shared_telemetry():
+    global _shared_telemetry
+    with _shared_telemetry_lock:
+        if _shared_telemetry is None:
+            _shared_telemetry = LLMTelemetry.from_env()
+        return _shared_telemetry
@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+
+"""Local deterministic stand-in for the OpenAI chat completions API.
+
+Returns schema-valid JSON for every prompt family used by the mind palace pipeline so the
+exploration loop can run offline (CI, air-gapped machines) and its pure-Python overhead can be
+measured. Point the pipeline at it with OPENAI_BASE_URL=http://127.0.0.1:<port>/v1.
+"""
+
+import argparse
+import ast
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class LocalLLMResponder(object):
+    def __init__(self, found_probability=0.3, ready_probability=0.3,
+                 latency_ms=0.0, latency_jitter_ms=0.0, latency_per_image_ms=0.0,
+                 failure_rate=0.0, failure_status_codes=(429, 500, 503), seed=0):
+        self.found_probability = found_probability
+        self.ready_probability = ready_probability
+
+        self.latency_ms = latency_ms
+        self.latency_jitter_ms = latency_jitter_ms
+        self.latency_per_image_ms = latency_per_image_ms
+
+        self.failure_rate = failure_rate
+        self.failure_status_codes = list(failure_status_codes)
+        # Failures are drawn from a shared stream (not the prompt hash) so that retries can succeed
+        self._failure_rng = random.Random(seed)
+        self._failure_lock = threading.Lock()
+
+        self.stats_requests = 0
+        self.stats_failures = 0
+
+    def split_messages(self, messages: list):
+        # Returns (prompt text, number of images, digest of the images)
+        texts = []
+        num_images = 0
+        image_digest = hashlib.sha256()
+        for message in messages:
+            content = message["content"]
+            if isinstance(content, str):
+                texts.append(content)
+                continue
+            for part in content:
+                if part.get("type") == "text":
+                    texts.append(part["text"])
+                elif part.get("type") == "image_url":
+                    num_images += 1
+                    image_digest.update(str(part.get("image_url")).encode("utf-8"))
+        return "\n".join(texts), num_images, image_digest.hexdigest() if num_images > 0 else ""
+
+    def prompt_rng(self, request: dict, prompt: str):
+        # Same request -> same answer, like the real API with a pinned seed
+        digest = hashlib.sha256((str(request.get("seed")) + prompt).encode("utf-8")).hexdigest()
+        return random.Random(int(digest[:16], 16))
+
+    def draw_failure(self):
+        with self._failure_lock:
+            self.stats_requests += 1
+            if self.failure_rate > 0 and self._failure_rng.random() < self.failure_rate:
+                self.stats_failures += 1
+                return self._failure_rng.choice(self.failure_status_codes)
+            return None
+
+    def simulated_latency(self, rng: random.Random, num_images: int):
+        latency_ms = self.latency_ms + num_images * self.latency_per_image_ms
+        if self.latency_jitter_ms > 0:
+            latency_ms += rng.uniform(0, self.latency_jitter_ms)
+        return latency_ms / 1000.0
+
+    def answer(self, prompt: str, rng: random.Random, num_images: int = 0):
+        if "\"number_of_rooms\"" in prompt:
+            return {"probability": round(rng.random(), 2), "number_of_rooms": rng.randint(1, 5),
+                    "reasoning": "Local stand-in reward estimate"}
+        if "\"room_id\"" in prompt:
+            return self.answer_room_selection(prompt, rng)
+        if "place_number" in prompt:
+            return self.answer_place_retrieval(prompt, rng)
+        if "\"verdicts\"" in prompt:
+            # One verdict per image
+            found = [rng.random() < self.found_probability for _ in range(max(1, num_images))]
+            return {"verdicts": ["True" if b_found else "False" for b_found in found],
+                    "confidence": [round(rng.uniform(0.5, 1.0), 2) for _ in found],
+                    "reasoning": "Local stand-in model sees the object in images " + str([i + 1 for i, b_found in enumerate(found) if b_found])}
+        if "'True' or 'False'" in prompt:
+            found = rng.random() < self.found_probability
+            answer = {"answer": "True" if found else "False",
+                      "reasoning": "Local stand-in model " + ("sees" if found else "does not see") + " the object"}
+            if "\"confidence\"" in prompt:
+                answer["confidence"] = round(rng.uniform(0.5, 1.0), 2)
+            return answer
+        if "ready_to_answer" in prompt:
+            ready = rng.random() < self.ready_probability
+            return {"ready_to_answer": "yes" if ready else "no",
+                    "answer_or_explanation": "Local stand-in answer" if ready else "Need to look for the target object"}
+        if "search_strategy" in prompt:
+            time_instances = self.parse_time_instances(prompt)
+            num_past = min(3, max(0, len(time_instances) - 1))
+            selected = [time_instances[0]] + rng.sample(time_instances[1:], num_past) if time_instances else []
+            return {"reasoning_on_search_strategy": "Local stand-in strategy",
+                    "search_strategy": rng.choice(["PAST_ONLY", "PRESENT_ONLY", "PAST_THEN_PRESENT"]),
+                    "time": selected,
+                    "reasoning": "Local stand-in episode selection"}
+        if "\"time\"" in prompt:
+            time_instances = self.parse_time_instances(prompt)
+            return {"time": time_instances[:1], "reasoning": "Local stand-in episode selection"}
+        if "\"object\"" in prompt:
+            question = re.search(r"Question: (.*)", prompt)
+            words = re.findall(r"[a-z]+", question.group(1).lower()) if question else ["object"]
+            return {"reasoning": "Local stand-in object identification", "object": " ".join(words[-3:])}
+        if "\"score\"" in prompt:
+            return {"score": rng.randint(1, 5), "reasoning": "Local stand-in evaluation"}
+        return {"answer": "Local stand-in answer", "reasoning": "Local stand-in reasoning"}
+
+    def answer_room_selection(self, prompt: str, rng: random.Random):
+        room_matches = re.findall(r"Room Node (\S+)\nRoom Name: ([^\n]*)", prompt)
+        rooms = list(dict.fromkeys(room_matches))
+        rng.shuffle(rooms)
+        rooms = rooms[:10]
+        probabilities = sorted((round(rng.uniform(0.0, 0.99), 2) for _ in rooms), reverse=True)
+        return {"reasoning": "Local stand-in room ranking",
+                "rooms": [room_name for _, room_name in rooms],
+                "room_id": [room_id for room_id, _ in rooms],
+                "probability": probabilities}
+
+    def answer_place_retrieval(self, prompt: str, rng: random.Random):
+        place_ids = list(dict.fromkeys(int(place_id) for place_id in re.findall(r"Place Node (\d+)", prompt)))
+        return {"reasoning": "Local stand-in place selection",
+                "place_number": sorted(rng.sample(place_ids, min(5, len(place_ids))))}
+
+    def parse_time_instances(self, prompt: str):
+        match = re.search(r"Available time instances: (\[.*?\])", prompt)
+        if match is None:
+            return []
+        try:
+            return list(ast.literal_eval(match.group(1)))
+        except (ValueError, SyntaxError):
+            return []
+
+    def complete(self, request: dict):
+        prompt, num_images, image_digest = self.split_messages(request.get("messages", []))
+        # Different images, different vision answers
+        rng = self.prompt_rng(request, prompt + image_digest)
+
+        time.sleep(self.simulated_latency(rng, num_images))
+        status_code = self.draw_failure()
+        if status_code is not None:
+            return status_code, {"error": {"message": "Injected failure", "type": "local_llm_server", "code": status_code}}
+
+        content = json.dumps(self.answer(prompt, rng, num_images))
+        prompt_tokens = len(prompt) // 4 + num_images * 765
+        completion_tokens = len(content) // 4
+        return 200, {
+            "id": "chatcmpl-local-" + hashlib.sha1(prompt.encode("utf-8")).hexdigest()[:12],
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "local"),
+            "system_fingerprint": "local",
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": content}}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                      "total_tokens": prompt_tokens + completion_tokens},
+        }
+
+
+class LocalLLMRequestHandler(BaseHTTPRequestHandler):
+    responder: LocalLLMResponder = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status_code: int, body: dict):
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status_code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        if status_code == 429:
+            self.send_header("Retry-After", "0")
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/health"):
+            self.send_json(200, {"status": "ok", "requests": self.responder.stats_requests,
+                                 "failures": self.responder.stats_failures})
+        else:
+            self.send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self.send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+            return
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            request = json.loads(self.rfile.read(length))
+        except ValueError:
+            self.send_json(400, {"error": {"message": "Request body is not valid JSON"}})
+            return
+        status_code, body = self.responder.complete(request)
+        self.send_json(status_code, body)
+
+
+def make_local_llm_server(host="127.0.0.1", port=8765, **responder_kwargs):
+    handler = type("BoundLocalLLMRequestHandler", (LocalLLMRequestHandler,),
+                   {"responder": LocalLLMResponder(**responder_kwargs)})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def start_local_llm_server(host="127.0.0.1", port=0, **responder_kwargs):
+    # Runs the server on a daemon thread; returns (server, base_url). Use port=0 for any free port.
+    server = make_local_llm_server(host, port, **responder_kwargs)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    base_url = f"http://{server.server_address[0]}:{server.server_address[1]}/v1"
+    print(f"Local LLM server listening on {base_url}")
+    return server, base_url
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local deterministic stand-in for the OpenAI chat completions API.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--found-probability", type=float, default=0.3, help="Chance the vision check answers True")
+    parser.add_argument("--ready-probability", type=float, default=0.3, help="Chance the readiness check answers yes")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Base latency per request")
+    parser.add_argument("--latency-jitter-ms", type=float, default=0.0, help="Extra uniform random latency")
+    parser.add_argument("--latency-per-image-ms", type=float, default=0.0, help="Extra latency per input image")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Fraction of requests answered with an error")
+    parser.add_argument("--failure-status-codes", type=int, nargs="+", default=[429, 500, 503])
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    server = make_local_llm_server(
+        args.host, args.port,
+        found_probability=args.found_probability,
+        ready_probability=args.ready_probability,
+        latency_ms=args.latency_ms,
+        latency_jitter_ms=args.latency_jitter_ms,
+        latency_per_image_ms=args.latency_per_image_ms,
+        failure_rate=args.failure_rate,
+        failure_status_codes=args.failure_status_codes,
+        seed=args.seed,
+    )
+    print(f"Local LLM server listening on http://{args.host}:{args.port}/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -4,6 +4,32 @@
 from contextual_long_term_reasoning.openai_interface import OpenAIInterface
 from contextual_long_term_reasoning.belief_manager import BeliefManager
 from contextual_long_term_reasoning.mind_palace_generation import SceneGraph
+from contextual_long_term_reasoning.prompt_budget import PromptBudget
+from contextual_long_term_reasoning.room_planner import ExpectedCostRoomPlanner
+from contextual_long_term_reasoning.response_cache import ResponseCacheMiss
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import hashlib
+import random
+import threading
+import numpy as np
+import openai
+
+# Outcome of searching one room of an episode. The caller records it in the belief.
+RoomExplorationResult = namedtuple("RoomExplorationResult", ["room_id", "b_found", "text_image_insight", "observed_images",
+                                                             "image_paths", "p_goal_poses", "robot_place", "b_cancelled"])
+
+
+def latest_observed_scene_graph(mind_palace: dict, T_episode_to_explore: str):
+    # The present has no observations yet, so object lookups for it use the latest past episode
+    if 'now' not in T_episode_to_explore:
+        return mind_palace[T_episode_to_explore]
+    for scene_time in list(mind_palace.keys()):
+        if 'now' not in scene_time:
+            print("RoomExploration: We are using the scene graph from the latest time instance: ", scene_time)
+            return mind_palace[scene_time]
+    return mind_palace[T_episode_to_explore]
+
 
 class MindPalaceExploration(object):
     def __init__(self, b_use_cp_mdp_planner=False):
@@ -13,7 +39,367 @@ class MindPalaceExploration(object):
 
         self.oa_interface = OpenAIInterface()
 
-    def vlm_image_analysis(self, observation_image_paths, belief_manager: BeliefManager):
+        # Params
+        self.param_max_room_exploration_iter = 5
+        self.param_max_num_place_node_exploration = 10
+        self.param_max_images_retrieved = 100
+        # Past episodes only (no robot motion): search the top-k ranked rooms concurrently and cancel the
+        # others once one of them finds the object
+        self.b_speculative_room_exploration = False
+        self.param_speculative_top_k = 3
+        self.b_show_observations = False  # Plot and save the explored images on the observation sink
+        # Vision check of the explored images: "set" asks one True/False for all of them, "concurrent" one request
+        # per image with early exit at the first confident hit, "batch" one request with a verdict per image.
+        # The per-image modes only record the positive images in the belief.
+        self.param_vision_screening = "set"
+        self.param_vision_confidence_threshold = 0.7
+        self.param_vision_screening_workers = 4
+        # Consecutive past episodes of a plan are explored concurrently, each on a fork of the belief
+        self.b_parallel_past_episodes = False
+        self.param_max_parallel_episodes = 4
+
+        # Stats of the question
+        self.stats_total_images_retrieved = 0
+        self.stats_total_distance = 0
+        self.stats_cancelled_rooms = 0
+        self._stats_lock = threading.Lock()
+
+    def explore_episode(self, belief_manager: BeliefManager, world_model, T_episode_to_explore: str, robot_place: int):
+        # Room by room search of one episode. Returns (object found, robot place).
+        belief_manager.reset_room_and_place_exploration_memory()
+        if self.b_speculative_room_exploration and 'now' not in T_episode_to_explore:
+            return self.explore_episode_speculative(belief_manager, world_model, T_episode_to_explore, robot_place)
+
+        room_exploration_iter = 1
+        while room_exploration_iter <= self.param_max_room_exploration_iter:
+            print(f"\n## Episode: {T_episode_to_explore}, Room Exploration Iteration: {room_exploration_iter}/{self.param_max_room_exploration_iter}\n")
+            # 	2.a.2 level_2_room_selection -> rX # Can be multiple times # max room exploration iter
+            # 	2.a.3 level_1_pose_selection -> pX # Only 1 time
+            r_room_to_explore, b_single_now_explore_plan = self.room_exploration.plan(belief_manager, T_episode_to_explore, robot_place)
+
+            result = self.explore_room(belief_manager, world_model, T_episode_to_explore, r_room_to_explore, robot_place)
+            robot_place = result.robot_place
+            if result.b_found:
+                # 2.c.3 Add image and insight to the belief/memory.
+                self.record_found(belief_manager, T_episode_to_explore, result)
+                return True, robot_place
+
+            belief_manager.update_room_exploration_memory(result.text_image_insight, T_episode_to_explore, r_room_to_explore)
+            room_exploration_iter += 1
+
+            if self.stats_total_images_retrieved >= self.param_max_images_retrieved:
+                print("Max number of images retrieved reached. We will stop the exploration.")
+                break
+        return False, robot_place
+
+    def explore_episodes(self, belief_manager: BeliefManager, world_model, list_T_episode_to_explore: list, robot_place: int):
+        # Explores the episodes in plan order. Returns ([(episode, object found)], robot place).
+        results = []
+        i = 0
+        while i < len(list_T_episode_to_explore):
+            if self.stats_total_images_retrieved >= self.param_max_images_retrieved:
+                print("Max number of images retrieved reached. We will stop the exploration.")
+                break
+            # Past episodes have no physical cost and do not depend on each other: fan out the consecutive ones
+            j = i
+            while self.b_parallel_past_episodes and j < len(list_T_episode_to_explore) and 'now' not in list_T_episode_to_explore[j]:
+                j += 1
+            if j - i > 1:
+                results.extend(self.explore_past_episodes(belief_manager, world_model, list_T_episode_to_explore[i:j], robot_place))
+                i = j
+                continue
+
+            T_episode_to_explore = list_T_episode_to_explore[i]
+            i += 1
+            print(f"\n### Episode to explore: {T_episode_to_explore}\n")
+            bool_y_object_found, robot_place = self.explore_episode(belief_manager, world_model, T_episode_to_explore, robot_place)
+            results.append((T_episode_to_explore, bool_y_object_found))
+        return results, robot_place
+
+    def explore_past_episodes(self, belief_manager: BeliefManager, world_model, list_T_episode_to_explore: list, robot_place: int):
+        # Each episode on its own fork of the belief, merged back oldest first. Returns [(episode, object found)].
+        list_T_episode_to_explore = list(dict.fromkeys(list_T_episode_to_explore))
+        print(f"\n### Episodes to explore concurrently: {list_T_episode_to_explore}\n")
+
+        def explore(T_episode_to_explore):
+            fork = belief_manager.fork()
+            bool_y_object_found, _ = self.explore_episode(fork, world_model, T_episode_to_explore, robot_place)
+            return fork, bool_y_object_found
+
+        with ThreadPoolExecutor(max_workers=max(1, min(self.param_max_parallel_episodes, len(list_T_episode_to_explore)))) as executor:
+            outcomes = dict(zip(list_T_episode_to_explore, executor.map(explore, list_T_episode_to_explore)))
+
+        # The mind palace lists the episodes newest first
+        list_of_scene_time = list(belief_manager.M_mind_palace.keys())
+        for T_episode_to_explore in sorted(outcomes, key=lambda episode: -list_of_scene_time.index(episode)
+                                           if episode in list_of_scene_time else 0):
+            belief_manager.merge(outcomes[T_episode_to_explore][0])
+        return [(T_episode_to_explore, outcomes[T_episode_to_explore][1]) for T_episode_to_explore in list_T_episode_to_explore]
+
+    def explore_episode_speculative(self, belief_manager: BeliefManager, world_model, T_episode_to_explore: str, robot_place: int):
+        explored_room_ids = []
+        while len(explored_room_ids) < self.param_max_room_exploration_iter:
+            num_explored_rooms = len(explored_room_ids)
+            room_list = self.room_exploration.rank_rooms(belief_manager, T_episode_to_explore, robot_place, explored_room_ids)
+            room_list = room_list[:min(self.param_speculative_top_k, self.param_max_room_exploration_iter - num_explored_rooms)]
+            if len(room_list) == 0:
+                print("MindPalaceExploration: No room left to explore in ", T_episode_to_explore)
+                break
+            print(f"\n## Episode: {T_episode_to_explore}, Speculative Room Exploration of {room_list} ({num_explored_rooms}/{self.param_max_room_exploration_iter} rooms explored)\n")
+
+            cancel_event = threading.Event()
+            results = {}
+            found_result = None
+            # Each room searches on its own place history, merged back below
+            room_beliefs = {room_id: belief_manager.fork_place_memory() for room_id in room_list}
+            executor = ThreadPoolExecutor(max_workers=len(room_list))
+            try:
+                futures = {executor.submit(self.explore_room, room_beliefs[room_id], world_model, T_episode_to_explore, room_id,
+                                           robot_place, cancel_event, True): room_id for room_id in room_list}
+                for future in as_completed(futures):
+                    result = future.result()
+                    results[result.room_id] = result
+                    if result.b_found:
+                        # First room to report the object wins. The others stop at their next check of the cancel
+                        # event; nobody waits for them and their place histories are dropped.
+                        found_result = result
+                        cancel_event.set()
+                        break
+            finally:
+                executor.shutdown(wait=found_result is None, cancel_futures=True)
+
+            if found_result is not None:
+                with self._stats_lock:
+                    self.stats_cancelled_rooms += len(room_list) - len(results)
+                belief_manager.merge_place_memory(room_beliefs[found_result.room_id])
+                self.record_found(belief_manager, T_episode_to_explore, found_result)
+                return True, robot_place
+
+            for room_id in room_list:
+                belief_manager.merge_place_memory(room_beliefs[room_id])
+
+            # Rooms searched to the end without finding the object, in rank order
+            for room_id in room_list:
+                result = results.get(room_id)
+                if result is not None and not result.b_cancelled:
+                    belief_manager.update_room_exploration_memory(result.text_image_insight, T_episode_to_explore, room_id)
+            explored_room_ids.extend(room_list)
+
+            if self.stats_total_images_retrieved >= self.param_max_images_retrieved:
+                print("Max number of images retrieved reached. We will stop the exploration.")
+                break
+        return False, robot_place
+
+    def explore_room(self, belief_manager: BeliefManager, world_model, T_episode_to_explore: str, r_room_to_explore: str,
+                     robot_place: int, cancel_event=None, b_count_room_places=False):
+        # Place by place search of one room until the object is found or the place budget is used.
+        # b_count_room_places counts the budget on the places of this room only (rooms searched concurrently).
+        text_image_insight = ""
+        num_explored_places = 0
+        room_places = []
+
+        def cancelled():
+            return cancel_event is not None and cancel_event.is_set()
+
+        while num_explored_places < self.param_max_num_place_node_exploration:
+            print(f"\n# Episode: {T_episode_to_explore}, Room: {r_room_to_explore}, Place Exploration Iteration: {num_explored_places}/{self.param_max_num_place_node_exploration}\n")
+            if cancelled():
+                break
+            p_goal_poses = self.place_exploration.plan(belief_manager, T_episode_to_explore, r_room_to_explore) # Can be multiple poses, consider doing it one by one for exploration
+
+            if len(p_goal_poses) == 0:
+                print("No other place to explore from LLM answer. We will explore other room.")
+                break
+
+            if "now" not in T_episode_to_explore:
+                # Reserve the images (at most one per place) before retrieving them, rooms searched concurrently
+                # share the budget
+                with self._stats_lock:
+                    p_goal_poses = p_goal_poses[:max(0, self.param_max_images_retrieved - self.stats_total_images_retrieved)]
+                    self.stats_total_images_retrieved += len(p_goal_poses)
+                if len(p_goal_poses) == 0:
+                    print("Max number of images retrieved reached. We will stop the exploration.")
+                    break
+
+            # 2.b (Exploration): Execute action “a” (explore(pX) or retrieve(TX, pX)),
+            # get an image from the pose pX. in world model
+            observed_images, image_paths = world_model.explore(T_episode_to_explore, p_goal_poses, show_images=self.b_show_observations)
+            with self._stats_lock:
+                if 'now' in T_episode_to_explore:
+                    robot_place, distance = world_model.move_robot(T_episode_to_explore, robot_place, p_goal_poses)
+                    self.stats_total_distance += distance
+                else:
+                    # Places without an image give their reservation back
+                    self.stats_total_images_retrieved -= len(p_goal_poses) - len(image_paths)
+
+            if len(image_paths) == 0:
+                print("No image retrieved. We will explore other room.")
+                break
+            if cancelled():
+                break
+
+            # 2.c (VLM Inference): Given the image. In belief manager
+            # 2.c.1 Query VLM: Do we see the target object y?
+            # 2.c.2 Query VLM: If yes, also ask VLM to describe the image in relation to answering the question and
+            bool_y_object_found, text_image_insight, positive_indices = self.screen_images(image_paths, belief_manager, cancel_event)
+            if cancelled():
+                break
+            if bool_y_object_found:
+                positive_image_paths = [image_paths[i] for i in positive_indices]
+                positive_poses = self.places_of_images(belief_manager, T_episode_to_explore, p_goal_poses, positive_image_paths)
+                return RoomExplorationResult(r_room_to_explore, True, text_image_insight,
+                                             [observed_images[i] for i in positive_indices], positive_image_paths,
+                                             positive_poses, robot_place, False)
+
+            belief_manager.update_place_exploration_memory(p_goal_poses)
+            room_places.extend(p_goal_poses)
+            if b_count_room_places:
+                num_explored_places = len(room_places)
+            else:
+                num_explored_places = len(belief_manager.H_a_place_exploration_action_history)
+
+        return RoomExplorationResult(r_room_to_explore, False, text_image_insight, [], [], [], robot_place, cancelled())
+
+    def record_found(self, belief_manager: BeliefManager, T_episode_to_explore: str, result: RoomExplorationResult):
+        belief_manager.update_history(result.text_image_insight,
+                                      result.observed_images, result.image_paths,
+                                      T_episode_to_explore,
+                                      result.room_id,
+                                      result.p_goal_poses) # todo add more room, location, time
+
+    def places_of_images(self, belief_manager: BeliefManager, T_episode_to_explore: str, p_goal_poses: list, image_paths: list):
+        # The goal poses whose image is among image_paths
+        scene_graph = belief_manager.M_mind_palace[T_episode_to_explore]
+        image_paths = set(image_paths)
+        places = [place for place in p_goal_poses if place in scene_graph.place_nodes and scene_graph.place_nodes[place].image_path in image_paths]
+        return places or p_goal_poses
+
+    def screen_images(self, observation_image_paths, belief_manager: BeliefManager, cancel_event=None):
+        # Returns (object found, reasoning, indices of the images with the object)
+        if self.param_vision_screening == "set" or len(observation_image_paths) <= 1:
+            return self.vlm_image_analysis(observation_image_paths, belief_manager, cancel_event)
+        if self.param_vision_screening == "batch":
+            return self.vlm_image_verdicts(observation_image_paths, belief_manager, cancel_event)
+        if self.param_vision_screening == "concurrent":
+            return self.vlm_image_screening(observation_image_paths, belief_manager, cancel_event)
+        raise ValueError(f"Unknown vision screening mode: {self.param_vision_screening}. Expected 'set', 'concurrent' or 'batch'")
+
+    def build_vision_prompt(self, belief_manager: BeliefManager, b_single_image: bool):
+        question = belief_manager.Q_user_question
+        y_object_to_search = belief_manager.y_object_to_search
+        if b_single_image:
+            return (
+                "You are an AI agent in an environment and your task is to answer questions from the user by exploring the environment or recalling past relevant information.\n\n"
+                "You will be shown one image collected by the robot.\n\n"
+                "Given a user question, you must output 'True' or 'False' if you see " + str(y_object_to_search) + " in the image, and how confident you are.\n\n"
+                "This image and the object to search are potentially relevant to the user question: " + question + "\n\n"
+                "Answer in the json form of:\n\n"
+                "{"
+                " \"answer\": \"True\" or \"False\","
+                " \"confidence\": number between 0 and 1,"
+                " \"reasoning\": \"Explain why you think you find or not find the object.\""
+                " }"
+                "Important! Do not use ' and \" in the reasoning field at all because it will cause an error in the JSON parsing. and don't use the ```json!"
+            )
+        return (
+            "You are an AI agent in an environment and your task is to answer questions from the user by exploring the environment or recalling past relevant information.\n\n"
+            "You will be shown a set of images that have been collected from a single location, in order: image 1, image 2, ...\n\n"
+            "Given a user question, you must output for every image 'True' or 'False' if you see " + str(y_object_to_search) + " in that image, and how confident you are.\n\n"
+            "These images and the object to search are potentially relevant to the user question: " + question + "\n\n"
+            "Answer in the json form of:\n\n"
+            "{"
+            " \"verdicts\": [\"True\" or \"False\" for image 1, ...],"
+            " \"confidence\": [number between 0 and 1 for image 1, ...],"
+            " \"reasoning\": \"Explain in which images you find or not find the object.\""
+            " }"
+            "Important! Do not use ' and \" in the reasoning field at all because it will cause an error in the JSON parsing. and don't use the ```json!"
+        )
+
+    def parse_verdict(self, verdict):
+        return str(verdict).strip().lower().startswith("t")
+
+    def parse_confidence(self, confidence):
+        try:
+            return min(1.0, max(0.0, float(confidence)))
+        except (TypeError, ValueError):
+            return 0.0
+
+    def vlm_image_screening(self, observation_image_paths, belief_manager: BeliefManager, cancel_event=None):
+        # One request per image, in place order on a small pool. Stops at the first confident hit.
+        prompt = self.build_vision_prompt(belief_manager, b_single_image=True)
+        stop_event = threading.Event()
+
+        def screen(image_path):
+            if stop_event.is_set() or (cancel_event is not None and cancel_event.is_set()):
+                return None
+            messages, image_failures = self.oa_interface.prepare_openai_vision_messages(
+                pre_image_prompt=prompt, post_image_prompt=belief_manager.Q_user_question, image_paths=[image_path],
+                return_image_failures=True)
+            if len(image_failures) > 0:
+                # A text-only request would still get a verdict, skip the image instead
+                return None
+            output = self.oa_interface.call_openai_api(messages=messages, call_site="vision_screening")
+            json_object = self.oa_interface.answer_to_json(output)
+            return (self.parse_verdict(json_object['answer']), self.parse_confidence(json_object.get('confidence', 1.0)),
+                    json_object.get('reasoning', ""))
+
+        verdicts = {}
+        with ThreadPoolExecutor(max_workers=max(1, min(self.param_vision_screening_workers, len(observation_image_paths)))) as executor:
+            futures = {executor.submit(screen, image_path): i for i, image_path in enumerate(observation_image_paths)}
+            for future in as_completed(futures):
+                verdict = None if future.cancelled() else future.result()
+                if verdict is None:
+                    continue
+                verdicts[futures[future]] = verdict
+                b_found, confidence, _ = verdict
+                if b_found and confidence >= self.param_vision_confidence_threshold:
+                    stop_event.set()
+                    for other_future in futures:
+                        other_future.cancel()
+
+        positive_indices = sorted(i for i, (b_found, _, _) in verdicts.items() if b_found)
+        print("MindPalaceExploration: VLM Image Screening: ", len(verdicts), "/", len(observation_image_paths),
+              " images checked, positive images: ", positive_indices)
+        if len(positive_indices) == 0:
+            reasoning = " ".join(verdicts[i][2] for i in sorted(verdicts))
+            return False, reasoning, []
+        reasoning = " ".join(verdicts[i][2] for i in positive_indices)
+        print("MindPalaceExploration: VLM Image Screening Reasoning: ", reasoning)
+        return True, reasoning, positive_indices
+
+    def vlm_image_verdicts(self, observation_image_paths, belief_manager: BeliefManager, cancel_event=None):
+        # One request for all images, with a verdict per image
+        prompt = self.build_vision_prompt(belief_manager, b_single_image=False)
+        messages, image_failures = self.oa_interface.prepare_openai_vision_messages(
+            pre_image_prompt=prompt, post_image_prompt=belief_manager.Q_user_question, image_paths=observation_image_paths,
+            return_image_failures=True)
+        # Verdict i is about the i-th image that made it into the message
+        failed_paths = {path for path, _ in image_failures}
+        sent_indices = [i for i, path in enumerate(observation_image_paths) if path not in failed_paths]
+        if len(sent_indices) == 0:
+            print("MindPalaceExploration: VLM Image Verdicts skipped, no image could be used: ", image_failures)
+            return False, "None of the images could be loaded.", []
+        if cancel_event is not None and cancel_event.is_set():
+            return False, "", []
+        output = self.oa_interface.call_openai_api(messages=messages, call_site="vision")
+        json_object = self.oa_interface.answer_to_json(output)
+        verdicts = list(json_object['verdicts'])
+        confidences = list(json_object.get('confidence', [1.0] * len(verdicts)))
+        reasoning = json_object.get('reasoning', "")
+
+        positive_verdicts = [j for j, verdict in enumerate(verdicts[:len(sent_indices)]) if self.parse_verdict(verdict)]
+        # Keep the confident positives when there are any
+        confident_verdicts = [j for j in positive_verdicts
+                              if j < len(confidences) and self.parse_confidence(confidences[j]) >= self.param_vision_confidence_threshold]
+        if len(confident_verdicts) > 0:
+            positive_verdicts = confident_verdicts
+        positive_indices = [sent_indices[j] for j in positive_verdicts]
+        print("MindPalaceExploration: VLM Image Verdicts: ", verdicts, " positive images: ", positive_indices)
+        print("MindPalaceExploration: VLM Image Verdicts Reasoning: ", reasoning)
+        return len(positive_indices) > 0, reasoning, positive_indices
+
+    def vlm_image_analysis(self, observation_image_paths, belief_manager: BeliefManager, cancel_event=None):
+        # One True/False for all images. Returns (object found, reasoning, indices of the images that were sent if found)
         question = belief_manager.Q_user_question
         y_object_to_search = belief_manager.y_object_to_search
 
@@ -31,10 +417,20 @@ class MindPalaceExploration(object):
         )
     
         try:
-            messages = self.oa_interface.prepare_openai_vision_messages(pre_image_prompt=prompt, 
+            messages, image_failures = self.oa_interface.prepare_openai_vision_messages(pre_image_prompt=prompt, 
                                                            post_image_prompt=question, 
-                                                           image_paths=observation_image_paths)
-            output = self.oa_interface.call_openai_api(messages=messages)
+                                                           image_paths=observation_image_paths,
+                                                           return_image_failures=True)
+            failed_paths = {path for path, _ in image_failures}
+            sent_indices = [i for i, path in enumerate(observation_image_paths) if path not in failed_paths]
+            if len(sent_indices) == 0:
+                # Without any image the model can only guess
+                print("MindPalaceExploration: VLM Image Analysis skipped, no image could be used: ", image_failures)
+                return False, "None of the images could be loaded.", []
+            if cancel_event is not None and cancel_event.is_set():
+                # Another room of a speculative search already found the object
+                return False, "", []
+            output = self.oa_interface.call_openai_api(messages=messages, call_site="vision")
             # print("MindPalaceExploration vlm_image_analysis Output: \n\n", output, "\n")
 
             json_object = self.oa_interface.answer_to_json(output)
@@ -46,12 +442,12 @@ class MindPalaceExploration(object):
             print("MindPalaceExploration: VLM Image Analysis Reasoning: ", reasoning)
 
             if "True" in answer or "T" in answer or "t" in answer:
-                return True, reasoning
+                return True, reasoning, sent_indices
             elif "False" in answer or "F" in answer or "f" in answer:
-                return False, reasoning
+                return False, reasoning, []
             else:
                 print("Error: Invalid answer from the model.")
-                return False, reasoning
+                return False, reasoning, []
         except Exception as e:
             raise e
 
@@ -59,6 +455,24 @@ class MindPalaceExploration(object):
 class EpisodicExploration(object):
     def __init__(self):
         self.oa_interface = OpenAIInterface()
+        self.b_object_index_hint = False  # Add where the object was recorded (belief_manager.object_index) to the prompt
+        self.b_change_index_hint = False  # Add when the object appeared, disappeared or moved (belief_manager.change_index)
+
+    def object_index_hint(self, belief_manager: BeliefManager):
+        if not self.b_object_index_hint or belief_manager.object_index is None:
+            return ""
+        return (
+            "From the object index of the robot memory, the object y was recorded in these time instances (number of places and rooms, the recorded tags can be incomplete): \n" +
+            belief_manager.object_index.describe(belief_manager.y_object_to_search, belief_manager.M_mind_palace) + "\n"
+        )
+
+    def change_index_hint(self, belief_manager: BeliefManager):
+        if not self.b_change_index_hint or belief_manager.change_index is None:
+            return ""
+        return (
+            "Between consecutive time instances, the robot memory recorded these changes of the object y (time instances without a change look the same for this object): \n" +
+            belief_manager.change_index.describe(belief_manager.y_object_to_search, belief_manager.M_mind_palace) + "\n"
+        )
 
     def episodic_reasoning(self, belief_manager: BeliefManager):
         Q_user_question = belief_manager.Q_user_question
@@ -98,7 +512,9 @@ class EpisodicExploration(object):
             "If the user question explicit or implicitly ask about the present state of the environment, exploring the present environment to validate past information is still needed in addition to recalling past memory\n"
             "So the order of preference is PAST_ONLY, then PAST_THEN_PRESENT, then PRESENT_ONLY, and PRESENT_THEN_PAST\n"
             "If you choose PAST_THEN_PRESENT, only pick at most 3 past time instances to explore.\n"
-            "So first we want to choose the search strategy and based on the strategy we want to come up and the list of sequence of the time instances that we want to explore that is relevant to the question and object search.\n"
+            "So first we want to choose the search strategy and based on the strategy we want to come up and the list of sequence of the time instances that we want to explore that is relevant to the question and object search.\n" +
+            self.object_index_hint(belief_manager) +
+            self.change_index_hint(belief_manager) +
             "For context of what the agent had explored, here is the summary of the agent's exploration and observation so far: \n" + 
             exploration_summary + "\n"
             "Please answer using the json form of:\n\n"
@@ -114,7 +530,7 @@ class EpisodicExploration(object):
 
         try:
             messages = self.oa_interface.prepare_openai_messages(prompt_episode_search)
-            output = self.oa_interface.call_openai_api(messages=messages,)
+            output = self.oa_interface.call_openai_api(messages=messages, call_site="episodic")
 
             json_object = self.oa_interface.answer_to_json(output)
             # print("EpisodicExploration Output: \n", json_object, "\n")
@@ -172,7 +588,9 @@ class EpisodicExploration(object):
             "If the user question explicit or implicitly ask about the present state of the environment, exploring the present environment to validate past information is still needed in addition to recalling past memory\n"
             "So the order of preference is PAST_ONLY, then PAST_THEN_PRESENT, then PRESENT_ONLY, and MULTI_PAST_AND_PRESENT\n"
             "If you choose PAST_THEN_PRESENT or MULTI_PAST_AND_PRESENT, only pick at most 3 past time instances to explore.\n"
-            "So first we want to choose the search strategy and based on the strategy we want to come up and the list of sequence of the time instances that we want to explore that is relevant to the question and object search.\n"
+            "So first we want to choose the search strategy and based on the strategy we want to come up and the list of sequence of the time instances that we want to explore that is relevant to the question and object search.\n" +
+            self.object_index_hint(belief_manager) +
+            self.change_index_hint(belief_manager) +
             "For context of what the agent had explored, here is the summary of the agent's exploration and observation so far: \n" + 
             exploration_summary + "\n"
             "Please answer using the json form of:\n\n"
@@ -188,7 +606,7 @@ class EpisodicExploration(object):
 
         try:
             messages = self.oa_interface.prepare_openai_messages(prompt_episode_search)
-            output = self.oa_interface.call_openai_api(messages=messages,)
+            output = self.oa_interface.call_openai_api(messages=messages, call_site="episodic")
 
             json_object = self.oa_interface.answer_to_json(output)
             # print("EpisodicExploration Output: \n", json_object, "\n")
@@ -240,7 +658,7 @@ class EpisodicExploration(object):
 
         try:
             messages = self.oa_interface.prepare_openai_messages(prompt_2_time_identification)
-            output = self.oa_interface.call_openai_api(messages=messages,)
+            output = self.oa_interface.call_openai_api(messages=messages, call_site="episodic")
             print("EpisodicExploration Output: \n\n", output, "\n")
 
             json_object = self.oa_interface.answer_to_json(output)
@@ -254,11 +672,18 @@ class EpisodicExploration(object):
 class RoomExploration(object):
     def __init__(self, b_use_cp_mdp_planner=False):
         self.oa_interface = OpenAIInterface()
+        self.prompt_budget = PromptBudget()  # Set to None to send the full room listing and summaries
         self.b_enable_mdp_cp_planner = b_use_cp_mdp_planner
         if b_use_cp_mdp_planner:
             self.param_cp_threshold = 0.25
         else:
             self.param_cp_threshold = 0.0
+        self.param_planner_depth = 3  # Rooms of lookahead of the expected search distance planner
+        self.room_planner = ExpectedCostRoomPlanner(self.param_planner_depth)
+        self.b_object_match_fast_path = False  # Skip the LLM room selection when the object was seen in the scene graph
+        self.param_object_match_threshold = 0.95  # Only exact object tags (1.0) skip the LLM
+        self.param_object_hint_threshold = 0.6  # Weaker matches (head noun 0.8, captions) are listed in the prompt
+        self.stats_object_match_hits = 0
 
     def plan(self, belief_manager: BeliefManager, T_episode_to_explore: str, robot_place: int):
         scene_graph = belief_manager.M_mind_palace[T_episode_to_explore]
@@ -277,19 +702,84 @@ class RoomExploration(object):
         S_exploration_summary = belief_manager.S_exploration_summary
         S_room_exploration_summary = belief_manager.S_room_exploration_summary
         H_a_room_exploration_action_history = belief_manager.H_a_room_exploration_action_history
-        r_room_to_explore, room_list, room_prob = self.value_based_room_selection(belief_manager.Q_user_question, belief_manager.y_object_to_search, T_episode_to_explore,
-                                                             scene_graph, robot_place, S_exploration_summary, S_room_exploration_summary, H_a_room_exploration_action_history)
+        room_confidences = self.object_match_room_confidences(belief_manager, T_episode_to_explore)
+        object_match = self.object_match_rooms(belief_manager, room_confidences)
+        if object_match is not None:
+            room_list, room_prob = object_match
+            r_room_to_explore = room_list[0]
+        else:
+            r_room_to_explore, room_list, room_prob = self.value_based_room_selection(belief_manager.Q_user_question, belief_manager.y_object_to_search, T_episode_to_explore,
+                                                                 scene_graph, robot_place, S_exploration_summary, S_room_exploration_summary, H_a_room_exploration_action_history,
+                                                                 object_match_hint=self.object_match_hint(scene_graph, room_confidences))
         
         b_single_now_explore_plan = False
         if 'now' in T_episode_to_explore:
             print("RoomExploration: We are planning to explore the present using MDP + CP planner.")
-            r_room_to_explore, b_single_now_explore_plan = self.mdp_cp_plan(room_list, room_prob, scene_graph, robot_place, H_a_room_exploration_action_history)
+            # The robot place may be a frame of another episode, plan from its position in this one
+            robot_place = scene_graph.resolve_place_id(robot_place, belief_manager.M_mind_palace)
+            r_room_to_explore, b_single_now_explore_plan = self.mdp_cp_plan(room_list, room_prob, scene_graph, robot_place,
+                                                                            H_a_room_exploration_action_history + belief_manager.H_r_explored_room_ids)
 
         else:
             print("RoomExploration Room to search: ", r_room_to_explore)
         
         return r_room_to_explore, b_single_now_explore_plan
     
+    def rank_rooms(self, belief_manager: BeliefManager, T_episode_to_explore: str, robot_place: int, exclude_room_ids=()):
+        # Unexplored rooms of the episode, most likely first
+        scene_graph = belief_manager.M_mind_palace[T_episode_to_explore]
+        H_a_room_exploration_action_history = belief_manager.H_a_room_exploration_action_history
+        room_confidences = self.object_match_room_confidences(belief_manager, T_episode_to_explore, exclude_room_ids)
+        object_match = self.object_match_rooms(belief_manager, room_confidences)
+        if object_match is not None:
+            room_list, room_prob = object_match
+        else:
+            _, room_list, room_prob = self.value_based_room_selection(belief_manager.Q_user_question, belief_manager.y_object_to_search, T_episode_to_explore,
+                                                                      scene_graph, robot_place, belief_manager.S_exploration_summary,
+                                                                      belief_manager.S_room_exploration_summary, H_a_room_exploration_action_history,
+                                                                      object_match_hint=self.object_match_hint(scene_graph, room_confidences))
+        ranked_rooms = sorted(zip(room_list, room_prob), key=lambda room: -float(room[1]))
+        return [room_id for room_id, _ in ranked_rooms
+                if room_id in scene_graph.room_nodes and room_id not in H_a_room_exploration_action_history
+                and room_id not in belief_manager.H_r_explored_room_ids and room_id not in exclude_room_ids]
+
+    def object_match_room_confidences(self, belief_manager: BeliefManager, T_episode_to_explore: str, exclude_room_ids=()):
+        # Unexplored rooms whose places show the object -> best match confidence (at least param_object_hint_threshold)
+        if not self.b_object_match_fast_path:
+            return {}
+        scene_graph = latest_observed_scene_graph(belief_manager.M_mind_palace, T_episode_to_explore)
+        room_confidences = {}
+        for _, room_id, confidence in scene_graph.object_matches(belief_manager.y_object_to_search, self.param_object_hint_threshold,
+                                                                 exclude_place_ids=belief_manager.H_a_place_exploration_action_history):
+            if room_id in belief_manager.H_r_explored_room_ids or room_id in exclude_room_ids:
+                continue
+            room_confidences[room_id] = max(room_confidences.get(room_id, 0.0), confidence)
+        return room_confidences
+
+    def object_match_rooms(self, belief_manager: BeliefManager, room_confidences: dict):
+        # Deterministic pre-retrieval: rooms with an exact object tag match, with the match confidence as the room
+        # probability. None when no room clears param_object_match_threshold, then the LLM selects the rooms.
+        room_confidences = {room_id: confidence for room_id, confidence in room_confidences.items()
+                            if confidence >= self.param_object_match_threshold}
+        if len(room_confidences) == 0:
+            return None
+        room_list = sorted(room_confidences, key=lambda room_id: -room_confidences[room_id])
+        room_prob = [room_confidences[room_id] for room_id in room_list]
+        self.stats_object_match_hits += 1
+        print("RoomExploration object match: ", belief_manager.y_object_to_search, "seen in rooms", list(zip(room_list, room_prob)),
+              "skipping the LLM room selection")
+        return room_list, room_prob
+
+    def object_match_hint(self, scene_graph: SceneGraph, room_confidences: dict):
+        # Weaker matches are only a hint for the LLM
+        if len(room_confidences) == 0:
+            return ""
+        rooms = sorted(room_confidences, key=lambda room_id: -room_confidences[room_id])
+        return (
+            "From the object tags and captions of the robot memory, something similar to the object may have been seen in these rooms (the match can be wrong): " +
+            ", ".join(scene_graph.room_nodes[room_id].room_name + " (room_id = " + room_id + ")" for room_id in rooms if room_id in scene_graph.room_nodes) + "\n"
+        )
+
     def mdp_cp_plan(self, room_list: list, room_prob: list, scene_graph: SceneGraph, robot_location: int, H_a_room_exploration_action_history: list):
         r_room_to_explore = room_list[0]
 
@@ -309,67 +799,28 @@ class RoomExploration(object):
 
         if len(filtered_room_list) == 0:
             print("RoomExploration Conformal Prediction: No room to explore from LLM answer. We will explore other unexplored room.")
-            return r_room_to_explore
-        
-        # Do MDP online planning with 3 steps lookahead
-        discount_factor = 0.99
+            return r_room_to_explore, False
+
+        # Minimize the expected search distance, looking param_planner_depth rooms ahead
         if len(filtered_room_list) == 1:
             print("RoomExploration Conformal Prediction: Only one room to explore")
             r_room_to_explore = filtered_room_list[0]
-        elif len(filtered_room_list) == 2:
-            print("RoomExploration Conformal Prediction: MDP CP planning with 2 steps lookahead for 2 rooms")
-            dist_r_0 = self.compute_distance(scene_graph, robot_location, filtered_room_list[0])
-            dist_r_1 = self.compute_distance(scene_graph, robot_location, filtered_room_list[1])
-            dist_0_1 = self.compute_distance(scene_graph, filtered_room_list[0], filtered_room_list[1])
-            p_0 = filtered_room_prob[0]
-            p_1 = filtered_room_prob[1]
-
-            plan_A = p_0/(p_0+p_1) * dist_r_0 + (1-p_0/(p_0+p_1)) * (dist_r_0 + dist_0_1)
-            plan_B = p_1/(p_0+p_1) * dist_r_1 + (1-p_1/(p_0+p_1)) * (dist_r_1 + dist_0_1)
-
-            # plan_A = filtered_room_prob[0] * self.compute_distance(scene_graph, robot_location, filtered_room_list[0]) + discount_factor * filtered_room_prob[1] * self.compute_distance(scene_graph, filtered_room_list[0], filtered_room_list[1])
-            # plan_B = filtered_room_prob[1] * self.compute_distance(scene_graph, robot_location, filtered_room_list[1]) + discount_factor * filtered_room_prob[0] * self.compute_distance(scene_graph, filtered_room_list[1], filtered_room_list[0])
-            if plan_A < plan_B:
-                r_room_to_explore = filtered_room_list[0]
+        else:
+            start_distances = np.array([self.compute_distance(scene_graph, robot_location, room_id) for room_id in filtered_room_list])
+            room_distances = scene_graph.room_distance_matrix(filtered_room_list)
+            if len(filtered_room_list) == 2:
+                # The object is in one of the two rooms
+                room_order, expected_distance = self.room_planner.plan(start_distances, room_distances, filtered_room_prob,
+                                                                       b_mutually_exclusive=True)
             else:
-                r_room_to_explore = filtered_room_list[1]
-        elif len(filtered_room_list) >= 3:
-            print("RoomExploration Conformal Prediction: MDP CP planning with 3 steps lookahead for +3 rooms")
-            # Get the length of the room list
-            n = list(range(0,len(filtered_room_list)))
-            # List all possible permutations of the room list for 3 elements
-            from itertools import permutations
-            perm = permutations(filtered_room_list, 3)
-            # Initialize the minimum distance
-            min_distance = 1000000
-            # Initialize the room to explore
-            r_room_to_explore = filtered_room_list[0]
-            # Loop through all the permutations
-            print(n)
-
-            dist_total = 0
-            dist_total += self.compute_distance(scene_graph, robot_location, filtered_room_list[0])
-            for i in range(1, len(filtered_room_list)):
-                dist_total += self.compute_distance(scene_graph, filtered_room_list[i-1], filtered_room_list[i])
-            print("RoomExploration Conformal Prediction: MDP CP planning with 3 steps lookahead for +3 rooms: ", filtered_room_list, " Distance total: ", dist_total)
-
-            for r_list in list(perm):
-                r_a, r_b, r_c = r_list[0], r_list[1], r_list[2]
-                p_a = filtered_room_prob[filtered_room_list.index(r_a)]
-                p_b = filtered_room_prob[filtered_room_list.index(r_b)]
-                p_c = filtered_room_prob[filtered_room_list.index(r_c)]
-                dist_r_a = self.compute_distance(scene_graph, robot_location, r_a)
-                dist_a_b = self.compute_distance(scene_graph, r_a, r_b)
-                dist_b_c = self.compute_distance(scene_graph, r_b, r_c)
-
-                distance = p_a * dist_r_a + (1-p_a) * ( p_b * (dist_r_a + dist_a_b) + (1-p_b) *( p_c * (dist_r_a + dist_a_b + dist_b_c) + (1-p_c) * dist_total ) )
-
-                # distance = filtered_room_prob[n[0]] * self.compute_distance(scene_graph, robot_location, r_a) + discount_factor * filtered_room_prob[n[1]] * self.compute_distance(scene_graph, r_a, r_b) + discount_factor * discount_factor * filtered_room_prob[n[2]] * self.compute_distance(scene_graph, r_b, r_c)
-                # print("RoomExploration Conformal Prediction: MDP CP planning with 3 steps lookahead for +3 rooms: ", r_list, " Distance: ", distance)
-                # print(p_a, p_b, p_c)
-                if distance < min_distance:
-                    min_distance = distance
-                    r_room_to_explore = r_a
+                # Missing the object in all the lookahead rooms costs a tour of every candidate room
+                dist_total = start_distances[0] + sum(room_distances[i - 1, i] for i in range(1, len(filtered_room_list)))
+                room_order, expected_distance = self.room_planner.plan(start_distances, room_distances, filtered_room_prob,
+                                                                       failure_cost=dist_total, depth=self.param_planner_depth)
+            r_room_to_explore = filtered_room_list[room_order[0]]
+            print("RoomExploration Conformal Prediction: MDP CP planning with", len(room_order), "steps lookahead for",
+                  len(filtered_room_list), "rooms: ", [filtered_room_list[i] for i in room_order],
+                  " Expected distance: ", expected_distance)
         print("RoomExploration MDP CP Plan: Room to explore: ", r_room_to_explore)
 
         # Determine if the plan is a single now exploration plan
@@ -399,60 +850,68 @@ class RoomExploration(object):
         
 
     def compute_distance(self, scene_graph: SceneGraph, robot_or_room_id, room_id):
+        # Walking distance along the scene's traversal graph (precomputed tables)
         if 'r' in str(robot_or_room_id):
-            current_position = scene_graph.room_nodes[robot_or_room_id].position
-        else:
-            if robot_or_room_id not in scene_graph.place_nodes:
-                print("RoomExploration: Robot or room id not in scene graph place nodes: ", robot_or_room_id)
-                print("RoomExploration: Scene graph place nodes list: ", scene_graph.place_nodes)
-                # Just get the first place node position
-                for place_node in scene_graph.place_nodes:
-                    current_position = scene_graph.place_nodes[place_node].position
-                    break
-            else:
-                current_position = scene_graph.place_nodes[robot_or_room_id].position
+            return scene_graph.room_distance(robot_or_room_id, room_id)
 
-        next_position = scene_graph.room_nodes[room_id].position
-        distance = sum((next_position[i] - current_position[i]) ** 2 for i in range(3)) ** 0.5
-
-        return distance
+        if robot_or_room_id not in scene_graph.place_nodes:
+            print("RoomExploration: Robot or room id not in scene graph place nodes: ", robot_or_room_id)
+            # Use the closest place of this scene graph
+            robot_or_room_id = scene_graph.resolve_place_id(robot_or_room_id)
+        return scene_graph.place_to_room_distance(robot_or_room_id, room_id)
 
                 
     
+    def build_room_prompt(self, build_prompt, scene_graph: SceneGraph, user_question: str, object_to_search,
+                          S_exploration_summary: list, S_room_exploration_summary: list, H_a_room_exploration_action_history: list):
+        if self.prompt_budget is None:
+            return build_prompt(scene_graph.print_room_nodes(), str(S_exploration_summary), str(S_room_exploration_summary))
+        # Keep the prompt at a fixed size however many rooms, episodes and summaries there are
+        return self.prompt_budget.fit_room_prompt(build_prompt, scene_graph, str(object_to_search) + " " + user_question,
+                                                  S_exploration_summary, S_room_exploration_summary,
+                                                  explored_room_ids=H_a_room_exploration_action_history)
+
     def value_based_room_selection(self, user_question: str, object_to_search: list, T_episode_to_explore: str, scene_graph: SceneGraph, robot_place: int, 
-                                    S_exploration_summary: list, S_room_exploration_summary: list, H_a_room_exploration_action_history: list):
-        prompt_seek_value_based_room_selection = (
-            "You are an AI agent in a environment environment and your task is to answer questions from the user by exploring the environment or recalling past relevant information.\n\n"
-            "To locate the object: " + str(object_to_search) + ", and to answer the question: " + user_question + ", you need to assess the probability (from 0.0 to 0.99) of finding the object on each room\n\n"
-            "You want to assign the probability from 0.0 to 0.99 on each room. The higher the probability, the more likely you think the object is in that room.\n\n"
-            "Note that we don't want to have the total probability value to 1 for all rooms, rather we want to have the probability value to reflect your confidence on each room.\n\n"
-            "Only answer with at most 10 most likely rooms so you don't have to give answer to every room.\n\n"
-            "Here is the list of the rooms in the environment (These are the only rooms you can explore. You can't explore other rooms):\n" + 
-            scene_graph.print_room_nodes() + "\n"
-            "Currently we are exploring the environment at time instance: " + T_episode_to_explore + "\n"
-            "If we are exploring the present or time instance now, we don't have the latest knowledge of the object placement so we use the most recent knowledge of the object placement.\n"
-            "For context of what the agent had explored, here is the summary of the agent's exploration and observation so far across the time instances (Imagine we have a different world version for certain time instance that the agent can explore): \n" + 
-            str(S_exploration_summary) + "\n"
-            "Additionally, in the current exploration of the current time instance here is the summary of the agent's room exploration so far: \n" +
-            str(S_room_exploration_summary) + "\n"
-            # "Please note that if we previously explored the room in S_room_exploration_summary, we will not explore the same room again and will choose other room.\n\n"
-            # "For example if previously the agent has explored living room, you must not answer living room again.\n\n"
-            "Important! You only can answer among the rooms in the list. You can't explore other rooms.\n\n"
-            "In your answer, please sort the rooms based on the probability value from highest to lowest.\n"
-            "Please answer using the json form of:\n\n"
-            "{"
-            "\"reasoning\": \"Reason conscicely how you infer the probability of finding the target object given the information of all room.\", "
-            " \"rooms\": [\"room1\", ...],"
-            " \"room_id\": [\"rx\", ...],"
-            " \"probability\": [0.XX, ...],"
-            "}"
-            "Important! Do not use ' and \" within the reasoning field at all (only in the beginning and end) because it will cause an error in the JSON parsing. and don't use the ```json!"
-        )
+                                    S_exploration_summary: list, S_room_exploration_summary: list, H_a_room_exploration_action_history: list,
+                                    object_match_hint: str = ""):
+        def build_prompt(room_listing: str, exploration_summary: str, room_exploration_summary: str):
+            return (
+                "You are an AI agent in a environment environment and your task is to answer questions from the user by exploring the environment or recalling past relevant information.\n\n"
+                "To locate the object: " + str(object_to_search) + ", and to answer the question: " + user_question + ", you need to assess the probability (from 0.0 to 0.99) of finding the object on each room\n\n"
+                "You want to assign the probability from 0.0 to 0.99 on each room. The higher the probability, the more likely you think the object is in that room.\n\n"
+                "Note that we don't want to have the total probability value to 1 for all rooms, rather we want to have the probability value to reflect your confidence on each room.\n\n"
+                "Only answer with at most 10 most likely rooms so you don't have to give answer to every room.\n\n"
+                "Here is the list of the rooms in the environment (These are the only rooms you can explore. You can't explore other rooms):\n" + 
+                room_listing + "\n" +
+                object_match_hint +
+                "Currently we are exploring the environment at time instance: " + T_episode_to_explore + "\n"
+                "If we are exploring the present or time instance now, we don't have the latest knowledge of the object placement so we use the most recent knowledge of the object placement.\n"
+                "For context of what the agent had explored, here is the summary of the agent's exploration and observation so far across the time instances (Imagine we have a different world version for certain time instance that the agent can explore): \n" + 
+                exploration_summary + "\n"
+                "Additionally, in the current exploration of the current time instance here is the summary of the agent's room exploration so far: \n" +
+                room_exploration_summary + "\n"
+                # "Please note that if we previously explored the room in S_room_exploration_summary, we will not explore the same room again and will choose other room.\n\n"
+                # "For example if previously the agent has explored living room, you must not answer living room again.\n\n"
+                "Important! You only can answer among the rooms in the list. You can't explore other rooms.\n\n"
+                "In your answer, please sort the rooms based on the probability value from highest to lowest.\n"
+                "Please answer using the json form of:\n\n"
+                "{"
+                "\"reasoning\": \"Reason conscicely how you infer the probability of finding the target object given the information of all room.\", "
+                " \"rooms\": [\"room1\", ...],"
+                " \"room_id\": [\"rx\", ...],"
+                " \"probability\": [0.XX, ...],"
+                "}"
+                "Important! Do not use ' and \" within the reasoning field at all (only in the beginning and end) because it will cause an error in the JSON parsing. and don't use the ```json!"
+            )
+
+        prompt_seek_value_based_room_selection = self.build_room_prompt(build_prompt, scene_graph, user_question, object_to_search,
+                                                                         S_exploration_summary, S_room_exploration_summary,
+                                                                         H_a_room_exploration_action_history)
         # print(prompt_seek_value_based_room_selection)
 
         try:
             messages = self.oa_interface.prepare_openai_messages(prompt_seek_value_based_room_selection)
-            output = self.oa_interface.call_openai_api(messages=messages,)
+            output = self.oa_interface.call_openai_api(messages=messages, call_site="room")
             
 
             json_object = self.oa_interface.answer_to_json(output)
@@ -477,30 +936,35 @@ class RoomExploration(object):
     
     def direct_query_room_retrieval(self, user_question: str, object_to_search: list, scene_graph: SceneGraph, robot_location: dict, 
                                     S_exploration_summary: list, S_room_exploration_summary: list, H_a_room_exploration_action_history: list):
-        prompt_3_room_retrieval = (
-            "You are an AI agent in a environment environment and your task is to answer questions from the user by exploring the environment or recalling past relevant information.\n\n"
-            "To locate the object: " + str(object_to_search) + ", and to answer the question: " + user_question + ", what room should I search in?\n\n"
-            "Here is the list of the rooms in the environment (These are the only rooms you can explore. You can't explore other rooms):\n" + scene_graph.print_room_nodes() + "\n\n"
-            "For context of what the agent had explored, here is the summary of the agent's exploration and observation so far: \n" + 
-            str(S_exploration_summary) + "\n"
-            "Additionally, in the current exploration here is the summary of the agent's room exploration so far (S_room_exploration_summary): \n" +
-            str(S_room_exploration_summary) + "\n"
-            "Please note that if we previously explored the room in S_room_exploration_summary, we will not explore the same room again and will choose other room.\n\n"
-            "For example if previously the agent has explored living room, you must not answer living room again.\n\n"
-            "Important! You only can answer among the rooms in the list. You can't explore other rooms.\n\n"
-            "Please answer using the json form of:\n\n"
-            "{"
-            " \"rooms\": [\"room1\", ...],"
-            " \"room_id\": [\"rx\", ...],"
-            "}"
-            "\"reasoning\": \"Explain why these rooms are relevant to the question or object search.\" } "
-            "Important! Do not use ' and \" in the reasoning field at all because it will cause an error in the JSON parsing. and don't use the ```json!"
-        )
+        def build_prompt(room_listing: str, exploration_summary: str, room_exploration_summary: str):
+            return (
+                "You are an AI agent in a environment environment and your task is to answer questions from the user by exploring the environment or recalling past relevant information.\n\n"
+                "To locate the object: " + str(object_to_search) + ", and to answer the question: " + user_question + ", what room should I search in?\n\n"
+                "Here is the list of the rooms in the environment (These are the only rooms you can explore. You can't explore other rooms):\n" + room_listing + "\n\n"
+                "For context of what the agent had explored, here is the summary of the agent's exploration and observation so far: \n" + 
+                exploration_summary + "\n"
+                "Additionally, in the current exploration here is the summary of the agent's room exploration so far (S_room_exploration_summary): \n" +
+                room_exploration_summary + "\n"
+                "Please note that if we previously explored the room in S_room_exploration_summary, we will not explore the same room again and will choose other room.\n\n"
+                "For example if previously the agent has explored living room, you must not answer living room again.\n\n"
+                "Important! You only can answer among the rooms in the list. You can't explore other rooms.\n\n"
+                "Please answer using the json form of:\n\n"
+                "{"
+                " \"rooms\": [\"room1\", ...],"
+                " \"room_id\": [\"rx\", ...],"
+                "}"
+                "\"reasoning\": \"Explain why these rooms are relevant to the question or object search.\" } "
+                "Important! Do not use ' and \" in the reasoning field at all because it will cause an error in the JSON parsing. and don't use the ```json!"
+            )
+
+        prompt_3_room_retrieval = self.build_room_prompt(build_prompt, scene_graph, user_question, object_to_search,
+                                                         S_exploration_summary, S_room_exploration_summary,
+                                                         H_a_room_exploration_action_history)
         # print(prompt_3_room_retrieval)
 
         try:
             messages = self.oa_interface.prepare_openai_messages(prompt_3_room_retrieval)
-            output = self.oa_interface.call_openai_api(messages=messages,)
+            output = self.oa_interface.call_openai_api(messages=messages, call_site="room")
             print("EpisodicExploration RoomExploration Output: \n\n", output, "\n")
 
             json_object = self.oa_interface.answer_to_json(output)
@@ -512,6 +976,13 @@ class RoomExploration(object):
 class PlaceExploration(object):
     def __init__(self):
         self.oa_interface = OpenAIInterface()
+        self.prompt_budget = PromptBudget()  # Set to None to list every place of the room
+        self.param_retrieval_top_k = None  # Only list the top-k places of the room by caption/object similarity
+        self.param_max_places = 5  # Places to explore per room visit
+        self.b_object_match_fast_path = False  # Skip the LLM place retrieval when the object was seen in the room
+        self.param_object_match_threshold = 0.95  # Only exact object tags (1.0) skip the LLM
+        self.param_object_hint_threshold = 0.6  # Weaker matches (head noun 0.8, captions) are listed in the prompt
+        self.stats_object_match_hits = 0
 
 
     def plan(self, belief_manager: BeliefManager, T_episode_to_explore: str, r_room_to_explore: str):
@@ -519,15 +990,25 @@ class PlaceExploration(object):
         if 'now' in T_episode_to_explore:
             print('RoomExploration: Because we are exploring present environment Agent use the scene graph from the latest time instance')
             # Use the latest scene graph
-            for scene_time in list(belief_manager.M_mind_palace.keys()):
-                if 'now' not in scene_time:
-                    print("RoomExploration: We are using the scene graph from the latest time instance: ", scene_time)
-                    scene_graph = belief_manager.M_mind_palace[scene_time]
-                    break
+            scene_graph = latest_observed_scene_graph(belief_manager.M_mind_palace, T_episode_to_explore)
         robot_location = belief_manager.x_robot_location
         H_a_place_exploration_action_history = belief_manager.H_a_place_exploration_action_history
-        query_result_p_place_to_explore = self.direct_query_place_retrieval(belief_manager.Q_user_question, belief_manager.y_object_to_search, 
-                                                               scene_graph, robot_location, r_room_to_explore, H_a_place_exploration_action_history)
+        query_result_p_place_to_explore = []
+        hint_place_ids = []
+        if self.b_object_match_fast_path:
+            object_matches = scene_graph.object_matches(belief_manager.y_object_to_search, self.param_object_hint_threshold,
+                                                        room_id=r_room_to_explore, exclude_place_ids=H_a_place_exploration_action_history)
+            # Places with an exact object tag, no LLM call needed
+            exact_matches = [match for match in object_matches if match[2] >= self.param_object_match_threshold][:self.param_max_places]
+            query_result_p_place_to_explore = [place_id for place_id, _, _ in exact_matches]
+            hint_place_ids = [place_id for place_id, _, _ in object_matches]
+            if len(query_result_p_place_to_explore) > 0:
+                self.stats_object_match_hits += 1
+                print("PlaceExploration object match: ", exact_matches, "skipping the LLM place retrieval")
+        if len(query_result_p_place_to_explore) == 0:
+            query_result_p_place_to_explore = self.direct_query_place_retrieval(belief_manager.Q_user_question, belief_manager.y_object_to_search, 
+                                                                   scene_graph, robot_location, r_room_to_explore, H_a_place_exploration_action_history,
+                                                                   hint_place_ids=hint_place_ids)
         
         p_place_to_explore = []
 
@@ -541,7 +1022,7 @@ class PlaceExploration(object):
                 if scene_graph.place_nodes[place_node].room_parent == r_room_to_explore:     
                     if place_node not in H_a_place_exploration_action_history:
                         p_place_to_explore.append(place_node)
-                if len(p_place_to_explore) >= 5:
+                if len(p_place_to_explore) >= self.param_max_places:
                     break
 
         print("PlaceExploration p_place_to_explore: ", p_place_to_explore)
@@ -549,26 +1030,52 @@ class PlaceExploration(object):
         return p_place_to_explore
     
     def direct_query_place_retrieval(self, user_question: str, object_to_search: list, 
-                                     scene_graph: SceneGraph, robot_location: dict , r_room_to_explore: str, H_a_place_exploration_action_history: list):
-        prompt_4_place_retrieval = (
-            "You are an AI agent in a environment environment and your task is to answer questions from the user by exploring the environment or recalling past relevant information.\n\n"
-            "To locate the object: " + str(object_to_search) + ", and to answer the question: " + user_question + ", what places should I search in? List at most five.\n\n"
-            "Here is the information about the places in the selected room: The object listed in the place nodes only represent some easily identifiable objects in the place " 
-            "and not listing all objects in the environment\n" + 
-            scene_graph.print_place_nodes(room_id=r_room_to_explore) + "\n\n"
-            "Previously we have explored the following places in the room: " + str(H_a_place_exploration_action_history) + "\n\n"
-            "Only list at most 5 place number, distribute the search around the room assuming closer numbers represent closer locations.\n\n"
-            "You can only choose among the places in the list. There's no other place number to explore rather than the places in the list.\n\n" 
-            "Please answer using the json form of:\n\n"
-            " {\"reasoning\": \"Explain what places and why these places are relevant to the question or object search.\","
-            " \"place_number\": [xx, ...] } "
-            "Important! Do not use ' and \" in the reasoning field at all because it will cause an error in the JSON parsing. and don't use the ```json!"
-        )
+                                     scene_graph: SceneGraph, robot_location: dict , r_room_to_explore: str, H_a_place_exploration_action_history: list,
+                                     hint_place_ids: list = ()):
+        # hint_place_ids: places where something similar to the object was tagged or captioned
+        object_match_hint = ""
+        if len(hint_place_ids) > 0:
+            object_match_hint = ("From the object tags and captions of the robot memory, something similar to the object may have been seen "
+                                 "at these places (the match can be wrong): " + str(list(hint_place_ids)) + "\n\n")
+
+        def build_prompt(place_listing: str):
+            return (
+                "You are an AI agent in a environment environment and your task is to answer questions from the user by exploring the environment or recalling past relevant information.\n\n"
+                "To locate the object: " + str(object_to_search) + ", and to answer the question: " + user_question + ", what places should I search in? List at most five.\n\n"
+                "Here is the information about the places in the selected room: The object listed in the place nodes only represent some easily identifiable objects in the place " 
+                "and not listing all objects in the environment\n" + 
+                place_listing + "\n\n" +
+                object_match_hint +
+                "Previously we have explored the following places in the room: " + str(H_a_place_exploration_action_history) + "\n\n"
+                "Only list at most 5 place number, distribute the search around the room assuming closer numbers represent closer locations.\n\n"
+                "You can only choose among the places in the list. There's no other place number to explore rather than the places in the list.\n\n" 
+                "Please answer using the json form of:\n\n"
+                " {\"reasoning\": \"Explain what places and why these places are relevant to the question or object search.\","
+                " \"place_number\": [xx, ...] } "
+                "Important! Do not use ' and \" in the reasoning field at all because it will cause an error in the JSON parsing. and don't use the ```json!"
+            )
+
+        candidate_place_ids = None
+        if self.param_retrieval_top_k is not None:
+            # Pre-select the candidates locally so the prompt only carries the most similar places
+            retrieved = scene_graph.place_retrieval_index().search([object_to_search, user_question], k=self.param_retrieval_top_k,
+                                                                   room_id=r_room_to_explore,
+                                                                   exclude_place_ids=H_a_place_exploration_action_history)
+            candidate_place_ids = {place_id for place_id, _ in retrieved} | set(hint_place_ids) or None
+            print("PlaceExploration retrieval candidates: ", retrieved)
+
+        if self.prompt_budget is None:
+            prompt_4_place_retrieval = build_prompt(scene_graph.print_place_nodes(room_id=r_room_to_explore, place_ids=candidate_place_ids))
+        else:
+            prompt_4_place_retrieval = self.prompt_budget.fit_place_prompt(build_prompt, scene_graph, r_room_to_explore,
+                                                                           str(object_to_search) + " " + user_question,
+                                                                           explored_place_ids=set(H_a_place_exploration_action_history),
+                                                                           candidate_place_ids=candidate_place_ids)
         # print(prompt_4_place_retrieval)
 
         try:
             messages = self.oa_interface.prepare_openai_messages(prompt_4_place_retrieval)
-            output = self.oa_interface.call_openai_api(messages=messages,)
+            output = self.oa_interface.call_openai_api(messages=messages, call_site="place")
             print("MindPalaceExploration PlaceExploration Output: \n\n", output, "\n")
 
             json_object = self.oa_interface.answer_to_json(output)
@@ -581,12 +1088,30 @@ class PlaceExploration(object):
             raise e
 
 class TemporalPlanner(object):
-    def __init__(self, temporal_scene_graph: dict):
+    # Monte Carlo planner over the explore (now) / retrieve (past episode) / answer actions.
+    # The LLM estimates, per episode, the chance of finding the evidence there and the number of rooms to
+    # search. Estimates are memoized per (question, episode, belief digest), and simulated steps update them
+    # without new queries, so the number of model calls does not grow with the search depth.
+    def __init__(self, temporal_scene_graph: dict, num_workers: int = 4):
         self.llm_interface = OpenAIInterface()
+        self.prompt_budget = PromptBudget()
 
         # Heuristic search parameter
-        self.d_search_depth = 1
-        self.m_number_of_simulations = 1
+        self.d_search_depth = 3
+        self.m_number_of_simulations = 64
+        self.num_workers = num_workers
+        self.param_discount_factor = 0.95
+        self.param_exploration_epsilon = 0.2  # Chance of a random action in the rollout policy
+        self.param_explore_cost_per_room = 10.0  # Assume 10 meter to explore a room
+        self.param_retrieve_cost_per_room = 1.0
+        self.param_answer_reward = 100.0  # Answering with the evidence found, minus this when answering without
+
+        self.Q_action_value_function_dict = {}  # Action values of the last plan
+        self.reward_cache = {}  # (question, episode, belief digest) -> (probability, number of rooms)
+        self.reward_cache_lock = threading.Lock()
+        self.stats_llm_calls = 0
+        self.stats_cache_hits = 0
+        self.stats_fallbacks = 0
 
         # Define action space 
         self.Action = []
@@ -603,72 +1128,149 @@ class TemporalPlanner(object):
         self.Action.append(-1)
         # if len(self.Action) > 5 consider to reduce the number of possible actions maybe! 
 
+    def action_name(self, action: int):
+        return "answer" if action == -1 else self.list_of_scene_time[action]
+
     def plan(self, belief_manager): # Output high level plan
-        Q_action_value_function_dict = {}        
-        Observation_dict = {}
-        
+        # Returns the greedy action index (-1 answers). The action values of the last plan are kept in
+        # self.Q_action_value_function_dict.
+        # Only the LLM reward estimates run concurrently (I/O bound), the rollouts are cheap and run serially
+        estimates = self.estimate_rewards(belief_manager)
+        found = self.found_episodes(belief_manager)
+        digest = belief_manager.belief_digest()
+
+        # Simulations are spread evenly over the first actions
+        Q_action_value_function_dict = {}
         for i in range(self.m_number_of_simulations):
-            print(f"Simulation {i+1}")
-            self.simulate(belief_manager,
-                            Q_action_value_function_dict,
-                            Observation_dict)
-
-        return self.greedy_policy(belief_manager)
-
-    def simulate(self, belief_manager, Q_action_value_function_dict, Observation_dict):
+            action = self.Action[i % len(self.Action)]
+            value = self.simulate(estimates, found, action, random.Random(self.simulation_seed(digest, i)))
+            Q_action_value_function_dict.setdefault(action, []).append(value)
+        Q_action_value_function_dict = {action: float(np.mean(values)) for action, values in Q_action_value_function_dict.items()}
+        self.Q_action_value_function_dict = Q_action_value_function_dict
+
+        action = self.greedy_policy(Q_action_value_function_dict)
+        print("TemporalPlanner: Action values: ", {self.action_name(a): round(q, 2) for a, q in Q_action_value_function_dict.items()})
+        print("TemporalPlanner: Plan: ", self.action_name(action))
+        return action
+
+    def simulation_seed(self, digest: str, i: int):
+        # Same belief, same rollouts: plans are reproducible
+        return int(hashlib.sha1(f"{digest}:{i}".encode("utf-8")).hexdigest()[:8], 16)
+
+    def found_episodes(self, belief_manager):
+        # update_history is only called when the target object was found
+        return frozenset(entry.episode for entry in belief_manager.H_a_action_history)
+
+    def simulate(self, estimates: dict, found_episodes: frozenset, first_action: int, rng: random.Random):
+        # One rollout: the first action is given, then the rollout policy, for at most d_search_depth steps.
+        # Not answering by then means answering at the end. Returns the discounted return.
+        visited = set()
+        b_found = len(found_episodes) > 0
+        remaining = dict(estimates)
+        total_return = 0.0
+        discount = 1.0
+        action = first_action
         for depth in range(self.d_search_depth):
-            # Predict Q value for each action and predict the most likely observation
-            Q_action_value, o_observation = self.look_ahead(belief_manager)
-
-            # # Choose the action based on the Q value
-            # a = self.greedy_policy(Q_action_value)
-
-            # # Update the Q value
-
-            # # Update the observation
-
-    def greedy_policy(self, belief_manager):
-        pass
-
-    def look_ahead(self, belief_manager):
-        print("Look ahead")
-        r_reward_estimate = []
-        return None, None
-    
-    def estimate_reward(self, belief_manager):
-        # Get relevant information from the belief manager
-        user_question = belief_manager.user_question
-        object_to_search = belief_manager.object_to_search
-        scene_graph = belief_manager.temporal_scene_graph[self.list_of_scene_time[0]]
-
-        estimated_reward = []
-
-        prompt = (
-            "You are an AI agent in a environment environment and your task is to answer questions from the user by exploring the environment or recalling past relevant information.\n\n"
-            "To locate the object: " + str(object_to_search) + ", and to answer the question: " + user_question + "\n\n" 
-            "We want to estimate the action cost of the robot walking around the environment in order to find the target object by estimating the number of rooms the robot needs to potentially explore around given the current knowledge.\n\n"
-            "Previously, we did: nothing, this is the start of the robot episode.\n\n"
-            "Here is the information about the rooms in the environment:\n" + scene_graph.print_room_nodes() + "\n\n"
-            "With this information, how many rooms the robot potentially needs to explore to locate the target object?\n\n"
-            "Please answer using the form of:\n\n"
-            "{'answer': number, 'reasoning': 'short explanation why you guess this answer'}"
-            "Important! Do not use ' and \" in the reasoning field at all because it will cause an error in the parsing."
-        )
-
-        number_of_room = int(self.llm_interface.query_llm(prompt, "answer"))
-        
-        # Estimate reward for exploration
-        estimated_reward.append(number_of_room * -10) # Assume 10 meter to explore a room
-
-        # Estimate reward for retrieval
-        for i in range(len(self.Action)-2):
-            estimated_reward.append(number_of_room * -1)
-
-        # Estimate reward for answering
-        
-
-        return estimated_reward
-
-    def estimate_heuristic_action_value_function(self, belief_manager):
-        pass
-
+            if depth > 0:
+                action = self.rollout_policy(remaining, visited, b_found, rng)
+            if action == -1 or action in visited:
+                break
+            reward, b_found_here = self.look_ahead(remaining, action, rng)
+            total_return += discount * reward
+            discount *= self.param_discount_factor
+            visited.add(action)
+            b_found = b_found or b_found_here
+            if not b_found_here:
+                # Searched without finding: the evidence is not in this episode and a bit more likely elsewhere
+                missed = remaining[action][0]
+                remaining = {a: (0.0 if a == action else min(1.0, p / max(1e-6, 1.0 - missed)), n)
+                             for a, (p, n) in remaining.items()}
+        return total_return + discount * self.answer_reward(b_found)
+
+    def look_ahead(self, estimates: dict, action: int, rng: random.Random):
+        # Sampled outcome of exploring/retrieving one episode: (reward, found)
+        probability, num_rooms = estimates[action]
+        cost_per_room = self.param_explore_cost_per_room if "now" in self.list_of_scene_time[action] else self.param_retrieve_cost_per_room
+        return -num_rooms * cost_per_room, rng.random() < probability
+
+    def answer_reward(self, b_found: bool):
+        return self.param_answer_reward if b_found else -self.param_answer_reward
+
+    def rollout_policy(self, estimates: dict, visited: set, b_found: bool, rng: random.Random):
+        if b_found:
+            return -1
+        candidates = [a for a in self.Action if a != -1 and a not in visited]
+        if len(candidates) == 0:
+            return -1
+        if rng.random() < self.param_exploration_epsilon:
+            return rng.choice(candidates + [-1])
+        # Expected gain of the answer reward against the search cost
+        def score(a):
+            probability, num_rooms = estimates[a]
+            cost_per_room = self.param_explore_cost_per_room if "now" in self.list_of_scene_time[a] else self.param_retrieve_cost_per_room
+            return 2 * self.param_answer_reward * probability - num_rooms * cost_per_room
+        best = max(candidates, key=score)
+        return best if score(best) > 0 else -1
+
+    def greedy_policy(self, Q_action_value_function_dict: dict):
+        # Highest action value, ties go to the earlier action (now first)
+        return max(self.Action, key=lambda a: (Q_action_value_function_dict.get(a, -np.inf), -self.Action.index(a)))
+
+    def estimate_rewards(self, belief_manager):
+        # {action index: (probability, number of rooms)} for every episode, queried concurrently
+        episode_actions = [a for a in self.Action if a != -1]
+        with ThreadPoolExecutor(max_workers=max(1, min(self.num_workers, len(episode_actions)))) as executor:
+            estimates = list(executor.map(lambda a: self.estimate_reward(belief_manager, self.list_of_scene_time[a]), episode_actions))
+        return dict(zip(episode_actions, estimates))
+
+    def estimate_reward(self, belief_manager, episode: str):
+        # (probability that the evidence is found in the episode, number of rooms to search), memoized
+        key = (belief_manager.Q_user_question, episode, belief_manager.belief_digest())
+        with self.reward_cache_lock:
+            if key in self.reward_cache:
+                self.stats_cache_hits += 1
+                return self.reward_cache[key]
+
+        scene_graph = belief_manager.M_mind_palace[episode]
+        if "now" in episode:
+            episode_text = "The robot would explore the environment now, walking to the rooms."
+        else:
+            episode_text = "The robot would recall its past observations of the environment at the time: " + episode + "."
+
+        def build_prompt(room_listing: str, exploration_summary: str, room_exploration_summary: str):
+            return (
+                "You are an AI agent in an environment and your task is to answer questions from the user by exploring the environment or recalling past relevant information.\n\n"
+                "To locate the object: " + str(belief_manager.y_object_to_search) + ", and to answer the question: " + belief_manager.Q_user_question + "\n\n"
+                + episode_text + "\n"
+                "We want to estimate the chance that this finds the information needed to answer the question, and the number of rooms the robot needs to search given the current knowledge.\n\n"
+                "Previously, we did: " + (exploration_summary or "nothing, this is the start of the robot episode.") + "\n\n"
+                "Here is the information about the rooms in the environment:\n" + room_listing + "\n\n"
+                "Please answer using the json form of:\n\n"
+                "{\"probability\": number between 0 and 1, \"number_of_rooms\": number, \"reasoning\": \"short explanation\"}"
+                "Important! Do not use ' and \" in the reasoning field at all because it will cause an error in the parsing."
+            )
+
+        query_text = str(belief_manager.y_object_to_search) + " " + belief_manager.Q_user_question
+        prompt = self.prompt_budget.fit_room_prompt(build_prompt, scene_graph, query_text, belief_manager.S_exploration_summary, [])
+        try:
+            messages = self.llm_interface.prepare_openai_messages(prompt)
+            output = self.llm_interface.call_openai_api(messages=messages, call_site="planner")
+            json_object = self.llm_interface.answer_to_json(output)
+            probability = min(1.0, max(0.0, float(json_object["probability"])))
+            num_rooms = max(1, int(json_object["number_of_rooms"]))
+        except (ResponseCacheMiss, openai.AuthenticationError, openai.PermissionDeniedError) as e:
+            raise e
+        except Exception as e:
+            # No estimate: an even chance, searching half of the rooms. Not cached, the next plan asks again.
+            probability, num_rooms = 0.5, max(1, len(scene_graph.room_nodes) // 2)
+            print("TemporalPlanner: Reward estimate failed for ", episode, ": ", e,
+                  " Using the fallback probability ", probability, " number of rooms ", num_rooms)
+            with self.reward_cache_lock:
+                self.stats_llm_calls += 1
+                self.stats_fallbacks += 1
+            return probability, num_rooms
+
+        with self.reward_cache_lock:
+            self.stats_llm_calls += 1
+            self.reward_cache[key] = (probability, num_rooms)
+        return probability, num_rooms
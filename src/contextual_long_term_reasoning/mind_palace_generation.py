@@ -4,9 +4,76 @@
 
 import os
 import pickle
+import shutil
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
 import yaml
 
+from contextual_long_term_reasoning.spatial_index import PlaceSpatialIndex
+from contextual_long_term_reasoning.traversal_graph import TraversalGraph, traversal_graph_available
+from contextual_long_term_reasoning.place_retrieval_index import PlaceRetrievalIndex
+from contextual_long_term_reasoning.object_index import ObjectIndex
+
+def quaternion_to_yaw(quaternion):
+    """
+    Convert a quaternion to yaw angle in radians.
+    Assumes quaternion is in the form (w, x, y, z).
+    """
+    w, x, y, z = quaternion
+    t3 = 2.0 * (w * z + x * y)
+    t4 = 1.0 - 2.0 * (y * y + z * z)
+    return np.arctan2(t3, t4)
+
+
+def load_place_node_from_frame(job):
+    # Runs in an ingestion worker process. Returns (file_index, PlaceNode or None, error message or None)
+    file_index, state_path, image_path, caption_path, b_run_RAM = job
+    file_name = os.path.basename(state_path)
+
+    # Load the pickle file
+    try:
+        with open(state_path, 'rb') as f:
+            pkl_data = pickle.load(f)
+    except Exception as e:
+        return file_index, None, f"An error occurred while loading the file {state_path}: {e}"
+
+    # Check if pkl_data is valid
+    if not pkl_data:
+        return file_index, None, f"Failed to load data from file {file_name}."
+
+    try:
+        # Extract position and rotation
+        position = pkl_data['agent_state'].position  # Assuming it's a numpy array
+        rotation = pkl_data['agent_state'].rotation  # Assuming it's a quaternion object
+
+        # Convert rotation to a quaternion tuple
+        quaternion = (rotation.w, rotation.x, rotation.y, rotation.z)
+
+        # Create a MemNode object
+        node = PlaceNode(
+            node_id=file_index,  # Use the file index as the node ID
+            position=position.tolist(),  # Convert to a Python list
+            orientation=quaternion,  # Quaternion as a tuple
+            yaw=quaternion_to_yaw(quaternion)
+        )
+
+        if b_run_RAM and caption_path is not None:
+            # Load the caption file
+            with open(caption_path, 'r') as caption_file:
+                caption_text = caption_file.read()
+            # The first line of the text goes to the contextual description
+            node.text_contextual_description = caption_text.split('\n')[0]
+            # The last line of the text after the 'Objects:' becomes a list of object (the object name is separated by a comma)
+            # Make all the text lower case first
+            caption_text = caption_text.lower()
+            node.text_object_seen = caption_text.split('\n')[-1].split(':')[-1].strip().split(', ')
+
+        node.image_path = image_path
+        return file_index, node, None
+    except Exception as e:
+        return file_index, None, f"Error processing file {file_name}: {e}"
+
+
 class PlaceNode:
     def __init__(self, node_id, position, orientation, yaw):
         self.node_id = node_id
@@ -70,22 +137,27 @@ class RoomNode:
         self.image_path = None    # Not used
 
         self.text_object_seen = None    # Summary of objects seen in this room from all places
+        self.object_counts = None       # Object -> number of places in this room that saw it
+        self.place_ids = None           # Place nodes in this room
         self.text_contextual_description =  None # Maybe used for the description of this place
 
         self.node_type = None  # Not used
         self.relevant_docs = None # Optional
 
-    def print_info(self, print_info=False):
+    def print_info(self, print_info=False, text_object_seen=None):
+        # text_object_seen overrides the listed objects, e.g. a trimmed list for a token-budgeted prompt
+        if text_object_seen is None:
+            text_object_seen = self.text_object_seen
         if print_info:
             print(f"Room Node {self.node_id}")
             print(f"Room Name: {self.room_name}")
             print(f"Position: {self.position}")
             # print(f"Floor Parent: {self.floor_parent}")
-            print(f"Text Object Seen: {self.text_object_seen}")
+            print(f"Text Object Seen: {text_object_seen}")
             print(f"Text Contextual Description: {self.text_contextual_description}")
 
         # Return the info as a string
-        return f"Room Node {self.node_id}\nRoom Name: {self.room_name}\nPosition: {self.position}\nText Object Seen: {self.text_object_seen}\nText Contextual Description: {self.text_contextual_description}"
+        return f"Room Node {self.node_id}\nRoom Name: {self.room_name}\nPosition: {self.position}\nText Object Seen: {text_object_seen}\nText Contextual Description: {self.text_contextual_description}"
 
 class SceneGraph:
     def __init__(self, scene_name, state_dataset_dir, room_nodes=None, place_nodes=None):
@@ -95,27 +167,165 @@ class SceneGraph:
         self.place_nodes = place_nodes
         self.room_nodes = room_nodes
 
-    def print_room_nodes(self):
+        self.place_spatial_index = None  # Built on the first spatial query
+
+        # Walking distances along the navigation graph, straight lines when disabled or scipy is missing
+        self.b_use_traversal_distance = True
+        self.param_traversal_adjacency_radius = 1.0
+        self.place_traversal_graph = None
+        self.place_retrieval = None  # Built on the first place retrieval
+        self.place_object_index = None  # Built on the first object match
+
+    def object_index(self):
+        # Object terms -> places of this scene graph, for deterministic object matches
+        if self.place_object_index is None:
+            self.place_object_index = ObjectIndex.from_scene_graph(self, self.scene_name)
+        return self.place_object_index
+
+    def object_matches(self, objects, min_confidence=0.8, room_id=None, exclude_place_ids=()):
+        # [(place_id, room_id, confidence)] of the places where one of the objects was seen, best first
+        if isinstance(objects, str):
+            objects = [objects]
+        exclude_place_ids = set(exclude_place_ids)
+        confidences = {}
+        for obj in objects:
+            for posting, confidence in self.object_index().match(str(obj)):
+                if confidence < min_confidence or posting.place_id in exclude_place_ids:
+                    continue
+                if room_id is not None and posting.room_id != room_id:
+                    continue
+                key = (posting.place_id, posting.room_id)
+                confidences[key] = max(confidences.get(key, 0.0), confidence)
+        return [(place_id, place_room_id, confidence) for (place_id, place_room_id), confidence
+                in sorted(confidences.items(), key=lambda item: (-item[1], item[0][0]))]
+
+    def place_retrieval_index(self, num_features=1024):
+        # Hashed TF-IDF vectors of the place captions and objects, cached next to the scene
+        if self.place_retrieval is None:
+            path = os.path.join(self.state_dataset_dir, 'place_retrieval_' + self.scene_name + '.npz')
+            signature = PlaceRetrievalIndex.signature(self.place_nodes, num_features)
+            self.place_retrieval = PlaceRetrievalIndex.load(path, signature)
+            if self.place_retrieval is None:
+                self.place_retrieval = PlaceRetrievalIndex.from_place_nodes(self.place_nodes, num_features)
+                try:
+                    self.place_retrieval.save(path, signature)
+                except OSError as e:
+                    print(f"SceneGraph: Could not cache the place retrieval index of {self.scene_name}: {e}")
+        return self.place_retrieval
+
+    def traversal_graph_path(self):
+        return os.path.join(self.state_dataset_dir, 'traversal_' + self.scene_name + '.npz')
+
+    def traversal_graph(self):
+        # Built once per scene graph and cached next to the scene; None when straight lines are used
+        if not self.b_use_traversal_distance or not traversal_graph_available() or not self.place_nodes:
+            return None
+        if self.place_traversal_graph is None:
+            traversal_graph = TraversalGraph.from_place_nodes(self.place_nodes, self.param_traversal_adjacency_radius)
+            if not traversal_graph.load(self.traversal_graph_path()):
+                traversal_graph.compute()
+                try:
+                    traversal_graph.save(self.traversal_graph_path())
+                except OSError as e:
+                    print(f"SceneGraph: Could not cache the traversal graph of {self.scene_name}: {e}")
+            self.place_traversal_graph = traversal_graph
+        return self.place_traversal_graph
+
+    def euclidean_distance(self, position_a, position_b):
+        return sum((position_b[i] - position_a[i]) ** 2 for i in range(3)) ** 0.5
+
+    def place_distance(self, place_a, place_b):
+        traversal_graph = self.traversal_graph()
+        if traversal_graph is not None and place_a in traversal_graph.row_of_place and place_b in traversal_graph.row_of_place:
+            return traversal_graph.place_distance(place_a, place_b)
+        return self.euclidean_distance(self.place_nodes[place_a].position, self.place_nodes[place_b].position)
+
+    def place_to_room_distance(self, place_id, room_id):
+        traversal_graph = self.traversal_graph()
+        if traversal_graph is not None and place_id in traversal_graph.row_of_place and room_id in traversal_graph.row_of_room:
+            return traversal_graph.place_to_room_distance(place_id, room_id)
+        return self.euclidean_distance(self.place_nodes[place_id].position, self.room_nodes[room_id].position)
+
+    def room_distance(self, room_a, room_b):
+        traversal_graph = self.traversal_graph()
+        if traversal_graph is not None and room_a in traversal_graph.row_of_room and room_b in traversal_graph.row_of_room:
+            return traversal_graph.room_distance(room_a, room_b)
+        return self.euclidean_distance(self.room_nodes[room_a].position, self.room_nodes[room_b].position)
+
+    def room_distance_matrix(self, room_ids):
+        # (n, n) walking distances between the rooms, in the order of room_ids
+        distances = np.zeros((len(room_ids), len(room_ids)))
+        for i, room_a in enumerate(room_ids):
+            for j in range(i + 1, len(room_ids)):
+                distances[i, j] = distances[j, i] = self.room_distance(room_a, room_ids[j])
+        return distances
+
+    def spatial_index(self):
+        if self.place_spatial_index is None or not self.place_spatial_index.is_current(self.place_nodes):
+            self.place_spatial_index = PlaceSpatialIndex(self.place_nodes)
+        return self.place_spatial_index
+
+    def nearest_places(self, position, k=1):
+        return self.spatial_index().nearest(position, k)
+
+    def places_within_radius(self, position, radius):
+        return self.spatial_index().within_radius(position, radius)
+
+    def nearest_place_in_room(self, position, room_id, k=1):
+        return self.spatial_index().nearest_in_room(position, room_id, k)
+
+    def resolve_place_id(self, place_id, mind_palace=None):
+        # Map a place id that is not in this scene graph (e.g. a frame of another episode) to the
+        # spatially closest place of this scene graph. Episodes of a scene share one map frame.
+        if place_id in self.place_nodes:
+            return place_id
+        position = None
+        if mind_palace is not None:
+            # Episodes already in memory first, so a lazy mind palace only loads more when it has to
+            is_loaded = getattr(mind_palace, "is_loaded", lambda episode: True)
+            episodes = sorted(mind_palace, key=lambda episode: not is_loaded(episode))
+            for episode in episodes:
+                scene_graph = mind_palace[episode]
+                if scene_graph is not self and place_id in scene_graph.place_nodes:
+                    position = scene_graph.place_nodes[place_id].position
+                    break
+        if position is not None:
+            nearest = self.nearest_places(position, k=1)
+            if len(nearest) > 0:
+                return nearest[0][0]
+        return self.spatial_index().nearest_id(place_id)
+
+    def print_room_nodes(self, room_ids=None, room_objects=None):
+        # room_ids restricts the listing, room_objects maps room id -> objects to show instead of all
         text_output = ""
         for room_node in self.room_nodes:
-            text_output += self.room_nodes[room_node].print_info()
+            if room_ids is not None and room_node not in room_ids:
+                continue
+            text_object_seen = room_objects.get(room_node) if room_objects is not None else None
+            text_output += self.room_nodes[room_node].print_info(text_object_seen=text_object_seen)
             text_output += "\n\n"
             # print("\n")
         return text_output
 
-    def print_place_nodes(self, room_id=None):
+    def print_place_nodes(self, room_id=None, place_ids=None):
         text_output = ""
         for place_node in self.place_nodes:
+            if place_ids is not None and place_node not in place_ids:
+                continue
             if room_id is None or self.place_nodes[place_node].room_parent == room_id:
-                room_id_of_place = self.place_nodes[place_node].room_parent
-                room_name = self.room_nodes[room_id_of_place].room_name
-                text_output += self.place_nodes[place_node].print_info()
-                if room_id_of_place in self.room_nodes:
-                    room_name = self.room_nodes[room_id_of_place].room_name
-                    text_output += f"room Name: {room_name}\n"
-                text_output += "\n\n"
+                text_output += self.print_place_node(place_node)
                 # print("\n")
         return text_output
+
+    def print_place_node(self, place_node):
+        room_id_of_place = self.place_nodes[place_node].room_parent
+        room_name = self.room_nodes[room_id_of_place].room_name
+        text_output = self.place_nodes[place_node].print_info()
+        if room_id_of_place in self.room_nodes:
+            room_name = self.room_nodes[room_id_of_place].room_name
+            text_output += f"room Name: {room_name}\n"
+        text_output += "\n\n"
+        return text_output
     
     def print_place_nodes_2(self, room_id=None):
         text_output = ""
@@ -152,149 +362,309 @@ class LoadingHabitatSceneGraph:
         # Define the room nodes derived from Habitat environment files
         dict_place_id_to_room_id = {}
         dict_room_id_to_room_name = {}
-        
-        room_nodes = {}
 
-        # Assign the room parent to each place node
-        for place_id in place_nodes:
-            room_id = dict_place_id_to_room_id[place_id]
-            place_nodes[place_id].room_parent = room_id
+        # Assign the room parent to each place node, places missing from the map keep their room_parent
+        for place_id, room_id in dict_place_id_to_room_id.items():
+            if place_id in place_nodes:
+                place_nodes[place_id].room_parent = room_id
+
+        # Single pass over the places: room index per place, positions and (room, object) occurrences
+        place_ids, room_ids, room_of_place, positions, object_rooms, object_ids, object_names = \
+            self.place_room_arrays(place_nodes)
+
+        # Rooms from the map plus every room referenced by a place
+        for room_id in dict_room_id_to_room_name:
+            if room_id not in room_ids:
+                room_ids.append(room_id)
 
         # Initialize room nodes
         room_nodes = {}
-        for room_id in dict_room_id_to_room_name:
+        for room_id in room_ids:
             room_node = RoomNode(
                 node_id=room_id,
                 position=[0, 0, 0],
                 orientation=[0, 0, 0, 1],
                 yaw=0
             )
-            room_node.room_name = dict_room_id_to_room_name[room_id]
+            room_node.room_name = dict_room_id_to_room_name.get(room_id, room_node.room_name)
             room_nodes[room_id] = room_node
 
             print(f"Created room_node with ID {room_node.node_id}.")
 
-        # Populate the:
-        # 1) text_object_seen field of each room node
-        # 2) position of each room node, averafing the positions of all place nodes in the room
-        for room_id in room_nodes:
+        # Group by room:
+        # 1) position of each room node, averaging the positions of all place nodes in the room
+        # 2) place ids of each room (membership index)
+        # 3) text_object_seen and object_counts, objects ordered by how many places saw them
+        num_rooms = len(room_ids)
+        assigned = room_of_place >= 0
+        place_counts = np.bincount(room_of_place[assigned], minlength=num_rooms)
+        position_sums = np.zeros((num_rooms, 3), dtype=np.float64)
+        np.add.at(position_sums, room_of_place[assigned], positions[assigned])
+
+        order = np.argsort(room_of_place, kind="stable")
+        boundaries = np.searchsorted(room_of_place[order], np.arange(num_rooms + 1))
+
+        pair_keys = object_rooms.astype(np.int64) * max(1, len(object_names)) + object_ids
+        unique_pairs, pair_counts = np.unique(pair_keys, return_counts=True)
+        pair_rooms = unique_pairs // max(1, len(object_names))
+        pair_objects = unique_pairs % max(1, len(object_names))
+        pair_boundaries = np.searchsorted(pair_rooms, np.arange(num_rooms + 1))
+
+        for room_index, room_id in enumerate(room_ids):
             room_node = room_nodes[room_id]
-            object_texts = []
-            positions = []
+            if place_counts[room_index] > 0:
+                room_node.position = (position_sums[room_index] / place_counts[room_index]).tolist()
+            room_node.place_ids = [place_ids[k] for k in order[boundaries[room_index]:boundaries[room_index + 1]]]
 
-            for place_id in place_nodes:
-                if place_nodes[place_id].room_parent == room_id:
-                    if place_nodes[place_id].text_object_seen is not None:
-                        object_texts = list(set(object_texts + place_nodes[place_id].text_object_seen)) 
-                    positions.append(place_nodes[place_id].position)
-                    
-            room_node.text_object_seen = object_texts
-
-            avg_position = np.mean(positions, axis=0)
-            room_node.position = avg_position.tolist()
+            start, end = pair_boundaries[room_index], pair_boundaries[room_index + 1]
+            counts = sorted(((object_names[obj], int(count)) for obj, count in zip(pair_objects[start:end], pair_counts[start:end])),
+                            key=lambda item: (-item[1], item[0]))
+            room_node.object_counts = dict(counts)
+            room_node.text_object_seen = [obj for obj, _ in counts]
 
         return room_nodes
 
+    def place_room_arrays(self, place_nodes):
+        # Returns (place_ids, room_ids, room index per place (-1 without a room), positions (N, 3),
+        # room index per object occurrence, object index per occurrence, object names)
+        from contextual_long_term_reasoning.place_node_store import PlaceNodeStore
+
+        place_ids = list(place_nodes)
+        room_index_of = {}
+        object_index_of = {}
+        room_ids = []
+        object_names = []
+
+        def room_index(room_id):
+            if room_id is None:
+                return -1
+            if room_id not in room_index_of:
+                room_index_of[room_id] = len(room_ids)
+                room_ids.append(room_id)
+            return room_index_of[room_id]
+
+        def object_index(obj):
+            if obj not in object_index_of:
+                object_index_of[obj] = len(object_names)
+                object_names.append(obj)
+            return object_index_of[obj]
+
+        if isinstance(place_nodes, PlaceNodeStore):
+            # Columns are already arrays, only the interned strings are mapped to room / object indices
+            store = place_nodes
+            room_strings = np.array(store.room_parents, dtype=np.int64)
+            room_of_place = np.full(len(store), -1, dtype=np.int64)
+            for string_index in np.unique(room_strings[room_strings >= 0]):
+                room_of_place[room_strings == string_index] = room_index(store.get_string(string_index))
+            for index, room_id in store.room_parent_overrides.items():
+                room_of_place[index] = room_index(room_id)
+            positions = np.asarray(store.positions, dtype=np.float64)
+
+            # Each place counts an object once
+            object_places = np.repeat(np.arange(len(store), dtype=np.int64), np.diff(store.object_offsets))
+            num_strings = max(1, len(store.string_offsets) - 1)
+            place_object_pairs = np.unique(object_places * num_strings + np.asarray(store.object_ids, dtype=np.int64))
+            object_rooms = room_of_place[place_object_pairs // num_strings]
+            object_strings = place_object_pairs % num_strings
+            unique_strings, inverse = np.unique(object_strings, return_inverse=True)
+            object_ids = np.array([object_index(store.get_string(k)) for k in unique_strings], dtype=np.int64)[inverse] \
+                if len(unique_strings) > 0 else np.zeros(0, dtype=np.int64)
+        else:
+            room_of_place = np.full(len(place_ids), -1, dtype=np.int64)
+            positions = np.zeros((len(place_ids), 3), dtype=np.float64)
+            object_rooms = []
+            object_ids = []
+            for index, place_id in enumerate(place_ids):
+                place_node = place_nodes[place_id]
+                room_of_place[index] = room_index(place_node.room_parent)
+                positions[index] = place_node.position
+                if place_node.text_object_seen is not None:
+                    # Each place counts an object once
+                    for obj in dict.fromkeys(place_node.text_object_seen):
+                        object_rooms.append(room_of_place[index])
+                        object_ids.append(object_index(obj))
+            object_rooms = np.asarray(object_rooms, dtype=np.int64)
+            object_ids = np.asarray(object_ids, dtype=np.int64)
+
+        # Object occurrences of places without a room are not aggregated
+        assigned = object_rooms >= 0
+        return place_ids, room_ids, room_of_place, positions, object_rooms[assigned], object_ids[assigned], object_names
+
+
+    def load_place_nodes(self, b_run_RAM, b_load_pkl, num_workers=None, checkpoint_every=1000, storage_format="pickle"):
+        # storage_format "pickle" keeps place_nodes_<scene>.pkl, "columnar" uses the memory-mapped
+        # place_nodes_<scene>/ directory and returns a PlaceNodeStore of lazy PlaceNode views
+        from contextual_long_term_reasoning.place_node_store import PlaceNodeStore, place_node_store_exists, save_place_node_store
+
+        if storage_format not in ("pickle", "columnar"):
+            raise ValueError(f"Unknown storage format: {storage_format}. Expected 'pickle' or 'columnar'")
 
-    def load_place_nodes(self, b_run_RAM, b_load_pkl):
         # Creating new mem_nodes dictionary
+        place_nodes_path = self.state_dataset_dir + '/place_nodes_' + self.scene_name + '.pkl'
+        place_node_store_dir = self.state_dataset_dir + '/place_nodes_' + self.scene_name
 
-        if b_load_pkl:
+        if b_load_pkl and storage_format == "columnar" and place_node_store_exists(place_node_store_dir):
+            place_nodes = PlaceNodeStore(place_node_store_dir)
+            print(f"place_nodes opened from '{place_node_store_dir}' ({len(place_nodes)} nodes)")
+        elif b_load_pkl:
             # Load the mem_nodes object from a file
-            with open(self.state_dataset_dir + '/place_nodes_' + self.scene_name + '.pkl', 'rb') as f:
+            with open(place_nodes_path, 'rb') as f:
                 place_nodes = pickle.load(f)
             print("place_nodes loaded from 'place_nodes.pkl'")
+
+            if storage_format == "columnar":
+                # One-time conversion, later runs map the columnar store directly
+                save_place_node_store(place_nodes, place_node_store_dir)
+                place_nodes = PlaceNodeStore(place_node_store_dir)
+                print(f"place_nodes converted to '{place_node_store_dir}'")
         else:
-            place_nodes = {}
-
-            # if b_run_RAM:
-            #     recognize_anything_model = RecognizeAnything()
-
-            # Iterate through all pickle files in the directory
-            for file_name in sorted(os.listdir(self.state_dataset_path)):
-                if file_name.endswith('.pkl'):
-                    # Extract the file index from the file name
-                    file_index = int(file_name.split('.')[0])
-
-                    image_path = os.path.join(self.frames_dataset_path, f"{file_index:05}-rgb.png")
-
-                    # Check if the image file exists
-                    if not os.path.exists(image_path):
-                        continue
-
-                    # Check if the caption file exists
-                    if self.caption_dataset_dir:
-                        caption_path = os.path.join(self.caption_dataset_path, f"{file_index}.txt")
-                        if not os.path.exists(caption_path):
-                            continue
-
-                    # Load the pickle file
-                    pkl_data = self.open_pkl(self.scene_name, self.state_dataset_dir, file_index)
-
-                    # Check if pkl_data is valid
-                    if pkl_data:
-                        try:
-                            # Extract position and rotation
-                            position = pkl_data['agent_state'].position  # Assuming it's a numpy array
-                            rotation = pkl_data['agent_state'].rotation  # Assuming it's a quaternion object
-
-                            # Convert rotation to a quaternion tuple
-                            quaternion = (rotation.w, rotation.x, rotation.y, rotation.z)
-
-                            # Calculate yaw
-                            yaw = self.quaternion_to_yaw(quaternion)
-
-                            # Create a MemNode object
-                            node = PlaceNode(
-                                node_id=file_index,  # Use the file index as the node ID
-                                position=position.tolist(),  # Convert to a Python list
-                                orientation=quaternion,  # Quaternion as a tuple
-                                yaw=yaw
-                            )
-
-                            if b_run_RAM:
-                                if self.caption_dataset_dir is not None:
-                                    # Load the caption file
-                                    with open(caption_path, 'r') as caption_file:
-                                        caption_text = caption_file.read()
-                                        # The first line of the text goes to the contextual description
-                                        node.text_contextual_description = caption_text.split('\n')[0]
-                                        # The last line of the text after the 'Objects:' becomes a list of object (the object name is separated by a comma)
-                                        # Make all the text lower case first
-                                        caption_text = caption_text.lower()
-                                        object_text = caption_text.split('\n')[-1].split(':')[-1].strip().split(', ')
-                                        print(f"Recognized objects from caption: {object_text}")
-                                        node.text_object_seen = object_text
-                                else:
-                                    raise Exception("Caption dataset directory not provided")
-                                    object_text = self.recognize_anything_model.recognize(image_path)
-                                    # print(f"Recognized objects: {object_text}")
-                                    node.text_object_seen = object_text
-                            
-                            node.image_path = image_path
-
-                            # Add the node to the mem_nodes dictionary
-                            place_nodes[file_index] = node
-
-                            # print(f"Created mem_node with ID {node.node_id}.")
-                        except Exception as e:
-                            print(f"Error processing file {file_name}: {e}")
-                    else:
-                        print(f"Failed to load data from file {file_name}.")
+            if b_run_RAM and self.caption_dataset_dir is None and self.recognize_anything_model is None:
+                raise Exception("Caption dataset directory not provided")
+
+            place_nodes = self.ingest_place_nodes(b_run_RAM, num_workers, checkpoint_every)
+            if b_run_RAM and self.caption_dataset_dir is None:
+                # No captions: tag the frames with Recognize Anything instead
+                self.tag_place_nodes(place_nodes, num_workers=num_workers)
 
             # Output the results
             print(f"Total mem_nodes created: {len(place_nodes)}")
-            
-            # import pickle
 
-            # Save the mem_nodes object to a file
-            with open(self.state_dataset_dir + '/place_nodes_' + self.scene_name + '.pkl', 'wb') as f:
-                pickle.dump(place_nodes, f)
+            if storage_format == "columnar":
+                save_place_node_store(place_nodes, place_node_store_dir)
+                place_nodes = PlaceNodeStore(place_node_store_dir)
+                print(f"place_nodes saved to '{place_node_store_dir}'")
+            else:
+                # Save the mem_nodes object to a file
+                with open(place_nodes_path + '.tmp', 'wb') as f:
+                    pickle.dump(place_nodes, f)
+                os.replace(place_nodes_path + '.tmp', place_nodes_path)
+
+                print("place_nodes saved to 'place_nodes_" + self.scene_name + ".pkl'")
 
-            print("place_nodes saved to 'place_nodes_" + self.scene_name + ".pkl'")
+            # The episode is complete, the checkpoint is not needed to resume anymore
+            if os.path.isdir(self.partial_place_nodes_dir()):
+                shutil.rmtree(self.partial_place_nodes_dir())
 
         return place_nodes
-    
+
+    def partial_place_nodes_dir(self):
+        # Checkpoint of an interrupted ingestion: one pickle per chunk of ingested frames
+        return self.state_dataset_dir + '/place_nodes_' + self.scene_name + '.partial'
+
+    def load_partial_place_nodes(self):
+        place_nodes = {}
+        partial_dir = self.partial_place_nodes_dir()
+        if not os.path.isdir(partial_dir):
+            return place_nodes
+        for file_name in sorted(os.listdir(partial_dir)):
+            if not file_name.endswith('.pkl'):
+                continue
+            try:
+                with open(os.path.join(partial_dir, file_name), 'rb') as f:
+                    place_nodes.update(pickle.load(f))
+            except (EOFError, pickle.UnpicklingError) as e:
+                # Chunks are written atomically, but do not let one bad file block every later run
+                print(f"Ignoring the unreadable checkpoint {file_name} of {self.scene_name}: {e}")
+        return place_nodes
+
+    def save_partial_place_nodes(self, chunk):
+        # Appends a chunk, written to a temporary file first so a kill never leaves a truncated chunk
+        partial_dir = self.partial_place_nodes_dir()
+        os.makedirs(partial_dir, exist_ok=True)
+        num_chunks = len([file_name for file_name in os.listdir(partial_dir) if file_name.endswith('.pkl')])
+        chunk_path = os.path.join(partial_dir, f"chunk_{num_chunks:06}.pkl")
+        tmp_path = chunk_path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(chunk, f)
+        os.replace(tmp_path, chunk_path)
+
+    def ingest_place_nodes(self, b_run_RAM, num_workers=None, checkpoint_every=1000):
+        # Resume from the checkpoint of an interrupted ingestion of this episode
+        place_nodes = self.load_partial_place_nodes()
+        if len(place_nodes) > 0:
+            print(f"Resuming {self.scene_name}: {len(place_nodes)} place nodes already ingested")
+
+        # Batched existence checks: one directory listing instead of os.path.exists per frame
+        frame_file_names = set(os.listdir(self.frames_dataset_path)) if os.path.isdir(self.frames_dataset_path) else set()
+        caption_file_names = set()
+        if self.caption_dataset_dir and os.path.isdir(self.caption_dataset_path):
+            caption_file_names = set(os.listdir(self.caption_dataset_path))
+
+        jobs = []
+        for file_name in sorted(os.listdir(self.state_dataset_path)):
+            if not file_name.endswith('.pkl'):
+                continue
+            # Extract the file index from the file name
+            file_index = int(file_name.split('.')[0])
+            if file_index in place_nodes:
+                continue
+
+            # Check if the image file exists
+            if f"{file_index:05}-rgb.png" not in frame_file_names:
+                continue
+            image_path = os.path.join(self.frames_dataset_path, f"{file_index:05}-rgb.png")
+
+            # Check if the caption file exists
+            caption_path = None
+            if self.caption_dataset_dir:
+                if f"{file_index}.txt" not in caption_file_names:
+                    continue
+                caption_path = os.path.join(self.caption_dataset_path, f"{file_index}.txt")
+
+            state_path = os.path.join(self.state_dataset_path, file_name)
+            jobs.append((file_index, state_path, image_path, caption_path, b_run_RAM))
+
+        num_total = len(place_nodes) + len(jobs)
+        print(f"Ingesting {self.scene_name}: {len(jobs)} frames to process, {len(place_nodes)} already done")
+
+        if num_workers is None:
+            num_workers = os.cpu_count() or 1
+        progress_every = max(1, len(jobs) // 10)
+
+        def ingest(results):
+            # Only the nodes ingested since the last checkpoint are written, in a new chunk file
+            chunk = {}
+            for num_done, (file_index, node, error) in enumerate(results, start=1):
+                if error is not None:
+                    print(error)
+                else:
+                    place_nodes[file_index] = node
+                    chunk[file_index] = node
+
+                if num_done % checkpoint_every == 0 and len(chunk) > 0:
+                    self.save_partial_place_nodes(chunk)
+                    chunk = {}
+                if num_done % progress_every == 0 or num_done == len(jobs):
+                    print(f"Ingesting {self.scene_name}: {len(place_nodes)}/{num_total} place nodes")
+
+        if num_workers > 1 and len(jobs) > 1:
+            with ProcessPoolExecutor(max_workers=num_workers) as executor:
+                ingest(executor.map(load_place_node_from_frame, jobs, chunksize=max(1, min(64, len(jobs) // (4 * num_workers)))))
+        else:
+            ingest(map(load_place_node_from_frame, jobs))
+
+        # Keep the frame order regardless of the order in which frames were ingested
+        return dict(sorted(place_nodes.items()))
+
+    def tag_place_nodes(self, place_nodes, batch_size=16, num_workers=None):
+        # Batched RAM tagging of the places without objects. Tags are cached by image content,
+        # so re-ingesting an episode only runs the model on new frames.
+        untagged_ids = [place_id for place_id in place_nodes
+                        if not place_nodes[place_id].text_object_seen and place_nodes[place_id].image_path is not None]
+        if num_workers is None:
+            num_workers = min(4, os.cpu_count() or 1)
+        object_lists = self.recognize_anything_model.recognize_batch(
+            [place_nodes[place_id].image_path for place_id in untagged_ids], batch_size=batch_size, num_workers=num_workers)
+        for place_id, object_list in zip(untagged_ids, object_lists):
+            if object_list is not None:
+                place_nodes[place_id].text_object_seen = object_list
+        return place_nodes
+
+    def preencode_place_images(self, place_nodes, image_payload_cache, image_sizes=(512,), codec="png", quality=None):
+        # Encode every frame once at build time so vision queries only read the payload cache
+        image_paths = [place_nodes[place_id].image_path for place_id in place_nodes
+                       if place_nodes[place_id].image_path is not None]
+        return image_payload_cache.precompute(image_paths, image_sizes=image_sizes, codec=codec, quality=quality)
 
     def open_pkl(self, scene_name, state_dataset_dir, file_index=0):
         # Format the file index into a zero-padded string (e.g., 0 -> "00000")
@@ -319,11 +689,4 @@ class LoadingHabitatSceneGraph:
 
     
     def quaternion_to_yaw(self, quaternion):
-        """
-        Convert a quaternion to yaw angle in radians.
-        Assumes quaternion is in the form (w, x, y, z).
-        """
-        w, x, y, z = quaternion
-        t3 = 2.0 * (w * z + x * y)
-        t4 = 1.0 - 2.0 * (y * y + z * z)
-        return np.arctan2(t3, t4)
+        return quaternion_to_yaw(quaternion)
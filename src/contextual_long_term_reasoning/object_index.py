@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+
+"""Inverted index from object terms to where they were seen across the mind palace."""
+
+import difflib
+import re
+from collections import namedtuple
+from typing import Optional
+
+from contextual_long_term_reasoning.prompt_budget import STOPWORDS
+
+# episode_index is the position of the episode in the mind palace (0 = now, larger = further in the past),
+# the only time stamp the episodes carry. source is "object" (RAM tags) or "caption".
+ObjectPosting = namedtuple("ObjectPosting", ["episode", "episode_index", "room_id", "place_id", "source"])
+
+# Spelling variants and true synonyms folded onto one canonical term, so "couch" finds places tagged "sofa".
+# No hypernyms ("stool" is not a "chair"): a more general term is only found through the head noun match.
+OBJECT_SYNONYMS = {
+    "couch": "sofa", "settee": "sofa",
+    "tv": "television", "tv set": "television",
+    "fridge": "refrigerator",
+    "cellphone": "cell phone", "mobile phone": "cell phone",
+    "laptop computer": "laptop", "notebook computer": "laptop",
+    "trash can": "trash bin", "garbage can": "trash bin", "garbage bin": "trash bin", "wastebasket": "trash bin",
+    "wastepaper basket": "trash bin",
+    "book case": "bookcase", "book shelf": "bookshelf",
+    "nightstand": "night table", "night stand": "night table", "bedside table": "night table",
+    "house plant": "houseplant",
+}
+
+# Plurals that the suffix rules below get wrong
+IRREGULAR_LEMMAS = {
+    "shelves": "shelf", "knives": "knife", "leaves": "leaf", "children": "child", "people": "person",
+    "feet": "foot", "mice": "mouse", "glasses": "glass", "dishes": "dish", "boxes": "box", "clothes": "clothes",
+    "series": "series", "species": "species", "scissors": "scissors", "pants": "pants", "shorts": "shorts",
+}
+
+
+def lemmatize_word(word: str):
+    if word in IRREGULAR_LEMMAS:
+        return IRREGULAR_LEMMAS[word]
+    if len(word) <= 3 or word.endswith(("ss", "us", "is")):
+        return word
+    if word.endswith("ies"):
+        return word[:-3] + "y"
+    if word.endswith(("ches", "shes", "xes", "sses", "zes")):
+        return word[:-2]
+    if word.endswith("s"):
+        return word[:-1]
+    return word
+
+
+def normalize_object_term(text: str):
+    # "Orange Juices" -> "orange juice", "couches" -> "sofa"
+    words = [lemmatize_word(word) for word in re.findall(r"[a-z0-9]+", str(text).lower())]
+    term = " ".join(words)
+    return OBJECT_SYNONYMS.get(term, term)
+
+
+def caption_terms(text: str):
+    # Unigrams and bigrams of the content words of a caption
+    words = [lemmatize_word(word) for word in re.findall(r"[a-z0-9]+", str(text).lower())]
+    terms = set()
+    previous = None
+    for word in words:
+        if word in STOPWORDS or len(word) < 2:
+            previous = None
+            continue
+        terms.add(OBJECT_SYNONYMS.get(word, word))
+        if previous is not None:
+            bigram = previous + " " + word
+            terms.add(OBJECT_SYNONYMS.get(bigram, bigram))
+        previous = word
+    return terms
+
+
+def object_index_records(scene_graph, b_index_captions: bool = True):
+    # (term, room_id, place_id, source) rows of one scene graph, the input of ObjectIndex.add_records
+    records = []
+    for place_id in scene_graph.place_nodes:
+        place_node = scene_graph.place_nodes[place_id]
+        object_terms = {normalize_object_term(obj) for obj in (place_node.text_object_seen or [])}
+        object_terms.discard("")
+        for term in sorted(object_terms):
+            records.append((term, place_node.room_parent, place_id, "object"))
+        if b_index_captions and place_node.text_contextual_description:
+            for term in sorted(caption_terms(place_node.text_contextual_description) - object_terms):
+                records.append((term, place_node.room_parent, place_id, "caption"))
+    return records
+
+
+class ObjectIndex(object):
+    def __init__(self):
+        self.postings = {}  # term -> [ObjectPosting]
+        self.episodes = []
+
+    @classmethod
+    def from_mind_palace(cls, mind_palace: dict, b_index_captions: bool = True):
+        object_index = cls()
+        if hasattr(mind_palace, "episode_summary"):
+            # Lazy mind palace: per episode summaries (cached on disk) instead of loading every scene graph
+            for episode_index, episode in enumerate(mind_palace):
+                records = mind_palace.episode_summary(episode)["object_records"]
+                object_index.add_records(episode, episode_index, [record for record in records
+                                                                  if b_index_captions or record[3] != "caption"])
+            return object_index
+        for episode_index, (episode, scene_graph) in enumerate(mind_palace.items()):
+            object_index.add_scene_graph(episode, episode_index, scene_graph, b_index_captions)
+        return object_index
+
+    @classmethod
+    def from_scene_graph(cls, scene_graph, episode: str = "", b_index_captions: bool = True):
+        object_index = cls()
+        object_index.add_scene_graph(episode, 0, scene_graph, b_index_captions)
+        return object_index
+
+    def add_scene_graph(self, episode: str, episode_index: int, scene_graph, b_index_captions: bool = True):
+        self.add_records(episode, episode_index, object_index_records(scene_graph, b_index_captions))
+
+    def add_records(self, episode: str, episode_index: int, records):
+        # records: (term, room_id, place_id, source) rows of one episode, see object_index_records
+        self.episodes.append(episode)
+        for term, room_id, place_id, source in records:
+            self.postings.setdefault(term, []).append(ObjectPosting(episode, episode_index, room_id, place_id, source))
+
+    def __len__(self):
+        return len(self.postings)
+
+    def lookup(self, query: str, sources=("object", "caption")):
+        # Exact term first, then the head noun of a multi word query ("orange juice" -> "juice")
+        term = normalize_object_term(query)
+        postings = self.postings.get(term)
+        if not postings and " " in term:
+            postings = self.postings.get(term.split(" ")[-1])
+        return [posting for posting in (postings or []) if posting.source in sources]
+
+    def match(self, query: str, sources=("object", "caption"), fuzzy_cutoff: float = 0.85):
+        # [(posting, confidence)]: 1.0 for the exact term, 0.8 for the head noun, the similarity ratio times 0.9
+        # for the closest spelling ("mugs" ~ "mug" is handled by the lemmatizer, "tea kettle" ~ "teakettle" here).
+        # Caption hits count 0.8 of an object tag.
+        term = normalize_object_term(query)
+        if not term:
+            return []
+        matches = [(self.postings.get(term), 1.0)]
+        if " " in term:
+            matches.append((self.postings.get(term.split(" ")[-1]), 0.8))
+        if not any(postings for postings, _ in matches):
+            for close_term in difflib.get_close_matches(term, list(self.postings), n=3, cutoff=fuzzy_cutoff):
+                matches.append((self.postings[close_term], 0.9 * difflib.SequenceMatcher(None, term, close_term).ratio()))
+
+        confidences = {}
+        for postings, confidence in matches:
+            for posting in postings or []:
+                if posting.source in sources:
+                    source_confidence = confidence if posting.source == "object" else 0.8 * confidence
+                    confidences[posting] = max(confidences.get(posting, 0.0), source_confidence)
+        return sorted(confidences.items(), key=lambda item: -item[1])
+
+    def lookup_many(self, queries, sources=("object", "caption")):
+        if isinstance(queries, str):
+            queries = [queries]
+        postings = []
+        for query in queries:
+            postings.extend(self.lookup(query, sources))
+        return postings
+
+    def episode_counts(self, queries, sources=("object", "caption")):
+        # episode -> number of places where the object was seen, in mind palace order
+        counts = {}
+        for posting in self.lookup_many(queries, sources):
+            counts.setdefault(posting.episode, set()).add(posting.place_id)
+        return {episode: len(counts[episode]) for episode in self.episodes if episode in counts}
+
+    def room_counts(self, queries, episode: str, sources=("object", "caption")):
+        # room id -> number of places in that episode where the object was seen, most first
+        counts = {}
+        for posting in self.lookup_many(queries, sources):
+            if posting.episode == episode and posting.room_id is not None:
+                counts.setdefault(posting.room_id, set()).add(posting.place_id)
+        return dict(sorted(((room_id, len(places)) for room_id, places in counts.items()), key=lambda item: -item[1]))
+
+    def describe(self, queries, mind_palace: Optional[dict] = None, max_rooms: int = 3):
+        # Short text summary for prompts, e.g. "friday afternoon: 3 places (rooms kitchen (r2), ...)"
+        lines = []
+        for episode, num_places in self.episode_counts(queries).items():
+            room_texts = []
+            for room_id, room_places in list(self.room_counts(queries, episode).items())[:max_rooms]:
+                room_name = None
+                if mind_palace is not None and room_id in mind_palace[episode].room_nodes:
+                    room_name = mind_palace[episode].room_nodes[room_id].room_name
+                room_texts.append(f"{room_name} ({room_id}): {room_places}" if room_name else f"{room_id}: {room_places}")
+            lines.append(f"{episode}: {num_places} places (" + ", ".join(room_texts) + ")")
+        if len(lines) == 0:
+            return "The object was not recorded in any time instance."
+        return "\n".join(lines)
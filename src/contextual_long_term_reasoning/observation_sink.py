@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+
+"""Lazy image handles and a background writer for observation dumps and visualization."""
+
+import os
+import queue
+import shutil
+import threading
+from typing import List, Optional
+from PIL import Image
+
+
+class LazyImage(object):
+    # Stands in for a PIL image in the observation history; the file is only decoded on load()
+    __slots__ = ("path", "_image")
+
+    def __init__(self, path: str):
+        self.path = path
+        self._image = None
+
+    def __repr__(self):
+        return f"LazyImage({self.path!r})"
+
+    def load(self):
+        if self._image is None:
+            with Image.open(self.path) as image:
+                self._image = image.copy()
+        return self._image
+
+    @property
+    def size(self):
+        if self._image is not None:
+            return self._image.size
+        # Only reads the header
+        with Image.open(self.path) as image:
+            return image.size
+
+    def save(self, path: str):
+        # PNG frames are copied as they are instead of decoding and encoding them again
+        if self._image is None and os.path.splitext(self.path)[1].lower() == os.path.splitext(path)[1].lower():
+            shutil.copyfile(self.path, path)
+        else:
+            self.load().save(path)
+
+
+class ObservationSink(object):
+    # Saves and plots explored images on a background thread. The queue is bounded; when it is full new
+    # observations are dropped (b_block_when_full=False) so exploration never waits for the disk.
+    def __init__(self, output_dir: str = "../examples/", b_save_images: bool = True, b_plot_grid: bool = True,
+                 max_queue_size: int = 32, b_block_when_full: bool = False):
+        self.output_dir = output_dir
+        self.b_save_images = b_save_images
+        self.b_plot_grid = b_plot_grid
+        self.b_block_when_full = b_block_when_full
+
+        self.queue = queue.Queue(maxsize=max_queue_size)
+        self.thread = None
+        self._lock = threading.Lock()
+
+        self.num_saved = 0
+        self.num_grids = 0
+        self.num_dropped = 0
+        self.num_failed = 0
+
+    def start(self):
+        with self._lock:
+            if self.thread is None:
+                os.makedirs(self.output_dir, exist_ok=True)
+                self.thread = threading.Thread(target=self.run, name="observation_sink", daemon=True)
+                self.thread.start()
+
+    def submit(self, images: List[LazyImage], label: Optional[str] = None):
+        self.start()
+        try:
+            self.queue.put((list(images), label), block=self.b_block_when_full)
+        except queue.Full:
+            # Producers are the exploration threads, the counters are shared with the writer thread
+            with self._lock:
+                self.num_dropped += 1
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            try:
+                if item is None:
+                    return
+                images, label = item
+                self.write(images, label)
+            except Exception as e:
+                with self._lock:
+                    self.num_failed += 1
+                print(f"ObservationSink: {type(e).__name__}: {e}")
+            finally:
+                self.queue.task_done()
+
+    def write(self, images: List[LazyImage], label: Optional[str]):
+        if self.b_save_images:
+            for image in images:
+                image.save(os.path.join(self.output_dir, f"{self.num_saved:06d}.png"))
+                with self._lock:
+                    self.num_saved += 1
+
+        if self.b_plot_grid and len(images) > 0:
+            # Object oriented matplotlib API with the Agg canvas: no pyplot state, safe off the main thread
+            from matplotlib.figure import Figure
+            from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+            figure = Figure(figsize=(12, 12))
+            FigureCanvasAgg(figure)
+            axs = figure.subplots(1, len(images), squeeze=False)[0]
+            for image, ax in zip(images, axs):
+                ax.axis("off")  # Hide axes
+                ax.imshow(image.load())  # Display image
+            if label:
+                figure.suptitle(label)
+            figure.tight_layout()
+            figure.savefig(os.path.join(self.output_dir, f"grid_{self.num_grids:06d}.png"))
+            with self._lock:
+                self.num_grids += 1
+
+    def flush(self):
+        # Blocks until everything submitted so far is written
+        if self.thread is not None:
+            self.queue.join()
+
+    def close(self):
+        if self.thread is not None:
+            self.queue.put(None)
+            self.thread.join()
+            self.thread = None
+
+    def print_stats(self):
+        with self._lock:
+            print(f"ObservationSink: {self.num_saved} images saved, {self.num_grids} grids, "
+                  f"{self.num_dropped} observations dropped, {self.num_failed} failed")
@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+
+"""Shared OpenAI client backend with concurrency limit, rate limiting and retries."""
+
+import asyncio
+import os
+import random
+import threading
+import time
+import weakref
+from typing import Optional
+import openai
+
+# Rough per-image token cost of a gpt-4o vision input (85 base + 4 tiles of 170)
+IMAGE_TOKEN_ESTIMATE = 765
+
+
+def estimate_request_tokens(messages: list, max_tokens: int):
+    # Providers count prompt tokens plus the requested completion budget against the TPM limit
+    num_chars = 0
+    num_images = 0
+    for message in messages:
+        content = message["content"]
+        if isinstance(content, str):
+            num_chars += len(content)
+            continue
+        for part in content:
+            if part.get("type") == "text":
+                num_chars += len(part["text"])
+            elif part.get("type") == "image_url":
+                num_images += 1
+    return num_chars // 4 + num_images * IMAGE_TOKEN_ESTIMATE + max_tokens
+
+
+class TokenBucket(object):
+    def __init__(self, capacity_per_minute: float):
+        self.capacity = float(capacity_per_minute)
+        self.refill_per_second = self.capacity / 60.0
+        self.tokens = self.capacity
+        self.last_refill = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, amount: float):
+        # Take the tokens right away (the balance may go negative) and return how long the
+        # caller has to wait before its reservation is covered. Callers are served in order.
+        amount = min(float(amount), self.capacity)
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.last_refill) * self.refill_per_second)
+            self.last_refill = now
+            self.tokens -= amount
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.refill_per_second
+
+
+class OpenAIBackend(object):
+    def __init__(self, max_concurrency: int = 8,
+                 requests_per_minute: Optional[float] = None,
+                 tokens_per_minute: Optional[float] = None,
+                 max_retries: int = 6,
+                 backoff_base: float = 1.0,
+                 backoff_max: float = 60.0,
+                 timeout: float = 120.0,
+                 base_url: Optional[str] = None):
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.timeout = timeout
+        self.base_url = base_url
+
+        self.request_bucket = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.token_bucket = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+
+        # One client per process keeps the HTTP connection pool alive across calls
+        self._client = None
+        self._client_lock = threading.Lock()
+        self._sync_semaphore = threading.BoundedSemaphore(max_concurrency)
+
+        # asyncio primitives and the async http pool are bound to the event loop that uses them. Weak keys, and
+        # closed loops (e.g. after each asyncio.run) are dropped so their clients and connection pools go with them.
+        self._async_clients = weakref.WeakKeyDictionary()
+        self._async_semaphores = weakref.WeakKeyDictionary()
+
+    @classmethod
+    def from_env(cls):
+        def env_float(name):
+            value = os.environ.get(name)
+            return float(value) if value else None
+
+        return cls(
+            max_concurrency=int(os.environ.get("OPENAI_MAX_CONCURRENCY", "8")),
+            requests_per_minute=env_float("OPENAI_REQUESTS_PER_MINUTE"),
+            tokens_per_minute=env_float("OPENAI_TOKENS_PER_MINUTE"),
+            base_url=os.environ.get("OPENAI_BASE_URL"),
+        )
+
+    def client(self):
+        with self._client_lock:
+            if self._client is None:
+                # Retries are handled here so they share the rate limiter
+                self._client = openai.OpenAI(api_key=openai.api_key, base_url=self.base_url,
+                                             max_retries=0, timeout=self.timeout)
+            return self._client
+
+    def async_client(self):
+        loop = asyncio.get_running_loop()
+        with self._client_lock:
+            for closed_loop in [other for other in list(self._async_clients) if other.is_closed()]:
+                del self._async_clients[closed_loop]
+                del self._async_semaphores[closed_loop]
+            if loop not in self._async_clients:
+                self._async_clients[loop] = openai.AsyncOpenAI(api_key=openai.api_key, base_url=self.base_url,
+                                                               max_retries=0, timeout=self.timeout)
+                self._async_semaphores[loop] = asyncio.Semaphore(self.max_concurrency)
+            return self._async_clients[loop], self._async_semaphores[loop]
+
+    def rate_limit_delay(self, request: dict):
+        delay = 0.0
+        if self.request_bucket is not None:
+            delay = max(delay, self.request_bucket.reserve(1))
+        if self.token_bucket is not None:
+            num_tokens = estimate_request_tokens(request["messages"], request.get("max_tokens") or 0)
+            delay = max(delay, self.token_bucket.reserve(num_tokens))
+        return delay
+
+    def is_retryable(self, error: Exception):
+        if isinstance(error, openai.APIConnectionError):  # Includes timeouts
+            return True
+        if isinstance(error, openai.APIStatusError):
+            return error.status_code == 429 or error.status_code >= 500
+        return False
+
+    def backoff_delay(self, attempt: int, error: Exception):
+        # Full jitter exponential backoff, never shorter than what the server asked for
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        response = getattr(error, "response", None)
+        if response is not None:
+            try:
+                delay = max(delay, float(response.headers.get("retry-after", 0)))
+            except (TypeError, ValueError):
+                pass
+        return delay
+
+    def create_chat_completion(self, **request):
+        attempt = 0
+        while True:
+            time.sleep(self.rate_limit_delay(request))
+            try:
+                with self._sync_semaphore:
+                    return self.client().chat.completions.create(**request)
+            except Exception as e:
+                if not self.is_retryable(e) or attempt >= self.max_retries:
+                    raise e
+                delay = self.backoff_delay(attempt, e)
+                print(f"OpenAIBackend: {type(e).__name__}, retrying in {delay:.1f}s ({attempt + 1}/{self.max_retries})")
+                time.sleep(delay)
+                attempt += 1
+
+    async def acreate_chat_completion(self, **request):
+        client, semaphore = self.async_client()
+        attempt = 0
+        while True:
+            await asyncio.sleep(self.rate_limit_delay(request))
+            try:
+                async with semaphore:
+                    return await client.chat.completions.create(**request)
+            except Exception as e:
+                if not self.is_retryable(e) or attempt >= self.max_retries:
+                    raise e
+                delay = self.backoff_delay(attempt, e)
+                print(f"OpenAIBackend: {type(e).__name__}, retrying in {delay:.1f}s ({attempt + 1}/{self.max_retries})")
+                await asyncio.sleep(delay)
+                attempt += 1
+
+
+_shared_backend = None
+_shared_backend_lock = threading.Lock()
+
+
+def get_shared_backend():
+    global _shared_backend
+    with _shared_backend_lock:
+        if _shared_backend is None:
+            _shared_backend = OpenAIBackend.from_env()
+        return _shared_backend
+
+
+def configure_shared_backend(**kwargs):
+    # Replaces the backend used by every OpenAIInterface created without an explicit one
+    global _shared_backend
+    with _shared_backend_lock:
+        _shared_backend = OpenAIBackend(**kwargs)
+        return _shared_backend
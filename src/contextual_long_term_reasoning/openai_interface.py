@@ -4,15 +4,24 @@
 
 import json
 import os
-from typing import Optional
-import os
+import time
 from typing import List, Optional
 import openai
-import cv2
-import base64
+from contextual_long_term_reasoning.response_cache import ResponseCache
+from contextual_long_term_reasoning.openai_backend import OpenAIBackend, get_shared_backend
+from contextual_long_term_reasoning.image_payload_cache import ImagePayloadCache, get_shared_image_payload_cache
+from contextual_long_term_reasoning.llm_telemetry import LLMTelemetry, get_shared_telemetry
 
 class OpenAIInterface(object):
-    def __init__(self, openai_key: Optional[str] = None):
+    def __init__(self, openai_key: Optional[str] = None, response_cache: Optional[ResponseCache] = None,
+                 backend: Optional[OpenAIBackend] = None,
+                 image_payload_cache: Optional[ImagePayloadCache] = None,
+                 telemetry: Optional[LLMTelemetry] = None):
+        # Without an explicit cache, OPENAI_RESPONSE_CACHE_DIR/_MODE/_MAX_MB configure one
+        self.response_cache = response_cache if response_cache is not None else ResponseCache.from_env()
+        # Without an explicit backend, all interfaces share one client and rate limiter
+        self.backend = backend
+        self.telemetry = telemetry if telemetry is not None else get_shared_telemetry()
         self.set_openai_key(key=openai_key)
         self.openai_model = "gpt-4o"
         self.openai_vision_model = "gpt-4o"
@@ -21,9 +30,17 @@ class OpenAIInterface(object):
         self.openai_temperature = 0.2
         self.image_size = 512
         self.image_size_large = 1920
+        # Encoded frames are reused across the vision calls of a question and across questions
+        self.image_codec = "png"  # png, jpeg or webp
+        self.image_quality = None  # jpeg/webp quality 0-100, codec default if None
+        self.image_payload_cache = image_payload_cache if image_payload_cache is not None else get_shared_image_payload_cache()
+        self.image_encoding_workers = 4
 
     def set_openai_key(self, key: Optional[str] = None):
         if key is None:
+            if self.response_cache is not None and self.response_cache.mode == "replay" and "OPENAI_API_KEY" not in os.environ:
+                # Replay-only runs never reach the network
+                return
             assert "OPENAI_API_KEY" in os.environ
             key = os.environ["OPENAI_API_KEY"]
         openai.api_key = key
@@ -36,20 +53,101 @@ class OpenAIInterface(object):
         messages: list,
         vision_query: bool = False,
         verbose: bool = False,
+        call_site: str = "unlabeled",
     ):
-        client = openai.OpenAI()
-        open_ai_model = self.openai_vision_model if vision_query else self.openai_model
-        completion = client.chat.completions.create(
-            model=open_ai_model,
-            messages=messages,
-            seed=self.openai_seed,
-            max_tokens=self.openai_max_tokens,
-            temperature=self.openai_temperature,
-        )
+        start_time = time.perf_counter()
+        request = self.prepare_openai_request(messages, vision_query)
+        try:
+            cache_key, cached_entry = self.lookup_cached_response(request, verbose)
+            if cached_entry is not None:
+                self.record_telemetry(call_site, request, cached_entry.get("usage"), start_time, cached=True)
+                return cached_entry["content"]
+
+            completion = self.get_backend().create_chat_completion(**request)
+        except Exception as e:
+            # Failed calls count too (error rate and time lost per call site)
+            self.record_telemetry(call_site, request, None, start_time, cached=False, error=type(e).__name__)
+            raise e
+        return self.process_completion(request, completion, cache_key, verbose, call_site, start_time)
+
+    async def acall_openai_api(
+        self,
+        messages: list,
+        vision_query: bool = False,
+        verbose: bool = False,
+        call_site: str = "unlabeled",
+    ):
+        start_time = time.perf_counter()
+        request = self.prepare_openai_request(messages, vision_query)
+        try:
+            cache_key, cached_entry = self.lookup_cached_response(request, verbose)
+            if cached_entry is not None:
+                self.record_telemetry(call_site, request, cached_entry.get("usage"), start_time, cached=True)
+                return cached_entry["content"]
+
+            completion = await self.get_backend().acreate_chat_completion(**request)
+        except Exception as e:
+            # Failed calls count too (error rate and time lost per call site)
+            self.record_telemetry(call_site, request, None, start_time, cached=False, error=type(e).__name__)
+            raise e
+        return self.process_completion(request, completion, cache_key, verbose, call_site, start_time)
+
+    def get_backend(self):
+        # Resolved per call so configure_shared_backend also applies to existing interfaces
+        return self.backend if self.backend is not None else get_shared_backend()
+
+    def prepare_openai_request(self, messages: list, vision_query: bool = False):
+        return {
+            "model": self.openai_vision_model if vision_query else self.openai_model,
+            "messages": messages,
+            "seed": self.openai_seed,
+            "max_tokens": self.openai_max_tokens,
+            "temperature": self.openai_temperature,
+        }
+
+    def lookup_cached_response(self, request: dict, verbose: bool = False):
+        if self.response_cache is None:
+            return None, None
+        cache_key = self.response_cache.make_key(request["model"], request["seed"], request["temperature"],
+                                                 request["max_tokens"], request["messages"])
+        cached_entry = self.response_cache.lookup(cache_key)
+        if cached_entry is not None and verbose:
+            print("openai api cached response: {}".format(cached_entry))
+        return cache_key, cached_entry
+
+    def process_completion(self, request: dict, completion, cache_key: Optional[str] = None, verbose: bool = False,
+                           call_site: str = "unlabeled", start_time: Optional[float] = None):
         if verbose:
             print("openai api response: {}".format(completion))
         assert len(completion.choices) == 1
-        return completion.choices[0].message.content
+        content = completion.choices[0].message.content
+
+        usage = None
+        if completion.usage is not None:
+            usage = {"prompt_tokens": completion.usage.prompt_tokens,
+                     "completion_tokens": completion.usage.completion_tokens}
+        if start_time is not None:
+            self.record_telemetry(call_site, request, usage, start_time, cached=False)
+
+        if cache_key is not None:
+            self.response_cache.store(cache_key, {"model": request["model"], "content": content, "usage": usage})
+        return content
+
+    def record_telemetry(self, call_site: str, request: dict, usage: Optional[dict], start_time: float, cached: bool,
+                         error: Optional[str] = None):
+        if self.telemetry is None:
+            return
+        usage = usage or {}
+        self.telemetry.record(
+            call_site=call_site,
+            model=request["model"],
+            prompt_tokens=usage.get("prompt_tokens") or 0,
+            completion_tokens=usage.get("completion_tokens") or 0,
+            latency_s=time.perf_counter() - start_time,
+            messages=request["messages"],
+            cached=cached,
+            error=error,
+        )
     
     def answer_to_json(self, answer: str):
         # Replace single quotes with double quotes for JSON parsing
@@ -63,10 +161,10 @@ class OpenAIInterface(object):
 
         return json_object
     
-    def query_llm(self, prompt: str, answer_field: str):
+    def query_llm(self, prompt: str, answer_field: str, call_site: str = "query_llm"):
         try:
             messages = self.prepare_openai_messages(prompt)
-            output = self.call_openai_api(messages=messages)
+            output = self.call_openai_api(messages=messages, call_site=call_site)
             print("Output: \n\n", output)
 
             json_object = self.answer_to_json(output)
@@ -82,7 +180,9 @@ class OpenAIInterface(object):
         post_image_prompt: str,
         image_paths: Optional[List[str]] = None,
         bool_image_resize_small: bool = True,
+        return_image_failures: bool = False,
     ):
+        # With return_image_failures, returns (messages, [(path, reason)] of the images left out of the message)
         if image_paths is None:
             image_paths = []
 
@@ -96,20 +196,18 @@ class OpenAIInterface(object):
         else:
             image_size = self.image_size_large
 
+        image_failures = []
         if len(image_paths) > 0:
-            for path in image_paths:
-                frame = cv2.imread(path)
-                if frame is None:
-                    # print(f"Error: Unable to read image at {path}")
+            image_payloads = self.image_payload_cache.get_many(image_paths, image_size, self.image_codec, self.image_quality,
+                                                               num_workers=self.image_encoding_workers)
+            for path, image_url, error in image_payloads:
+                if image_url is None:
+                    print(f"OpenAIInterface: Unable to use image {path}: {error}")
+                    image_failures.append((path, error))
                     continue
-                if image_size:
-                    factor = image_size / max(frame.shape[:2])
-                    frame = cv2.resize(frame, dsize=None, fx=factor, fy=factor)
-                _, buffer = cv2.imencode(".png", frame)
-                frame = base64.b64encode(buffer).decode("utf-8")
                 content.append(
                     {
-                        "image_url": {"url": f"data:image/png;base64,{frame}"},
+                        "image_url": {"url": image_url},
                         "type": "image_url",
                     }
                 )
@@ -117,4 +215,7 @@ class OpenAIInterface(object):
         if post_image_prompt:
             content.append({"text": post_image_prompt, "type": "text"})
 
-        return [{"role": "user", "content": content}]
\ No newline at end of file
+        messages = [{"role": "user", "content": content}]
+        if return_image_failures:
+            return messages, image_failures
+        return messages
\ No newline at end of file
@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+
+"""Columnar, memory-mapped storage of place nodes with lazy PlaceNode views."""
+
+import json
+import os
+from collections.abc import Mapping
+import numpy as np
+
+from contextual_long_term_reasoning.mind_palace_generation import PlaceNode
+
+PLACE_NODE_STORE_VERSION = 1
+
+# Column files of a store directory, all opened with mmap_mode="r"
+PLACE_NODE_STORE_COLUMNS = (
+    "node_ids",             # int64 (N,)
+    "positions",            # float64 (N, 3)
+    "orientations",         # float64 (N, 4), quaternion (w, x, y, z)
+    "yaws",                 # float64 (N,)
+    "room_parents",         # int32 (N,), index into the string table, -1 for None
+    "image_paths",          # int32 (N,), index into the string table, -1 for None
+    "descriptions",         # int32 (N,), index into the string table, -1 for None
+    "object_offsets",       # int64 (N + 1,), CSR row offsets into object_ids
+    "object_ids",           # int32 (M,), index into the string table
+    "has_objects",          # bool (N,), False when text_object_seen is None
+    "string_offsets",       # int64 (S + 1,), byte offsets into string_blob
+    "string_blob",          # uint8, utf-8 encoded interned strings
+)
+
+
+class StringTableBuilder(object):
+    def __init__(self):
+        self.index = {}
+        self.strings = []
+
+    def intern(self, text):
+        if text is None:
+            return -1
+        text = str(text)
+        if text not in self.index:
+            self.index[text] = len(self.strings)
+            self.strings.append(text)
+        return self.index[text]
+
+    def to_arrays(self):
+        encoded = [text.encode("utf-8") for text in self.strings]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        if encoded:
+            offsets[1:] = np.cumsum([len(data) for data in encoded])
+        blob = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+        return offsets, blob
+
+
+def save_place_node_store(place_nodes, store_dir):
+    # Writes the place nodes as column files; each file is replaced atomically
+    strings = StringTableBuilder()
+    num_nodes = len(place_nodes)
+
+    node_ids = np.zeros(num_nodes, dtype=np.int64)
+    positions = np.zeros((num_nodes, 3), dtype=np.float64)
+    orientations = np.zeros((num_nodes, 4), dtype=np.float64)
+    yaws = np.zeros(num_nodes, dtype=np.float64)
+    room_parents = np.full(num_nodes, -1, dtype=np.int32)
+    image_paths = np.full(num_nodes, -1, dtype=np.int32)
+    descriptions = np.full(num_nodes, -1, dtype=np.int32)
+    object_offsets = np.zeros(num_nodes + 1, dtype=np.int64)
+    has_objects = np.zeros(num_nodes, dtype=bool)
+    object_ids = []
+
+    for index, (place_id, place_node) in enumerate(place_nodes.items()):
+        node_ids[index] = place_id
+        positions[index] = place_node.position
+        orientations[index] = place_node.orientation
+        yaws[index] = place_node.yaw
+        room_parents[index] = strings.intern(place_node.room_parent)
+        image_paths[index] = strings.intern(place_node.image_path)
+        descriptions[index] = strings.intern(place_node.text_contextual_description)
+        if place_node.text_object_seen is not None:
+            has_objects[index] = True
+            object_ids.extend(strings.intern(obj) for obj in place_node.text_object_seen)
+        object_offsets[index + 1] = len(object_ids)
+
+    string_offsets, string_blob = strings.to_arrays()
+    columns = {
+        "node_ids": node_ids,
+        "positions": positions,
+        "orientations": orientations,
+        "yaws": yaws,
+        "room_parents": room_parents,
+        "image_paths": image_paths,
+        "descriptions": descriptions,
+        "object_offsets": object_offsets,
+        "object_ids": np.asarray(object_ids, dtype=np.int32),
+        "has_objects": has_objects,
+        "string_offsets": string_offsets,
+        "string_blob": string_blob,
+    }
+
+    os.makedirs(store_dir, exist_ok=True)
+    for name, array in columns.items():
+        tmp_path = os.path.join(store_dir, f"{name}.{os.getpid()}.tmp.npy")
+        np.save(tmp_path, array)
+        os.replace(tmp_path, os.path.join(store_dir, name + ".npy"))
+
+    # The metadata is written last and marks the store as complete
+    meta = {"version": PLACE_NODE_STORE_VERSION, "num_nodes": num_nodes, "num_strings": len(strings.strings)}
+    tmp_path = os.path.join(store_dir, f"meta.{os.getpid()}.tmp.json")
+    with open(tmp_path, "w") as f:
+        json.dump(meta, f)
+    os.replace(tmp_path, os.path.join(store_dir, "meta.json"))
+
+
+def place_node_store_exists(store_dir):
+    return os.path.exists(os.path.join(store_dir, "meta.json"))
+
+
+class PlaceNodeView(object):
+    # Read-only view of one row of a PlaceNodeStore; only room_parent can be reassigned
+    __slots__ = ("_store", "_index")
+
+    def __init__(self, store, index):
+        self._store = store
+        self._index = index
+
+    def __reduce__(self):
+        return PlaceNodeView, (self._store, self._index)
+
+    @property
+    def node_id(self):
+        return int(self._store.node_ids[self._index])
+
+    @property
+    def position(self):
+        return self._store.positions[self._index].tolist()
+
+    @property
+    def orientation(self):
+        return tuple(self._store.orientations[self._index].tolist())
+
+    @property
+    def yaw(self):
+        return self._store.yaws[self._index]
+
+    @property
+    def room_parent(self):
+        return self._store.get_room_parent(self._index)
+
+    @room_parent.setter
+    def room_parent(self, room_id):
+        self._store.room_parent_overrides[self._index] = room_id
+        self._store.room_version += 1
+
+    @property
+    def image_path(self):
+        return self._store.get_string(self._store.image_paths[self._index])
+
+    @property
+    def text_contextual_description(self):
+        return self._store.get_string(self._store.descriptions[self._index])
+
+    @property
+    def text_object_seen(self):
+        return self._store.get_objects(self._index)
+
+    # Unused PlaceNode fields, kept so views can stand in for PlaceNode everywhere
+    @property
+    def image(self):
+        return None
+
+    @property
+    def node_type(self):
+        return None
+
+    @property
+    def relevant_docs(self):
+        return None
+
+    print_info = PlaceNode.print_info
+    print_info_2 = PlaceNode.print_info_2
+
+    def to_place_node(self):
+        place_node = PlaceNode(self.node_id, self.position, self.orientation, self.yaw)
+        place_node.room_parent = self.room_parent
+        place_node.image_path = self.image_path
+        place_node.text_object_seen = self.text_object_seen
+        place_node.text_contextual_description = self.text_contextual_description
+        return place_node
+
+
+class PlaceNodeStore(Mapping):
+    # node_id -> PlaceNodeView, in the order the nodes were saved. Columns are memory-mapped,
+    # so opening is O(1) and worker processes share the pages through the OS page cache.
+    def __init__(self, store_dir):
+        self.store_dir = store_dir
+        with open(os.path.join(store_dir, "meta.json"), "r") as f:
+            self.meta = json.load(f)
+        if self.meta.get("version") != PLACE_NODE_STORE_VERSION:
+            raise ValueError(f"Unsupported place node store version {self.meta.get('version')} in {store_dir}")
+
+        for name in PLACE_NODE_STORE_COLUMNS:
+            setattr(self, name, np.load(os.path.join(store_dir, name + ".npy"), mmap_mode="r"))
+
+        # Room assignments made after loading (load_room_nodes) live in memory only
+        self.room_parent_overrides = {}
+        self.room_version = 0  # bumped on every room reassignment, lets derived indexes detect staleness
+        self._row_of_node_id = None
+        self._string_cache = {}
+
+    def __reduce__(self):
+        # Pickling sends the directory, not the data; the receiver maps the same files
+        return _reopen_place_node_store, (self.store_dir, self.room_parent_overrides)
+
+    def row_of_node_id(self):
+        if self._row_of_node_id is None:
+            self._row_of_node_id = {int(node_id): index for index, node_id in enumerate(self.node_ids)}
+        return self._row_of_node_id
+
+    def __getitem__(self, node_id):
+        index = self.row_of_node_id()[node_id]
+        return PlaceNodeView(self, index)
+
+    def __contains__(self, node_id):
+        return node_id in self.row_of_node_id()
+
+    def __iter__(self):
+        return iter(self.row_of_node_id())
+
+    def __len__(self):
+        return len(self.node_ids)
+
+    def get_string(self, string_index):
+        string_index = int(string_index)
+        if string_index < 0:
+            return None
+        text = self._string_cache.get(string_index)
+        if text is None:
+            start, end = self.string_offsets[string_index], self.string_offsets[string_index + 1]
+            text = self.string_blob[start:end].tobytes().decode("utf-8")
+            self._string_cache[string_index] = text
+        return text
+
+    def get_room_parent(self, index):
+        if index in self.room_parent_overrides:
+            return self.room_parent_overrides[index]
+        return self.get_string(self.room_parents[index])
+
+    def get_objects(self, index):
+        if not self.has_objects[index]:
+            return None
+        start, end = self.object_offsets[index], self.object_offsets[index + 1]
+        return [self.get_string(string_index) for string_index in self.object_ids[start:end]]
+
+    def to_place_nodes(self):
+        # Materialize regular PlaceNode objects, e.g. to edit them
+        return {node_id: self[node_id].to_place_node() for node_id in self}
+
+
+def _reopen_place_node_store(store_dir, room_parent_overrides):
+    store = PlaceNodeStore(store_dir)
+    store.room_parent_overrides = dict(room_parent_overrides)
+    return store
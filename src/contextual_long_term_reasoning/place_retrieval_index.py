@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+
+"""Hashed TF-IDF vector index over place captions and object lists for top-k place retrieval."""
+
+import hashlib
+import os
+import zlib
+import numpy as np
+
+from contextual_long_term_reasoning.object_index import caption_terms, normalize_object_term
+
+PLACE_RETRIEVAL_INDEX_VERSION = 1
+
+
+def place_document_terms(place_node):
+    # Object tags count twice: they are the most reliable description of what is in the frame
+    terms = []
+    for obj in place_node.text_object_seen or []:
+        term = normalize_object_term(obj)
+        if term:
+            terms.extend([term, term])
+            terms.extend(term.split(" ") if " " in term else [])
+    if place_node.text_contextual_description:
+        terms.extend(caption_terms(place_node.text_contextual_description))
+    return terms
+
+
+def query_terms(query):
+    # query is a question string, an object name or a list of object names
+    if isinstance(query, (list, tuple)):
+        terms = []
+        for item in query:
+            terms.extend(query_terms(item))
+        return terms
+    terms = list(caption_terms(query))
+    term = normalize_object_term(query)
+    if term and term not in terms:
+        terms.append(term)
+    return terms
+
+
+class HashedTfidfVectorizer(object):
+    # Feature hashing (crc32, stable across processes) with sublinear tf and idf fitted on the places
+    def __init__(self, num_features: int = 1024):
+        self.num_features = num_features
+        self.idf = np.ones(num_features, dtype=np.float32)
+
+    def hash_term(self, term: str):
+        return zlib.crc32(term.encode("utf-8")) % self.num_features
+
+    def term_counts(self, terms):
+        counts = {}
+        for term in terms:
+            feature = self.hash_term(term)
+            counts[feature] = counts.get(feature, 0) + 1
+        return counts
+
+    def fit_transform(self, documents):
+        # documents: list of term lists. Returns a contiguous (N, D) float32 matrix of unit rows.
+        counts = [self.term_counts(terms) for terms in documents]
+        document_frequency = np.zeros(self.num_features, dtype=np.float64)
+        for document_counts in counts:
+            document_frequency[list(document_counts)] += 1
+        self.idf = (np.log((1.0 + len(documents)) / (1.0 + document_frequency)) + 1.0).astype(np.float32)
+        return self.transform_counts(counts)
+
+    def transform(self, documents):
+        return self.transform_counts([self.term_counts(terms) for terms in documents])
+
+    def transform_counts(self, counts):
+        matrix = np.zeros((len(counts), self.num_features), dtype=np.float32)
+        for row, document_counts in enumerate(counts):
+            if document_counts:
+                features = np.fromiter(document_counts.keys(), dtype=np.int64)
+                values = np.fromiter(document_counts.values(), dtype=np.float32)
+                matrix[row, features] = (1.0 + np.log(values)) * self.idf[features]
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        np.divide(matrix, norms, out=matrix, where=norms > 0)
+        return matrix
+
+
+class PlaceRetrievalIndex(object):
+    def __init__(self, num_features: int = 1024):
+        self.vectorizer = HashedTfidfVectorizer(num_features)
+        self.place_ids = []
+        self.room_of_place = np.zeros(0, dtype=object)
+        self.matrix = np.zeros((0, num_features), dtype=np.float32)
+        self.row_of_place = {}
+
+    @classmethod
+    def from_place_nodes(cls, place_nodes, num_features: int = 1024):
+        index = cls(num_features)
+        index.place_ids = list(place_nodes)
+        index.room_of_place = np.array([place_nodes[place_id].room_parent for place_id in index.place_ids], dtype=object)
+        index.matrix = np.ascontiguousarray(
+            index.vectorizer.fit_transform([place_document_terms(place_nodes[place_id]) for place_id in index.place_ids]))
+        index.row_of_place = {place_id: row for row, place_id in enumerate(index.place_ids)}
+        return index
+
+    @staticmethod
+    def signature(place_nodes, num_features: int = 1024):
+        digest = hashlib.sha1(repr((PLACE_RETRIEVAL_INDEX_VERSION, num_features)).encode("utf-8"))
+        for place_id in place_nodes:
+            place_node = place_nodes[place_id]
+            digest.update(repr((place_id, place_node.room_parent, place_node.text_object_seen,
+                                place_node.text_contextual_description)).encode("utf-8"))
+        return digest.hexdigest()
+
+    def save(self, path, signature: str):
+        tmp_path = f"{path}.{os.getpid()}.tmp.npz"
+        np.savez(tmp_path, signature=np.array(signature), place_ids=np.asarray(self.place_ids, dtype=np.int64),
+                 room_of_place=np.array([str(room_id) if room_id is not None else "" for room_id in self.room_of_place]),
+                 matrix=self.matrix, idf=self.vectorizer.idf)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path, signature: str):
+        # Returns None when the file is missing or was built from different places
+        if not os.path.exists(path):
+            return None
+        try:
+            with np.load(path) as data:
+                if str(data["signature"]) != signature:
+                    return None
+                index = cls(data["matrix"].shape[1])
+                index.place_ids = data["place_ids"].tolist()
+                index.room_of_place = np.array([room_id if room_id else None for room_id in data["room_of_place"].tolist()], dtype=object)
+                index.matrix = np.ascontiguousarray(data["matrix"], dtype=np.float32)
+                index.vectorizer.idf = data["idf"].astype(np.float32)
+        except (OSError, KeyError, ValueError):
+            return None
+        index.row_of_place = {place_id: row for row, place_id in enumerate(index.place_ids)}
+        return index
+
+    def search_many(self, queries, k: int = 10, room_id=None, exclude_place_ids=()):
+        # One matrix product for all queries. Returns, per query, [(place_id, score)] best first.
+        rows = np.arange(len(self.place_ids))
+        if room_id is not None:
+            rows = np.flatnonzero(self.room_of_place == room_id)
+        if len(exclude_place_ids) > 0:
+            excluded = {self.row_of_place[place_id] for place_id in exclude_place_ids if place_id in self.row_of_place}
+            rows = np.array([row for row in rows if row not in excluded], dtype=np.int64)
+        if len(rows) == 0:
+            return [[] for _ in queries]
+
+        query_matrix = self.vectorizer.transform([query_terms(query) for query in queries])
+        scores = query_matrix @ self.matrix[rows].T
+        k = min(k, len(rows))
+        results = []
+        for query_scores in scores:
+            top = np.argpartition(-query_scores, k - 1)[:k] if k < len(rows) else np.arange(len(rows))
+            # Highest score first, ties keep the place order
+            top = top[np.lexsort((rows[top], -query_scores[top]))]
+            results.append([(self.place_ids[rows[i]], float(query_scores[i])) for i in top])
+        return results
+
+    def search(self, query, k: int = 10, room_id=None, exclude_place_ids=()):
+        return self.search_many([query], k, room_id, exclude_place_ids)[0]
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+
+"""Token-budgeted assembly of scene graph context for room and place prompts."""
+
+import re
+from typing import Optional
+
+try:
+    import tiktoken
+except ImportError:  # Optional: fall back to a local approximation
+    tiktoken = None
+
+STOPWORDS = {
+    "a", "an", "the", "of", "in", "on", "at", "to", "for", "and", "or", "with", "is", "are", "was", "were",
+    "do", "did", "does", "we", "i", "you", "my", "our", "it", "this", "that", "there", "where", "what",
+    "which", "who", "how", "when", "can", "be", "have", "has", "had", "now", "some", "something", "used",
+    "use", "from", "by", "as", "any", "if", "so", "left", "put", "place", "placed",
+}
+
+
+def text_terms(text: str):
+    terms = set()
+    for word in re.findall(r"[a-z0-9]+", str(text).lower()):
+        if word in STOPWORDS or len(word) < 2:
+            continue
+        terms.add(word)
+        # Cheap plural folding so "mugs" matches "mug"
+        if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+            terms.add(word[:-1])
+    return terms
+
+
+class PromptBudget(object):
+    def __init__(self, max_prompt_tokens: int = 4000, summary_share: float = 0.25, room_summary_share: float = 0.1,
+                 max_objects_per_room: int = 40, tokenizer_encoding: str = "o200k_base"):
+        # Per-call budget for the whole prompt; the fixed instructions are measured and subtracted
+        self.max_prompt_tokens = max_prompt_tokens
+        self.summary_share = summary_share
+        self.room_summary_share = room_summary_share
+        self.max_objects_per_room = max_objects_per_room
+
+        self.encoding = None
+        if tiktoken is not None:
+            try:
+                self.encoding = tiktoken.get_encoding(tokenizer_encoding)
+            except Exception:
+                self.encoding = None
+
+    def count_tokens(self, text: str):
+        if self.encoding is not None:
+            return len(self.encoding.encode(text, disallowed_special=()))
+        # Word pieces and punctuation, about 1.1 BPE tokens per word for English prompts
+        return int(len(re.findall(r"\w+|[^\w\s]", text)) * 1.1) + 1
+
+    def fit_summary(self, summary: list, budget_tokens: int):
+        # Keep the most recent entries that fit; the list format matches str(summary)
+        kept = []
+        used_tokens = 0
+        for entry in reversed(summary):
+            entry_tokens = self.count_tokens(str(entry))
+            if used_tokens + entry_tokens > budget_tokens:
+                break
+            kept.append(entry)
+            used_tokens += entry_tokens
+        kept.reverse()
+        num_omitted = len(summary) - len(kept)
+        if num_omitted > 0:
+            return f"({num_omitted} earlier entries omitted) " + str(kept)
+        return str(kept)
+
+    def rank_objects(self, objects: Optional[list], query_terms: set):
+        # Objects sharing a term with the query first, otherwise keep the original order
+        if not objects:
+            return [], 0
+        relevant = [obj for obj in objects if text_terms(obj) & query_terms]
+        others = [obj for obj in objects if not (text_terms(obj) & query_terms)]
+        return relevant + others, len(relevant)
+
+    def fit_room_listing(self, scene_graph, query_text: str, budget_tokens: int, explored_room_ids=()):
+        query_terms = text_terms(query_text)
+        room_scores = {}
+        room_objects = {}
+        for room_id, room_node in scene_graph.room_nodes.items():
+            ranked_objects, num_relevant = self.rank_objects(room_node.text_object_seen, query_terms)
+            room_objects[room_id] = ranked_objects
+            name_match = len(text_terms(room_node.room_name) & query_terms)
+            # Relevance first, rooms we already explored in this episode last
+            room_scores[room_id] = (room_id not in explored_room_ids, num_relevant + 2 * name_match)
+
+        def build(room_ids, max_objects):
+            objects = {room_id: room_objects[room_id][:max_objects] for room_id in room_ids}
+            return scene_graph.print_room_nodes(room_ids=set(room_ids), room_objects=objects)
+
+        room_ids = list(scene_graph.room_nodes.keys())
+        text_output = build(room_ids, self.max_objects_per_room)
+        if self.count_tokens(text_output) <= budget_tokens:
+            return text_output
+
+        # Shrink the object lists first so every room stays selectable
+        low, high = 0, self.max_objects_per_room
+        while low < high:
+            middle = (low + high + 1) // 2
+            if self.count_tokens(build(room_ids, middle)) <= budget_tokens:
+                low = middle
+            else:
+                high = middle - 1
+        text_output = build(room_ids, low)
+
+        # Then drop the least relevant rooms
+        ranked_room_ids = sorted(room_ids, key=lambda room_id: room_scores[room_id], reverse=True)
+        while len(ranked_room_ids) > 1 and self.count_tokens(text_output) > budget_tokens:
+            ranked_room_ids.pop()
+            text_output = build(ranked_room_ids, low)
+        return text_output
+
+    def fit_place_listing(self, scene_graph, room_id: str, query_text: str, budget_tokens: int, explored_place_ids=(),
+                          candidate_place_ids=None):
+        # candidate_place_ids restricts the listing, e.g. to the top-k of a retrieval index
+        query_terms = text_terms(query_text)
+        place_ids = [place_id for place_id in scene_graph.place_nodes
+                     if scene_graph.place_nodes[place_id].room_parent == room_id
+                     and (candidate_place_ids is None or place_id in candidate_place_ids)]
+
+        def score(place_id):
+            place_node = scene_graph.place_nodes[place_id]
+            terms = text_terms(" ".join(place_node.text_object_seen or [])) | text_terms(place_node.text_contextual_description or "")
+            return (place_id not in explored_place_ids, len(terms & query_terms))
+
+        # Greedily add places by relevance while the listing fits, then print them in their original order
+        kept_place_ids = set()
+        used_tokens = 0
+        for place_id in sorted(place_ids, key=score, reverse=True):
+            place_tokens = self.count_tokens(scene_graph.print_place_node(place_id))
+            if used_tokens + place_tokens > budget_tokens and len(kept_place_ids) > 0:
+                break
+            kept_place_ids.add(place_id)
+            used_tokens += place_tokens
+        return scene_graph.print_place_nodes(room_id=room_id, place_ids=kept_place_ids)
+
+    def fit_room_prompt(self, build_prompt, scene_graph, query_text: str, S_exploration_summary: list,
+                        S_room_exploration_summary: list, explored_room_ids=()):
+        # build_prompt(room_listing, exploration_summary, room_exploration_summary) -> prompt string
+        template_tokens = self.count_tokens(build_prompt("", "", ""))
+        budget_tokens = max(0, self.max_prompt_tokens - template_tokens)
+
+        exploration_summary = self.fit_summary(S_exploration_summary, int(budget_tokens * self.summary_share))
+        room_exploration_summary = self.fit_summary(S_room_exploration_summary, int(budget_tokens * self.room_summary_share))
+        # Whatever the summaries leave unused goes to the room listing
+        listing_budget = budget_tokens - self.count_tokens(exploration_summary) - self.count_tokens(room_exploration_summary)
+        room_listing = self.fit_room_listing(scene_graph, query_text, listing_budget, explored_room_ids)
+        return build_prompt(room_listing, exploration_summary, room_exploration_summary)
+
+    def fit_place_prompt(self, build_prompt, scene_graph, room_id: str, query_text: str, explored_place_ids=(),
+                         candidate_place_ids=None):
+        # build_prompt(place_listing) -> prompt string
+        template_tokens = self.count_tokens(build_prompt(""))
+        budget_tokens = max(0, self.max_prompt_tokens - template_tokens)
+        place_listing = self.fit_place_listing(scene_graph, room_id, query_text, budget_tokens, explored_place_ids,
+                                               candidate_place_ids)
+        return build_prompt(place_listing)
@@ -1,28 +1,253 @@
 #!/usr/bin/env python3
 
 """Recognize Anything Model interface."""
+import hashlib
+import json
+import os
+import threading
+from typing import Iterable, List, Optional
 from PIL import Image
 from ram.models import ram
 from ram import inference_ram as inference
 from ram import get_transform
 import torch
+from torch.utils.data import DataLoader, Dataset
 import numpy as np
 
+
+def filter_tags(tag_text: str):
+    object_list = tag_text.split(' | ')
+    filtered_object_list = []
+    for obj in object_list:
+        if obj == 'kitchen' or 'room' in obj:
+            continue
+        filtered_object_list.append(obj)
+    return filtered_object_list
+
+
+def image_content_hash(image_path: str):
+    # Tags depend on the pixels only, so renamed or copied frames hit the cache too
+    digest = hashlib.sha1()
+    with open(image_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class RAMTagCache(object):
+    # Image content hash -> tag list, in memory and optionally on disk (one small JSON file per image)
+    def __init__(self, cache_dir: Optional[str] = None, model_signature: str = ""):
+        self.cache_dir = cache_dir
+        self.model_signature = model_signature
+        self._memory = {}
+        self._lock = threading.Lock()
+        self.stats_hits = 0
+        self.stats_misses = 0
+        if self.cache_dir is not None:
+            os.makedirs(self.cache_dir, exist_ok=True)
+
+    @classmethod
+    def from_env(cls, model_signature: str = ""):
+        return cls(cache_dir=os.environ.get("RAM_TAG_CACHE_DIR") or None, model_signature=model_signature)
+
+    def key(self, content_hash: str):
+        return hashlib.sha1((self.model_signature + "|" + content_hash).encode("utf-8")).hexdigest()
+
+    def key_path(self, key: str):
+        return os.path.join(self.cache_dir, key[:2], key + ".json")
+
+    def get(self, content_hash: str):
+        key = self.key(content_hash)
+        with self._lock:
+            if key in self._memory:
+                self.stats_hits += 1
+                return self._memory[key]
+        if self.cache_dir is not None:
+            try:
+                with open(self.key_path(key), 'r') as f:
+                    tags = json.load(f)
+                with self._lock:
+                    self._memory[key] = tags
+                    self.stats_hits += 1
+                return tags
+            except (OSError, ValueError):
+                pass
+        with self._lock:
+            self.stats_misses += 1
+        return None
+
+    def put(self, content_hash: str, tags: List[str]):
+        key = self.key(content_hash)
+        with self._lock:
+            self._memory[key] = tags
+        if self.cache_dir is not None:
+            path = self.key_path(key)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(tags, f)
+            os.replace(tmp_path, path)
+
+
+class ImagePathDataset(Dataset):
+    # Decodes and transforms frames in DataLoader worker processes
+    def __init__(self, image_paths: List[str], transform):
+        self.image_paths = image_paths
+        self.transform = transform
+
+    def __len__(self):
+        return len(self.image_paths)
+
+    def __getitem__(self, index):
+        try:
+            image = self.transform(Image.open(self.image_paths[index]).convert('RGB'))
+            return image, index
+        except Exception as e:
+            print(f"RecognizeAnything: Could not read {self.image_paths[index]}: {e}")
+            return None, index
+
+
+def collate_images(batch):
+    # Drops unreadable frames; returns (images tensor or None, indices)
+    images = [image for image, _ in batch if image is not None]
+    indices = [index for image, index in batch if image is not None]
+    if len(images) == 0:
+        return None, indices
+    return torch.stack(images), indices
+
+
+RAM_BACKENDS = ("torch", "int8", "onnx")
+
+
+class RAMTagLogits(torch.nn.Module):
+    # The tensor part of ram.models.RAM.generate_tag (image -> tag logits), which is what gets exported to ONNX.
+    # Thresholding and the tag names stay in Python, see decode_tags.
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, images):
+        model = self.model
+        label_embed = torch.nn.functional.relu(model.wordvec_proj(model.label_embed))
+        image_embeds = model.image_proj(model.visual_encoder(images))
+        image_atts = torch.ones(image_embeds.size()[:-1], dtype=torch.long, device=images.device)
+        label_embed = label_embed.unsqueeze(0).repeat(images.shape[0], 1, 1)
+        tagging_embed = model.tagging_head(encoder_embeds=label_embed, encoder_hidden_states=image_embeds,
+                                           encoder_attention_mask=image_atts, return_dict=False, mode='tagging')
+        return model.fc(tagging_embed[0]).squeeze(-1)
+
+
+def decode_tags(model, logits: np.ndarray):
+    # Same decision rule as generate_tag: per class threshold on the sigmoid, deleted tags removed
+    probabilities = 1.0 / (1.0 + np.exp(-logits))
+    tags = probabilities > model.class_threshold.detach().cpu().numpy()
+    tags[:, model.delete_tag_index] = False
+    return [' | '.join(model.tag_list[np.flatnonzero(row)]) for row in tags]
+
+
+def export_ram_onnx(model, onnx_path: str, image_size: int = 384, opset_version: int = 17):
+    os.makedirs(os.path.dirname(os.path.abspath(onnx_path)), exist_ok=True)
+    dummy_images = torch.zeros(1, 3, image_size, image_size)
+    tmp_path = f"{onnx_path}.{os.getpid()}.tmp"
+    with torch.inference_mode():
+        torch.onnx.export(RAMTagLogits(model).eval(), dummy_images, tmp_path, input_names=['images'],
+                          output_names=['logits'], dynamic_axes={'images': {0: 'batch'}, 'logits': {0: 'batch'}},
+                          opset_version=opset_version)
+    os.replace(tmp_path, onnx_path)
+    print(f"RecognizeAnything: exported ONNX model to {onnx_path}")
+
+
 class RecognizeAnything(object):
-    def __init__(self):
-        self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
-        self.transform = get_transform(image_size=384)
-        self.model = ram(pretrained='TODO', image_size=384, vit='swin_l')
+    # backend "torch" runs the full precision model (GPU when available), "int8" applies dynamic int8
+    # quantization to the linear layers and "onnx" runs an exported graph with ONNX Runtime. The last
+    # two are CPU paths; num_threads fixes the intra-op thread count so tagging does not oversubscribe the host.
+    def __init__(self, tag_cache: Optional[RAMTagCache] = None, backend: str = "torch", num_threads: Optional[int] = None,
+                 pretrained: str = 'TODO', onnx_path: Optional[str] = None, image_size: int = 384):
+        if backend not in RAM_BACKENDS:
+            raise ValueError(f"Unknown RAM backend: {backend}. Expected one of {RAM_BACKENDS}")
+        self.backend = backend
+        self.num_threads = num_threads
+        if num_threads is not None:
+            torch.set_num_threads(num_threads)
+
+        self.device = torch.device('cuda' if torch.cuda.is_available() and backend == "torch" else 'cpu')
+        self.transform = get_transform(image_size=image_size)
+        self.model = ram(pretrained=pretrained, image_size=image_size, vit='swin_l')
         self.model.eval()
         self.model = self.model.to(self.device)
 
+        self.onnx_session = None
+        if backend == "int8":
+            self.model = torch.quantization.quantize_dynamic(self.model, {torch.nn.Linear}, dtype=torch.qint8)
+        elif backend == "onnx":
+            import onnxruntime
+
+            if onnx_path is None:
+                onnx_path = os.path.splitext(pretrained)[0] + ".onnx"
+            if not os.path.exists(onnx_path):
+                export_ram_onnx(self.model, onnx_path, image_size)
+            session_options = onnxruntime.SessionOptions()
+            if num_threads is not None:
+                session_options.intra_op_num_threads = num_threads
+                session_options.inter_op_num_threads = 1
+            self.onnx_session = onnxruntime.InferenceSession(onnx_path, session_options, providers=['CPUExecutionProvider'])
+
+        if tag_cache is None:
+            tag_cache = RAMTagCache.from_env(model_signature=f"ram_swin_l_{image_size}_{backend}")
+        self.tag_cache = tag_cache
+
     def recognize(self, image_path):
         image = self.transform(Image.open(image_path)).unsqueeze(0).to(self.device)
+        if self.backend == "onnx":
+            return filter_tags(self.generate_tags(image)[0])
         res = inference(image, self.model)
-        object_list = res[0].split(' | ')
-        filtered_object_list = []
-        for obj in object_list:
-            if obj == 'kitchen' or 'room' in obj:
+        return filter_tags(res[0])
+
+    def generate_tags(self, images):
+        # images: (B, 3, H, W) tensor. Returns the raw ' | ' separated tag string per image.
+        if self.onnx_session is not None:
+            logits = self.onnx_session.run(['logits'], {'images': images.cpu().numpy()})[0]
+            return decode_tags(self.model, logits)
+        with torch.inference_mode():
+            tags, _ = self.model.generate_tag(images.to(self.device))
+        return list(tags)
+
+    def recognize_batch(self, image_paths: Iterable[str], batch_size: int = 16, num_workers: int = 4,
+                        b_use_cache: bool = True):
+        # Returns the filtered object list per path (None for unreadable frames), in input order.
+        # Frames whose content was tagged before are served from the tag cache.
+        image_paths = list(image_paths)
+        results = [None] * len(image_paths)
+
+        content_hashes = [None] * len(image_paths)
+        pending = []
+        for index, image_path in enumerate(image_paths):
+            if b_use_cache and self.tag_cache is not None:
+                try:
+                    content_hashes[index] = image_content_hash(image_path)
+                except OSError as e:
+                    print(f"RecognizeAnything: Could not read {image_path}: {e}")
+                    continue
+                tags = self.tag_cache.get(content_hashes[index])
+                if tags is not None:
+                    results[index] = tags
+                    continue
+            pending.append(index)
+
+        print(f"RecognizeAnything: {len(image_paths) - len(pending)}/{len(image_paths)} frames from the tag cache, "
+              f"tagging {len(pending)}")
+        if len(pending) == 0:
+            return results
+
+        data_loader = DataLoader(ImagePathDataset([image_paths[index] for index in pending], self.transform),
+                                 batch_size=batch_size, num_workers=num_workers, collate_fn=collate_images,
+                                 pin_memory=self.device.type == 'cuda')
+        for images, batch_indices in data_loader:
+            if images is None:
                 continue
-            filtered_object_list.append(obj)
-        return filtered_object_list
\ No newline at end of file
+            for batch_index, tag_text in zip(batch_indices, self.generate_tags(images)):
+                index = pending[batch_index]
+                results[index] = filter_tags(tag_text)
+                if content_hashes[index] is not None:
+                    self.tag_cache.put(content_hashes[index], results[index])
+        return results
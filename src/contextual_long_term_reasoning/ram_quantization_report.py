@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+
+"""Accuracy vs throughput of the RAM tagger backends on a sample of benchmark frames.
+
+The full precision torch model is the reference: each backend is scored by the precision, recall and F1
+of its tags against the reference tags of the same frame, and timed on the same frames with the tag cache
+off. Example:
+
+    python -m contextual_long_term_reasoning.ram_quantization_report --frames-dir <frames> \\
+        --pretrained ram_swin_large_14m.pth --backends torch int8 onnx --num-threads 4
+"""
+
+import argparse
+import glob
+import json
+import os
+import time
+import numpy as np
+
+from contextual_long_term_reasoning.ram_interface import RAM_BACKENDS, RecognizeAnything
+
+
+def sample_frames(frames_dir: str, num_frames: int):
+    # Evenly spaced over the episode(s) so the sample covers all the rooms
+    image_paths = sorted(glob.glob(os.path.join(frames_dir, "**", "*-rgb.png"), recursive=True))
+    if len(image_paths) <= num_frames:
+        return image_paths
+    return [image_paths[i] for i in np.linspace(0, len(image_paths) - 1, num_frames).astype(int)]
+
+
+def tag_agreement(reference_tags, tags):
+    # Mean per frame precision, recall and F1 of tags against the reference tags
+    precisions, recalls, f1_scores = [], [], []
+    for reference, predicted in zip(reference_tags, tags):
+        if reference is None or predicted is None:
+            continue
+        reference, predicted = set(reference), set(predicted)
+        num_common = len(reference & predicted)
+        precision = num_common / len(predicted) if predicted else float(not reference)
+        recall = num_common / len(reference) if reference else float(not predicted)
+        precisions.append(precision)
+        recalls.append(recall)
+        f1_scores.append(2 * precision * recall / (precision + recall) if precision + recall > 0 else 0.0)
+    if len(f1_scores) == 0:
+        return 0.0, 0.0, 0.0
+    return float(np.mean(precisions)), float(np.mean(recalls)), float(np.mean(f1_scores))
+
+
+def run_backend(backend, image_paths, args):
+    recognize_anything = RecognizeAnything(backend=backend, num_threads=args.num_threads, pretrained=args.pretrained,
+                                           onnx_path=args.onnx_path)
+    # Warm up (allocations, ONNX Runtime graph optimization) outside of the timing
+    recognize_anything.recognize_batch(image_paths[:args.batch_size], batch_size=args.batch_size,
+                                       num_workers=args.num_workers, b_use_cache=False)
+    start_time = time.perf_counter()
+    tags = recognize_anything.recognize_batch(image_paths, batch_size=args.batch_size, num_workers=args.num_workers,
+                                              b_use_cache=False)
+    elapsed = time.perf_counter() - start_time
+    return tags, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Accuracy vs throughput of the RAM tagger backends.")
+    parser.add_argument("--frames-dir", required=True, help="Directory with <index>-rgb.png frames, searched recursively")
+    parser.add_argument("--pretrained", required=True, help="RAM swin_l checkpoint")
+    parser.add_argument("--backends", nargs="+", default=list(RAM_BACKENDS), choices=RAM_BACKENDS)
+    parser.add_argument("--num-frames", type=int, default=200)
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--num-workers", type=int, default=2, help="DataLoader decode workers")
+    parser.add_argument("--num-threads", type=int, default=None, help="Intra-op threads of the model")
+    parser.add_argument("--onnx-path", default=None, help="Exported model, created when missing")
+    parser.add_argument("--output", default=None, help="Also write the report as JSON")
+    args = parser.parse_args()
+
+    image_paths = sample_frames(args.frames_dir, args.num_frames)
+    if len(image_paths) == 0:
+        raise SystemExit(f"No frames found in {args.frames_dir}")
+    print(f"RAM report: {len(image_paths)} frames from {args.frames_dir}")
+
+    # The reference always runs first, on the same thread count as the other backends
+    backends = ["torch"] + [backend for backend in args.backends if backend != "torch"]
+    reference_tags = None
+    rows = []
+    for backend in backends:
+        tags, elapsed = run_backend(backend, image_paths, args)
+        if reference_tags is None:
+            reference_tags = tags
+        precision, recall, f1_score = tag_agreement(reference_tags, tags)
+        rows.append({"backend": backend, "frames_per_second": len(image_paths) / elapsed,
+                     "seconds_per_frame": elapsed / len(image_paths),
+                     "precision": precision, "recall": recall, "f1": f1_score})
+
+    print(f"{'backend':<8} {'frames/s':>10} {'ms/frame':>10} {'precision':>10} {'recall':>10} {'f1':>10}")
+    for row in rows:
+        print(f"{row['backend']:<8} {row['frames_per_second']:>10.2f} {1000 * row['seconds_per_frame']:>10.1f} "
+              f"{row['precision']:>10.3f} {row['recall']:>10.3f} {row['f1']:>10.3f}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"frames_dir": args.frames_dir, "num_frames": len(image_paths), "batch_size": args.batch_size,
+                       "num_threads": args.num_threads, "results": rows}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
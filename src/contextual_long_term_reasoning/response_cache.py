@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+
+"""Persistent content-addressed cache for OpenAI chat completion responses."""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Optional
+
+
+class ResponseCacheMiss(KeyError):
+    pass
+
+
+class ResponseCache(object):
+    # record: serve hits from disk, call the API on a miss and store the response
+    # replay: serve hits from disk, raise ResponseCacheMiss on a miss (no network)
+    # bypass: always call the API, never read or write the cache
+    MODES = ("record", "replay", "bypass")
+
+    def __init__(self, cache_dir: str, mode: str = "record", max_size_mb: float = 512.0):
+        if mode not in self.MODES:
+            raise ValueError(f"Unknown response cache mode: {mode}. Expected one of {self.MODES}")
+        self.cache_dir = cache_dir
+        self.mode = mode
+        self.max_size_bytes = int(max_size_mb * 1024 * 1024)
+
+        self.stats_hits = 0
+        self.stats_misses = 0
+        self._lock = threading.Lock()
+        self._size_bytes = None  # Scanned lazily on the first store
+
+        if self.mode != "bypass":
+            os.makedirs(self.cache_dir, exist_ok=True)
+
+    @classmethod
+    def from_env(cls):
+        # OPENAI_RESPONSE_CACHE_DIR enables the cache for every OpenAIInterface
+        cache_dir = os.environ.get("OPENAI_RESPONSE_CACHE_DIR")
+        if not cache_dir:
+            return None
+        mode = os.environ.get("OPENAI_RESPONSE_CACHE_MODE", "record")
+        max_size_mb = float(os.environ.get("OPENAI_RESPONSE_CACHE_MAX_MB", "512"))
+        return cls(cache_dir, mode=mode, max_size_mb=max_size_mb)
+
+    def make_key(self, model: str, seed, temperature, max_tokens, messages: list):
+        # The messages carry the base64 image payloads, so the image bytes are part of the key
+        normalized_request = {
+            "model": model,
+            "seed": seed,
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+            "messages": self.normalize_messages(messages),
+        }
+        serialized = json.dumps(normalized_request, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+        return hashlib.sha256(serialized.encode("utf-8")).hexdigest()
+
+    def normalize_messages(self, messages: list):
+        normalized = []
+        for message in messages:
+            content = message["content"]
+            if isinstance(content, str):
+                # A plain string and a single text part are the same request
+                content = [{"type": "text", "text": content}]
+            parts = []
+            for part in content:
+                if part.get("type") == "text":
+                    parts.append({"type": "text", "text": part["text"].strip()})
+                else:
+                    parts.append(part)
+            normalized.append({"role": message["role"], "content": parts})
+        return normalized
+
+    def key_path(self, key: str):
+        return os.path.join(self.cache_dir, key[:2], key + ".json")
+
+    def lookup(self, key: str) -> Optional[dict]:
+        if self.mode == "bypass":
+            return None
+
+        path = self.key_path(key)
+        try:
+            with open(path, "r") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            entry = None
+
+        if entry is None:
+            with self._lock:
+                self.stats_misses += 1
+            if self.mode == "replay":
+                raise ResponseCacheMiss(f"No cached response for request {key} in replay mode ({self.cache_dir})")
+            return None
+
+        # Touch the entry so eviction follows least recent use
+        try:
+            now = time.time()
+            os.utime(path, (now, now))
+        except OSError:
+            pass
+        with self._lock:
+            self.stats_hits += 1
+        return entry
+
+    def store(self, key: str, entry: dict):
+        if self.mode != "record":
+            return
+
+        path = self.key_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temporary file first so concurrent readers never see a partial entry
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(entry, f)
+
+        with self._lock:
+            # An overwritten entry gives its size back
+            old_size = os.path.getsize(path) if os.path.exists(path) else 0
+            new_size = os.path.getsize(tmp_path)
+            os.replace(tmp_path, path)
+            if self._size_bytes is None:
+                self._size_bytes = sum(size for _, size, _ in self.scan_entries())
+            else:
+                self._size_bytes += new_size - old_size
+            b_over_budget = self._size_bytes > self.max_size_bytes
+        if b_over_budget:
+            self.evict()
+
+    def scan_entries(self):
+        entries = []
+        for root, _, file_names in os.walk(self.cache_dir):
+            for file_name in file_names:
+                if not file_name.endswith(".json"):
+                    continue
+                path = os.path.join(root, file_name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def evict(self):
+        with self._lock:
+            entries = self.scan_entries()
+            total_size = sum(size for _, size, _ in entries)
+
+            # Drop the least recently used entries until we are below 90% of the budget
+            target_size = int(self.max_size_bytes * 0.9)
+            for _, size, path in sorted(entries):
+                if total_size <= target_size:
+                    break
+                try:
+                    os.remove(path)
+                    total_size -= size
+                except OSError:
+                    pass
+            self._size_bytes = total_size
+
+    def print_stats(self):
+        print(f"ResponseCache ({self.mode}): {self.stats_hits} hits, {self.stats_misses} misses")
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+
+"""Expected search distance room planner: branch and bound over visiting orders with vectorized leaves."""
+
+from typing import List, Optional
+import numpy as np
+
+
+class ExpectedCostRoomPlanner(object):
+    # Picks the next room to search by minimizing the expected walking distance until the object is found,
+    # looking `depth` rooms ahead. For a visiting order r_1..r_d with cumulative distances C_k from the robot:
+    #   cost = sum_k S_(k-1) h_k C_k + S_d failure_cost,   S_k = prod_(j<=k) (1 - h_j)
+    # where h_k is the probability that the object is in r_k given it was not in the rooms before.
+    # With b_mutually_exclusive the probabilities are normalized and the object is in exactly one room
+    # (h_k = p_k / remaining mass), otherwise h_k = p_k and failure_cost is paid when all d rooms fail.
+    def __init__(self, depth: int = 3):
+        self.depth = depth
+        self.stats_nodes = 0
+        self.stats_pruned = 0
+
+    def plan(self, start_distances, room_distances, probabilities, failure_cost: float = 0.0,
+             b_mutually_exclusive: bool = False, depth: Optional[int] = None):
+        # start_distances (n,), room_distances (n, n), probabilities (n,).
+        # Returns (visiting order as indices, expected cost). Ties go to the lexicographically first order.
+        start_distances = np.asarray(start_distances, dtype=np.float64)
+        room_distances = np.asarray(room_distances, dtype=np.float64)
+        probabilities = np.clip(np.asarray(probabilities, dtype=np.float64), 0.0, 1.0)
+        num_rooms = len(probabilities)
+        if num_rooms == 0:
+            return [], 0.0
+        depth = min(depth or self.depth, num_rooms)
+        if b_mutually_exclusive:
+            total = probabilities.sum()
+            probabilities = probabilities / total if total > 0 else np.full(num_rooms, 1.0 / num_rooms)
+
+        self.stats_nodes = 0
+        self.stats_pruned = 0
+        # Shortest hop out of every room, for the lower bound of the unexplored part of an order
+        off_diagonal = room_distances + np.diag(np.full(num_rooms, np.inf))
+        min_hop = off_diagonal.min(axis=1) if num_rooms > 1 else np.zeros(1)
+        min_hop = np.where(np.isfinite(min_hop), min_hop, 0.0)
+
+        # The greedy order bounds the search from the start (with slack for the rounding of the summation order)
+        greedy_order = self.greedy_order(start_distances, room_distances, probabilities, depth)
+        greedy_cost = self.order_cost(greedy_order, start_distances, room_distances, probabilities, failure_cost,
+                                      b_mutually_exclusive)
+        best = {"cost": greedy_cost + 1e-9 * (1.0 + abs(greedy_cost)), "order": None}
+
+        def hazards(candidates, mass):
+            if not b_mutually_exclusive:
+                return probabilities[candidates]
+            return np.minimum(probabilities[candidates] / mass, 1.0) if mass > 1e-12 else np.ones(len(candidates))
+
+        def update_best(leaf_cost, leaf_order):
+            if leaf_cost < best["cost"] or (best["order"] is None and leaf_cost <= best["cost"]):
+                best["cost"] = float(leaf_cost)
+                best["order"] = leaf_order
+
+        def search(order, visited, cost, survival, distance, mass):
+            last = order[-1] if order else None
+            candidates = np.flatnonzero(~visited)
+            step = start_distances[candidates] if last is None else room_distances[last, candidates]
+            hazard = hazards(candidates, mass)
+            distance_next = distance + step
+
+            if len(order) == depth - 1:
+                # Leaves: all last rooms at once
+                self.stats_nodes += len(candidates)
+                costs = cost + survival * (hazard * distance_next + (1.0 - hazard) * failure_cost)
+                leaf = int(np.argmin(costs))
+                update_best(costs[leaf], order + [int(candidates[leaf])])
+                return
+
+            cost_next = cost + survival * hazard * distance_next
+            survival_next = survival * (1.0 - hazard)
+
+            if len(order) == depth - 2:
+                # Last two levels as one (k, k) matrix, row major is the lexicographic order
+                self.stats_nodes += len(candidates) ** 2
+                distance_last = distance_next[:, None] + room_distances[np.ix_(candidates, candidates)]
+                if b_mutually_exclusive:
+                    mass_last = (mass - probabilities[candidates])[:, None]
+                    hazard_last = np.where(mass_last > 1e-12,
+                                           np.minimum(probabilities[candidates][None, :] / np.maximum(mass_last, 1e-12), 1.0), 1.0)
+                else:
+                    hazard_last = np.broadcast_to(probabilities[candidates][None, :], distance_last.shape)
+                costs = cost_next[:, None] + survival_next[:, None] * (hazard_last * distance_last
+                                                                      + (1.0 - hazard_last) * failure_cost)
+                np.fill_diagonal(costs, np.inf)
+                leaf = int(np.argmin(costs))
+                first, second = divmod(leaf, len(candidates))
+                update_best(costs[first, second], order + [int(candidates[first]), int(candidates[second])])
+                return
+
+            # Bound of the rest of an order: every later room is at least one more hop away, and at best the
+            # most likely remaining rooms come next, which leaves a failure probability of at least fail
+            num_remaining = depth - len(order) - 1
+            top_probabilities = np.sort(probabilities[candidates])[::-1][:num_remaining]
+            if b_mutually_exclusive:
+                mass_next = mass - probabilities[candidates]
+                fail = np.where(mass_next > 1e-12, np.clip((mass_next - top_probabilities.sum()) / np.maximum(mass_next, 1e-12), 0.0, 1.0), 0.0)
+            else:
+                fail = np.prod(1.0 - top_probabilities)
+            distance_min = distance_next + min_hop[candidates]
+            lower_bounds = cost_next + survival_next * np.where(
+                failure_cost >= distance_min, fail * failure_cost + (1.0 - fail) * distance_min, failure_cost)
+            for i, room in enumerate(candidates):
+                self.stats_nodes += 1
+                if lower_bounds[i] > best["cost"] or (best["order"] is not None and lower_bounds[i] >= best["cost"]):
+                    self.stats_pruned += 1
+                    continue
+                visited[room] = True
+                search(order + [int(room)], visited, cost_next[i], survival_next[i], distance_next[i],
+                       mass - probabilities[room])
+                visited[room] = False
+
+        search([], np.zeros(num_rooms, dtype=bool), 0.0, 1.0, 0.0, 1.0)
+        return best["order"], best["cost"]
+
+    def greedy_order(self, start_distances, room_distances, probabilities, depth: int):
+        # Highest probability per unit of distance first
+        order = []
+        visited = np.zeros(len(probabilities), dtype=bool)
+        step = start_distances
+        for _ in range(depth):
+            scores = np.where(visited, -np.inf, probabilities / np.maximum(step, 1e-6))
+            room = int(np.argmax(scores))
+            order.append(room)
+            visited[room] = True
+            step = room_distances[room]
+        return order
+
+    def order_cost(self, order: List[int], start_distances, room_distances, probabilities, failure_cost: float = 0.0,
+                   b_mutually_exclusive: bool = False):
+        # Expected cost of one visiting order (probabilities already normalized when mutually exclusive)
+        cost, survival, distance, mass = 0.0, 1.0, 0.0, 1.0
+        last = None
+        for room in order:
+            distance += start_distances[room] if last is None else room_distances[last, room]
+            if b_mutually_exclusive:
+                hazard = min(probabilities[room] / mass, 1.0) if mass > 1e-12 else 1.0
+                mass -= probabilities[room]
+            else:
+                hazard = probabilities[room]
+            cost += survival * hazard * distance
+            survival *= 1.0 - hazard
+            last = room
+        return cost + survival * failure_cost
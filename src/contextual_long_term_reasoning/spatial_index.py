@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+
+"""Spatial index over place node positions for nearest and radius queries."""
+
+import numpy as np
+
+try:
+    from scipy.spatial import cKDTree
+except ImportError:  # Optional: fall back to brute force numpy distances
+    cKDTree = None
+
+
+class PlaceSpatialIndex(object):
+    def __init__(self, place_nodes):
+        self.place_ids = list(place_nodes)
+        positions = getattr(place_nodes, "positions", None)  # PlaceNodeStore columns
+        if positions is not None:
+            self.positions = np.asarray(positions, dtype=np.float64).reshape(-1, 3)
+        else:
+            self.positions = np.array([place_nodes[place_id].position for place_id in self.place_ids],
+                                      dtype=np.float64).reshape(-1, 3)
+        self.room_of_place = [place_nodes[place_id].room_parent for place_id in self.place_ids]
+        self.room_version = getattr(place_nodes, "room_version", None)  # PlaceNodeStore only
+
+        self.tree = cKDTree(self.positions) if cKDTree is not None and len(self.place_ids) > 0 else None
+        # room id -> (row indices, tree), built on the first query for that room
+        self.room_indices = {}
+
+    def __len__(self):
+        return len(self.place_ids)
+
+    def is_current(self, place_nodes):
+        # False once places were added or reassigned to other rooms since the index was built
+        if len(self.place_ids) != len(place_nodes):
+            return False
+        room_version = getattr(place_nodes, "room_version", None)
+        if room_version is not None:
+            return room_version == self.room_version
+        # Plain PlaceNode dicts have no version counter, compare the room assignment itself
+        return all(place_nodes[place_id].room_parent == room for place_id, room in zip(self.place_ids, self.room_of_place))
+
+    def query_rows(self, position, k, rows=None, tree=None):
+        # Returns [(row, distance)] of the k nearest rows, optionally restricted to a subset of rows
+        position = np.asarray(position, dtype=np.float64)
+        positions = self.positions if rows is None else self.positions[rows]
+        k = min(k, len(positions))
+        if k <= 0:
+            return []
+        if tree is not None:
+            distances, indices = tree.query(position, k=k)
+            distances, indices = np.atleast_1d(distances), np.atleast_1d(indices)
+        else:
+            all_distances = np.linalg.norm(positions - position, axis=1)
+            indices = np.argpartition(all_distances, k - 1)[:k] if k < len(positions) else np.arange(len(positions))
+            indices = indices[np.argsort(all_distances[indices], kind="stable")]
+            distances = all_distances[indices]
+        if rows is not None:
+            indices = rows[indices]
+        return list(zip(indices.tolist(), distances.tolist()))
+
+    def nearest(self, position, k=1):
+        # [(place_id, distance)], closest first
+        return [(self.place_ids[row], distance) for row, distance in self.query_rows(position, k, tree=self.tree)]
+
+    def within_radius(self, position, radius):
+        # [(place_id, distance)] of all places within radius, closest first
+        position = np.asarray(position, dtype=np.float64)
+        if self.tree is not None:
+            rows = np.asarray(self.tree.query_ball_point(position, radius), dtype=np.int64)
+        else:
+            rows = np.flatnonzero(np.linalg.norm(self.positions - position, axis=1) <= radius)
+        distances = np.linalg.norm(self.positions[rows] - position, axis=1) if len(rows) > 0 else np.zeros(0)
+        order = np.argsort(distances, kind="stable")
+        return [(self.place_ids[row], distance) for row, distance in zip(rows[order].tolist(), distances[order].tolist())]
+
+    def nearest_in_room(self, position, room_id, k=1):
+        if room_id not in self.room_indices:
+            rows = np.array([row for row, room in enumerate(self.room_of_place) if room == room_id], dtype=np.int64)
+            tree = cKDTree(self.positions[rows]) if cKDTree is not None and len(rows) > 0 else None
+            self.room_indices[room_id] = (rows, tree)
+        rows, tree = self.room_indices[room_id]
+        return [(self.place_ids[row], distance) for row, distance in self.query_rows(position, k, rows=rows, tree=tree)]
+
+    def nearest_id(self, place_id):
+        # Last resort when a place has no known position: the closest frame index of the same trajectory
+        if len(self.place_ids) == 0:
+            return None
+        id_differences = np.abs(np.asarray(self.place_ids, dtype=np.int64) - int(place_id))
+        return self.place_ids[int(np.argmin(id_differences))]
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+
+"""Object appearances, disappearances and moves between consecutive episodes of a mind palace."""
+
+from collections import namedtuple
+from typing import Optional
+
+from contextual_long_term_reasoning.object_index import normalize_object_term
+
+# change is "appear" (seen in new rooms), "disappear" (gone from rooms) or "move" (both). episode_before and
+# episode_after are consecutive in time; rooms_before/rooms_after are all rooms where the object was seen in each.
+ObjectChange = namedtuple("ObjectChange", ["object", "change", "episode_before", "episode_after", "rooms_before", "rooms_after"])
+
+
+def room_object_counts(scene_graph):
+    # room id -> {normalized object: number of places in the room that saw it}
+    counts = {}
+    for room_id, room_node in scene_graph.room_nodes.items():
+        object_counts = getattr(room_node, "object_counts", None)
+        if object_counts is None:
+            # Room nodes built without counts: tally the places of the room
+            object_counts = {}
+            for place_id in scene_graph.place_nodes:
+                place_node = scene_graph.place_nodes[place_id]
+                if place_node.room_parent == room_id:
+                    for obj in set(place_node.text_object_seen or []):
+                        object_counts[obj] = object_counts.get(obj, 0) + 1
+        room_counts = {}
+        for obj, count in object_counts.items():
+            term = normalize_object_term(obj)
+            if term:
+                room_counts[term] = room_counts.get(term, 0) + count
+        counts[room_id] = room_counts
+    return counts
+
+
+class TemporalChangeIndex(object):
+    def __init__(self, min_places: int = 1):
+        # An object counts as present in a room when at least min_places places of the room saw it
+        self.min_places = min_places
+        self.episodes = []          # Chronological, oldest first
+        self.changes = []           # [ObjectChange], chronological
+        self.rows_of_object = {}    # object -> row indices into changes
+        self.rows_of_episode = {}   # episode -> row indices of the changes observed in that episode
+
+    @classmethod
+    def from_mind_palace(cls, mind_palace: dict, min_places: int = 1):
+        # The mind palace lists the episodes newest first (now, then the past)
+        if hasattr(mind_palace, "episode_summary"):
+            # Lazy mind palace: per episode summaries (cached on disk) instead of loading every scene graph
+            return cls.from_room_object_counts({episode: mind_palace.episode_summary(episode)["room_object_counts"]
+                                                for episode in mind_palace}, min_places)
+        return cls.from_room_object_counts({episode: room_object_counts(mind_palace[episode]) for episode in mind_palace},
+                                           min_places)
+
+    @classmethod
+    def from_room_object_counts(cls, episode_room_counts: dict, min_places: int = 1):
+        # episode -> room_object_counts of the episode, newest first like the mind palace
+        change_index = cls(min_places)
+        episodes = list(reversed(list(episode_room_counts.keys())))
+        previous_rooms = None
+        for episode in episodes:
+            rooms = change_index.object_rooms(episode_room_counts[episode])
+            if previous_rooms is not None:
+                change_index.add_diff(change_index.episodes[-1], episode, previous_rooms, rooms)
+            change_index.episodes.append(episode)
+            previous_rooms = rooms
+        return change_index
+
+    def object_rooms(self, room_counts: dict):
+        # object -> set of rooms where it is present
+        rooms = {}
+        for room_id, counts in room_counts.items():
+            for obj, count in counts.items():
+                if count >= self.min_places:
+                    rooms.setdefault(obj, set()).add(room_id)
+        return rooms
+
+    def add_diff(self, episode_before: str, episode_after: str, rooms_before: dict, rooms_after: dict):
+        for obj in sorted(set(rooms_before) | set(rooms_after)):
+            before = rooms_before.get(obj, set())
+            after = rooms_after.get(obj, set())
+            if before == after:
+                continue
+            # Seen in new rooms and gone from others is a move, otherwise it (dis)appeared in some rooms
+            if len(after - before) > 0 and len(before - after) > 0:
+                change = "move"
+            elif len(after - before) > 0:
+                change = "appear"
+            else:
+                change = "disappear"
+            self.add_change(ObjectChange(obj, change, episode_before, episode_after,
+                                         tuple(sorted(before, key=str)), tuple(sorted(after, key=str))))
+
+    def add_change(self, object_change: ObjectChange):
+        row = len(self.changes)
+        self.changes.append(object_change)
+        self.rows_of_object.setdefault(object_change.object, []).append(row)
+        self.rows_of_episode.setdefault(object_change.episode_after, []).append(row)
+
+    def __len__(self):
+        return len(self.changes)
+
+    def query(self, obj: Optional[str] = None, change: Optional[str] = None, episode: Optional[str] = None):
+        # Changes of an object (normalized like the object index), a change type and/or an episode
+        if obj is not None:
+            term = normalize_object_term(obj)
+            rows = self.rows_of_object.get(term)
+            if rows is None and " " in term:
+                rows = self.rows_of_object.get(term.split(" ")[-1])
+            rows = rows or []
+        elif episode is not None:
+            rows = self.rows_of_episode.get(episode, [])
+        else:
+            rows = range(len(self.changes))
+        return [self.changes[row] for row in rows
+                if (change is None or self.changes[row].change == change)
+                and (episode is None or self.changes[row].episode_after == episode)]
+
+    def changed_episodes(self, objects):
+        # Episodes (newest first, like the mind palace) in which any of the objects changed
+        if isinstance(objects, str):
+            objects = [objects]
+        episodes = set()
+        for obj in objects:
+            for object_change in self.query(obj):
+                episodes.add(object_change.episode_before)
+                episodes.add(object_change.episode_after)
+        return [episode for episode in reversed(self.episodes) if episode in episodes]
+
+    def to_records(self):
+        # Flat rows, e.g. for a pandas DataFrame or a YAML dump
+        return [object_change._asdict() for object_change in self.changes]
+
+    def describe(self, objects, mind_palace: Optional[dict] = None):
+        # Short text summary for prompts, oldest change first
+        if isinstance(objects, str):
+            objects = [objects]
+
+        def room_text(episode, room_ids):
+            if mind_palace is None:
+                return ", ".join(str(room_id) for room_id in room_ids)
+            room_nodes = mind_palace[episode].room_nodes
+            return ", ".join(f"{room_nodes[room_id].room_name} ({room_id})" if room_id in room_nodes else str(room_id)
+                             for room_id in room_ids)
+
+        lines = []
+        for obj in objects:
+            for object_change in self.query(obj):
+                gained = [room_id for room_id in object_change.rooms_after if room_id not in object_change.rooms_before]
+                lost = [room_id for room_id in object_change.rooms_before if room_id not in object_change.rooms_after]
+                verb = {"appear": "appeared", "disappear": "disappeared", "move": "moved"}[object_change.change]
+                text = f"{object_change.object} {verb} between {object_change.episode_before} and {object_change.episode_after}"
+                if object_change.change == "appear":
+                    text += f" in {room_text(object_change.episode_after, gained)}"
+                elif object_change.change == "disappear":
+                    text += f" from {room_text(object_change.episode_before, lost)}"
+                else:
+                    text += f" from {room_text(object_change.episode_before, lost)} to {room_text(object_change.episode_after, gained)}"
+                lines.append(text)
+        if len(lines) == 0:
+            return "No change of the object was recorded between the time instances."
+        return "\n".join(lines)
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+
+"""Navigation graph over place nodes with precomputed shortest path lengths."""
+
+import hashlib
+import os
+import numpy as np
+
+try:
+    from scipy.sparse import coo_matrix
+    from scipy.sparse.csgraph import shortest_path
+except ImportError:  # Optional: scene graphs fall back to straight-line distances
+    coo_matrix = None
+    shortest_path = None
+
+TRAVERSAL_GRAPH_VERSION = 3  # 2: dense matrices only up to max_dense_places, 3: duplicate edges no longer summed
+
+
+def traversal_graph_available():
+    return shortest_path is not None
+
+
+class TraversalGraph(object):
+    # Places are connected along the breadcrumb sequence (consecutive frame indices, the path the robot
+    # walked) and to every place within adjacency_radius. Edge weights are Euclidean lengths, so path
+    # lengths approximate walking distance instead of cutting through walls.
+    # Up to max_dense_places places (16 MB of float32) all pairs are precomputed, larger scenes compute
+    # and keep the rows of the queried places only.
+    def __init__(self, place_ids, positions, room_of_place, adjacency_radius=1.0, max_dense_places=2000):
+        self.place_ids = list(place_ids)
+        self.positions = np.asarray(positions, dtype=np.float64).reshape(-1, 3)
+        self.room_of_place = list(room_of_place)
+        self.adjacency_radius = adjacency_radius
+        self.max_dense_places = max_dense_places
+
+        self.row_of_place = {place_id: row for row, place_id in enumerate(self.place_ids)}
+        self.room_ids = sorted({room_id for room_id in self.room_of_place if room_id is not None}, key=str)
+        self.row_of_room = {room_id: row for row, room_id in enumerate(self.room_ids)}
+
+        self.adjacency = None
+        self.place_distances = None   # (N, N) float32, inf between disconnected places
+        self.place_distance_rows = {}  # row -> (N,) float32, used instead of the matrix for large scenes
+        self.room_places = None        # (R,) row of the place that represents each room
+        self.room_distances = None     # (R, R) float32
+
+    @classmethod
+    def from_place_nodes(cls, place_nodes, adjacency_radius=1.0, max_dense_places=2000):
+        place_ids = sorted(place_nodes)
+        positions = [place_nodes[place_id].position for place_id in place_ids]
+        room_of_place = [place_nodes[place_id].room_parent for place_id in place_ids]
+        return cls(place_ids, positions, room_of_place, adjacency_radius, max_dense_places)
+
+    def signature(self):
+        # Identifies the places, positions, rooms and parameters the matrices were computed from
+        digest = hashlib.sha1()
+        digest.update(np.asarray(self.place_ids, dtype=np.int64).tobytes())
+        digest.update(np.ascontiguousarray(self.positions).tobytes())
+        digest.update(repr(self.room_of_place).encode("utf-8"))
+        digest.update(repr((TRAVERSAL_GRAPH_VERSION, self.adjacency_radius, len(self.place_ids) <= self.max_dense_places)).encode("utf-8"))
+        return digest.hexdigest()
+
+    def build_adjacency(self):
+        num_places = len(self.place_ids)
+        # Breadcrumb sequence edges
+        rows = [np.arange(num_places - 1)]
+        cols = [np.arange(1, num_places)]
+        # Radius edges between places seen close to each other
+        if self.adjacency_radius and self.adjacency_radius > 0 and num_places > 1:
+            try:
+                from scipy.spatial import cKDTree
+                pairs = cKDTree(self.positions).query_pairs(self.adjacency_radius, output_type="ndarray")
+            except ImportError:
+                pairs = np.zeros((0, 2), dtype=np.int64)
+            rows.append(pairs[:, 0])
+            cols.append(pairs[:, 1])
+        rows = np.concatenate(rows).astype(np.int64)
+        cols = np.concatenate(cols).astype(np.int64)
+        # Consecutive places are usually within the radius too; the sparse conversion would sum duplicate edges
+        edges = np.unique(np.minimum(rows, cols) * num_places + np.maximum(rows, cols))
+        rows, cols = edges // num_places, edges % num_places
+        weights = np.linalg.norm(self.positions[rows] - self.positions[cols], axis=1)
+        # Coincident places still need an edge; csgraph treats explicit zeros as missing edges
+        weights = np.maximum(weights, 1e-6)
+        self.adjacency = coo_matrix((weights, (rows, cols)), shape=(num_places, num_places)).tocsr()
+
+    def compute(self):
+        self.build_adjacency()
+        num_places = len(self.place_ids)
+        if num_places <= self.max_dense_places:
+            self.place_distances = shortest_path(self.adjacency, method="D", directed=False).astype(np.float32)
+
+        # Each room is represented by its place closest to the room centroid
+        self.room_places = np.zeros(len(self.room_ids), dtype=np.int64)
+        for room_row, room_id in enumerate(self.room_ids):
+            place_rows = np.array([row for row, room in enumerate(self.room_of_place) if room == room_id], dtype=np.int64)
+            centroid = self.positions[place_rows].mean(axis=0)
+            self.room_places[room_row] = place_rows[np.argmin(np.linalg.norm(self.positions[place_rows] - centroid, axis=1))]
+        self.room_distances = np.zeros((len(self.room_ids), len(self.room_ids)), dtype=np.float32)
+        for room_row in range(len(self.room_ids)):
+            self.room_distances[room_row] = self.distance_row(self.room_places[room_row])[self.room_places]
+
+    def distance_row(self, row):
+        if self.place_distances is not None:
+            return self.place_distances[row]
+        if row not in self.place_distance_rows:
+            self.place_distance_rows[row] = shortest_path(self.adjacency, method="D", directed=False,
+                                                          indices=[row])[0].astype(np.float32)
+        return self.place_distance_rows[row]
+
+    def save(self, path):
+        tmp_path = f"{path}.{os.getpid()}.tmp.npz"
+        np.savez_compressed(tmp_path,
+                            signature=np.array(self.signature()),
+                            place_distances=self.place_distances if self.place_distances is not None else np.zeros((0, 0), dtype=np.float32),
+                            room_places=self.room_places,
+                            room_distances=self.room_distances)
+        os.replace(tmp_path, path)
+
+    def load(self, path):
+        # Returns False when the cache is missing or was computed from different places
+        if not os.path.exists(path):
+            return False
+        try:
+            with np.load(path) as data:
+                if str(data["signature"]) != self.signature():
+                    return False
+                place_distances = data["place_distances"]
+                self.room_places = data["room_places"]
+                self.room_distances = data["room_distances"]
+        except (OSError, KeyError, ValueError):
+            return False
+        self.place_distances = place_distances if place_distances.size > 0 else None
+        if self.place_distances is None:
+            self.build_adjacency()
+        return True
+
+    def euclidean(self, row_a, row_b):
+        return float(np.linalg.norm(self.positions[row_a] - self.positions[row_b]))
+
+    def path_length(self, row_a, row_b):
+        distance = float(self.distance_row(row_a)[row_b])
+        # Disconnected parts of the graph are bridged with a straight line
+        return distance if np.isfinite(distance) else self.euclidean(row_a, row_b)
+
+    def place_distance(self, place_a, place_b):
+        return self.path_length(self.row_of_place[place_a], self.row_of_place[place_b])
+
+    def place_to_room_distance(self, place_id, room_id):
+        return self.path_length(self.row_of_place[place_id], self.room_places[self.row_of_room[room_id]])
+
+    def room_distance(self, room_a, room_b):
+        distance = float(self.room_distances[self.row_of_room[room_a], self.row_of_room[room_b]])
+        if np.isfinite(distance):
+            return distance
+        return self.euclidean(self.room_places[self.row_of_room[room_a]], self.room_places[self.row_of_room[room_b]])
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+
+"""Shared fixtures. Puts the src layout on the import path, the repo is not installed as a package."""
+
+import os
+import sys
+import threading
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from contextual_long_term_reasoning.mind_palace_generation import PlaceNode, RoomNode, SceneGraph  # noqa: E402
+
+
+def place_nodes_from_fields(places):
+    # [{"node_id": 7, "room_parent": "r1", ...}] -> {node_id: PlaceNode}. Fields left out keep the PlaceNode defaults,
+    # position/orientation/yaw default to the origin facing forward.
+    place_nodes = {}
+    for fields in places:
+        fields = dict(fields)
+        place_node = PlaceNode(fields.pop("node_id"), list(fields.pop("position", [0.0, 0.0, 0.0])),
+                               tuple(fields.pop("orientation", (1.0, 0.0, 0.0, 0.0))), fields.pop("yaw", 0.0))
+        for name, value in fields.items():
+            if not hasattr(place_node, name):
+                raise AttributeError(f"PlaceNode has no field {name}")
+            setattr(place_node, name, value)
+        place_nodes[place_node.node_id] = place_node
+    return place_nodes
+
+
+class ScriptedLLM(object):
+    # Stands in for OpenAIInterface.call_openai_api: answers with respond(call_site, messages), records every call
+    def __init__(self, respond):
+        self.respond = respond
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def __call__(self, messages, vision_query=False, verbose=False, call_site="unlabeled"):
+        with self._lock:
+            self.calls.append((call_site, messages))
+        return self.respond(call_site, messages)
+
+    def call_sites(self):
+        with self._lock:
+            return [call_site for call_site, _ in self.calls]
+
+
+def message_images(messages):
+    # Data URLs of the images of a vision message, in order
+    return [part["image_url"]["url"] for part in messages[0]["content"] if part["type"] == "image_url"]
+
+
+@pytest.fixture
+def make_place_nodes():
+    return place_nodes_from_fields
+
+
+@pytest.fixture(autouse=True)
+def openai_environment(monkeypatch):
+    # OpenAIInterface needs a key to be constructed; no test may reach the network or a shared response cache
+    monkeypatch.setenv("OPENAI_API_KEY", "test-key")
+    monkeypatch.delenv("OPENAI_RESPONSE_CACHE_DIR", raising=False)
+
+
+@pytest.fixture
+def script_llm(monkeypatch):
+    # script_llm(oa_interface, respond) replaces the model calls of one interface and returns the ScriptedLLM
+    def script(oa_interface, respond):
+        scripted_llm = ScriptedLLM(respond)
+        monkeypatch.setattr(oa_interface, "call_openai_api", scripted_llm)
+        return scripted_llm
+    return script
+
+
+@pytest.fixture
+def make_images(tmp_path):
+    # make_images(n) writes n small, distinct png frames and returns their paths
+    def make(num_images, prefix="frame"):
+        import cv2
+        image_paths = []
+        for i in range(num_images):
+            image_path = str(tmp_path / f"{prefix}_{i:03d}.png")
+            cv2.imwrite(image_path, np.full((8, 8, 3), 10 * i, dtype=np.uint8))
+            image_paths.append(image_path)
+        return image_paths
+    return make
+
+
+@pytest.fixture
+def make_scene_graph(make_place_nodes, make_images):
+    # make_scene_graph({room_id: room_name}, places_per_room) -> SceneGraph with consecutive place ids per room
+    # (r1: 0..n-1, r2: n..2n-1, ...), one distinct frame per place and the objects of each room on its RoomNode
+    def make(room_names, places_per_room=3, name="scene", objects_of_place=None):
+        image_paths = make_images(len(room_names) * places_per_room, prefix=name)
+        places = []
+        room_nodes = {}
+        for room_index, (room_id, room_name) in enumerate(room_names.items()):
+            room_node = RoomNode(room_id, [float(room_index), 0.0, 0.0], (1.0, 0.0, 0.0, 0.0), 0.0)
+            room_node.room_name = room_name
+            room_nodes[room_id] = room_node
+            for i in range(places_per_room):
+                place_id = room_index * places_per_room + i
+                objects = objects_of_place(place_id) if objects_of_place is not None else []
+                places.append({"node_id": place_id, "position": [float(room_index), float(i), 0.0], "room_parent": room_id,
+                               "image_path": image_paths[place_id], "text_object_seen": objects,
+                               "text_contextual_description": f"A view of the {room_name}."})
+            room_node.text_object_seen = sorted({obj for place in places if place["room_parent"] == room_id
+                                                 for obj in place["text_object_seen"]})
+        return SceneGraph(name, "", room_nodes=room_nodes, place_nodes=make_place_nodes(places))
+    return make
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+
+"""Image payload cache: memory and disk layers, invalidation on change and failed images."""
+
+import os
+import time
+
+from contextual_long_term_reasoning.image_payload_cache import ImagePayloadCache, encode_image_payload
+
+
+def test_memory_then_disk_then_encode(tmp_path, make_images):
+    frame = make_images(1)[0]
+    cache = ImagePayloadCache(cache_dir=str(tmp_path / "cache"))
+    payload = cache.get(frame, image_size=16)
+    assert payload == encode_image_payload(frame, 16) and payload.startswith("data:image/png;base64,")
+    assert cache.get(frame, image_size=16) == payload
+    assert (cache.stats_encoded, cache.stats_memory_hits, cache.stats_disk_hits) == (1, 1, 0)
+
+    # A new process reads the disk layer instead of encoding again
+    other = ImagePayloadCache(cache_dir=str(tmp_path / "cache"))
+    assert other.get(frame, image_size=16) == payload
+    assert (other.stats_encoded, other.stats_disk_hits) == (0, 1)
+
+    # Size and codec are part of the key
+    assert cache.get(frame, image_size=4) != payload
+    assert cache.get(frame, image_size=16, codec="jpeg", quality=80).startswith("data:image/jpeg;base64,")
+    assert cache.stats_encoded == 3
+
+
+def test_changed_frame_is_encoded_again(tmp_path, make_images):
+    frames = make_images(2)
+    cache = ImagePayloadCache()
+    payload = cache.get(frames[0])
+    with open(frames[1], 'rb') as f, open(frames[0], 'wb') as g:
+        g.write(f.read())
+    os.utime(frames[0], ns=(time.time_ns(), time.time_ns() + 10 ** 9))
+    assert cache.get(frames[0]) == encode_image_payload(frames[1]) != payload
+    assert cache.stats_encoded == 2
+
+
+def test_memory_layer_is_bounded(make_images):
+    frames = make_images(4)
+    payload_bytes = len(encode_image_payload(frames[0]))
+    cache = ImagePayloadCache(max_memory_mb=2.5 * payload_bytes / (1024 * 1024))
+    for frame in frames:
+        cache.get(frame)
+    assert len(cache._memory) == 2
+    cache.get(frames[0])  # Evicted, encoded again
+    assert cache.stats_encoded == 5 and cache.stats_memory_hits == 0
+
+
+def test_get_many_reports_failures_in_order(tmp_path, make_images):
+    frames = make_images(2)
+    broken_path = str(tmp_path / "broken.png")
+    with open(broken_path, 'wb') as f:
+        f.write(b"not a png")
+    paths = [frames[0], str(tmp_path / "missing.png"), broken_path, frames[1]]
+    results = ImagePayloadCache().get_many(paths, num_workers=4)
+    assert [path for path, _, _ in results] == paths
+    assert [payload is not None for _, payload, _ in results] == [True, False, False, True]
+    assert [error for _, _, error in results] == [None, "file not found", "image could not be decoded", None]
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+
+"""Lazy mind palace: LRU eviction, the pinned present, cached object summaries and concurrent loads."""
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from contextual_long_term_reasoning.lazy_mind_palace import HabitatEpisodeLoader, LazyMindPalace
+
+ROOMS = {"r1": "kitchen", "r2": "living room"}
+EPISODES = ["now (saturday morning)", "friday afternoon", "thursday evening", "wednesday morning"]
+
+
+class SceneGraphLoader(HabitatEpisodeLoader):
+    # Builds a small scene graph instead of reading a Habitat episode, counting the builds
+    def __init__(self, make_scene_graph, scene_name, state_dataset_dir, objects_of_place=None, gate=None):
+        super().__init__(scene_name, "", state_dataset_dir)
+        self.make_scene_graph = make_scene_graph
+        self.objects_of_place = objects_of_place
+        self.gate = gate  # Holds the build until set
+        self.num_builds = 0
+
+    def __call__(self):
+        self.num_builds += 1
+        if self.gate is not None:
+            assert self.gate.wait(10.0)
+        return self.make_scene_graph(ROOMS, name=self.scene_name, objects_of_place=self.objects_of_place)
+
+
+@pytest.fixture
+def make_loaders(tmp_path, make_scene_graph):
+    def make(**kwargs):
+        return {episode: SceneGraphLoader(make_scene_graph, f"scene_{i}", str(tmp_path), **kwargs)
+                for i, episode in enumerate(EPISODES)}
+    return make
+
+
+def test_nothing_is_loaded_until_indexed(make_loaders):
+    mind_palace = LazyMindPalace(make_loaders())
+    assert list(mind_palace) == EPISODES and len(mind_palace) == 4 and "friday afternoon" in mind_palace
+    assert mind_palace.loaded_episodes() == []
+    with pytest.raises(KeyError):
+        mind_palace["tuesday"]
+
+
+def test_least_recently_used_episode_is_evicted_first(make_loaders):
+    loaders = make_loaders()
+    mind_palace = LazyMindPalace(loaders, max_loaded_episodes=2, b_pin_now_episode=False)
+    mind_palace["friday afternoon"]
+    mind_palace["thursday evening"]
+    mind_palace["friday afternoon"]  # Thursday is now the least recently used
+    mind_palace["wednesday morning"]
+    assert mind_palace.loaded_episodes() == ["friday afternoon", "wednesday morning"]
+    assert (mind_palace.stats_loads, mind_palace.stats_hits, mind_palace.stats_evictions) == (3, 1, 1)
+
+    mind_palace["thursday evening"]
+    assert loaders["thursday evening"].num_builds == 2
+    assert mind_palace.loaded_episodes() == ["wednesday morning", "thursday evening"]
+
+
+def test_now_episode_stays_pinned(make_loaders):
+    mind_palace = LazyMindPalace(make_loaders(), max_loaded_episodes=2)
+    for episode in EPISODES:
+        mind_palace[episode]
+    # "now" is the least recently used but never evicted
+    assert mind_palace.loaded_episodes() == ["now (saturday morning)", "wednesday morning"]
+
+
+def test_just_loaded_episode_is_kept_over_budget(make_loaders):
+    mind_palace = LazyMindPalace(make_loaders(), max_memory_mb=1e-6)
+    scene_graph = mind_palace["friday afternoon"]
+    mind_palace["thursday evening"]
+    assert mind_palace.loaded_episodes() == ["thursday evening"]
+    assert len(scene_graph.place_nodes) == 6
+
+
+def test_object_summary_is_cached_until_the_place_nodes_change(tmp_path, make_loaders):
+    loaders = make_loaders(objects_of_place=lambda place_id: ["mug"] if place_id == 4 else [])
+    place_nodes_path = tmp_path / "place_nodes_scene_1.pkl"
+    place_nodes_path.write_bytes(b"v1")
+
+    summary = LazyMindPalace(loaders).episode_summary("friday afternoon")
+    assert os.path.exists(loaders["friday afternoon"].object_summary_path())
+    # A new run reads the summary from disk without loading the episode
+    mind_palace = LazyMindPalace(loaders)
+    assert mind_palace.episode_summary("friday afternoon") == summary
+    assert loaders["friday afternoon"].num_builds == 1 and mind_palace.loaded_episodes() == []
+
+    # Rebuilt place nodes make the cached summary stale
+    place_nodes_path.write_bytes(b"version 2")
+    mind_palace = LazyMindPalace(loaders)
+    assert mind_palace.episode_summary("friday afternoon") == summary
+    assert loaders["friday afternoon"].num_builds == 2
+
+
+def test_concurrent_access_builds_an_episode_once_without_blocking_others(make_loaders):
+    loaders = make_loaders()
+    gate = threading.Event()
+    loaders["friday afternoon"].gate = gate
+    mind_palace = LazyMindPalace(loaders)
+    mind_palace["thursday evening"]
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        waiting = [executor.submit(mind_palace.__getitem__, "friday afternoon") for _ in range(3)]
+        # Friday is being built: hits and loads of other episodes still go through
+        assert executor.submit(mind_palace.__getitem__, "thursday evening").result(timeout=5.0) is mind_palace["thursday evening"]
+        assert mind_palace["wednesday morning"] is not None
+        assert not any(future.done() for future in waiting)
+        gate.set()
+        scene_graphs = [future.result(timeout=10.0) for future in waiting]
+    assert all(scene_graph is scene_graphs[0] for scene_graph in scene_graphs)
+    assert loaders["friday afternoon"].num_builds == 1 and mind_palace.stats_loads == 3
+    assert mind_palace.loading == {}
+
+
+def test_failed_load_is_not_cached(make_loaders):
+    loaders = make_loaders()
+    build = loaders["friday afternoon"]
+
+    def missing_place_nodes():
+        raise OSError("place nodes missing")
+    loaders["friday afternoon"] = missing_place_nodes
+    mind_palace = LazyMindPalace(loaders)
+    with pytest.raises(OSError):
+        mind_palace["friday afternoon"]
+    assert mind_palace.loading == {} and mind_palace.loaded_episodes() == []
+
+    # The next access tries again
+    mind_palace.episode_loaders["friday afternoon"] = build
+    assert len(mind_palace["friday afternoon"].place_nodes) == 6
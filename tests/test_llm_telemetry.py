@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+
+"""LLM telemetry: costs, per call site and per question aggregates, failed and cached calls."""
+
+import json
+
+import openai
+import pytest
+
+from contextual_long_term_reasoning.llm_telemetry import LLMCallEvent, LLMTelemetry, estimate_cost_usd, measure_messages
+from contextual_long_term_reasoning.local_llm_server import start_local_llm_server
+from contextual_long_term_reasoning.openai_backend import OpenAIBackend
+from contextual_long_term_reasoning.openai_interface import OpenAIInterface
+from contextual_long_term_reasoning.response_cache import ResponseCache
+
+VISION_MESSAGES = [{"role": "user", "content": [{"type": "text", "text": "Is the mug here?"},
+                                                {"type": "image_url", "image_url": {"url": "data:image/png;base64,AAAA"}},
+                                                {"type": "image_url", "image_url": {"url": "data:image/png;base64,BB"}}]}]
+
+
+def test_costs_and_payload_measures():
+    assert estimate_cost_usd("gpt-4o", 1000000, 100000) == pytest.approx(3.50)
+    # Dated snapshots are priced like their base model, the longest prefix wins
+    assert estimate_cost_usd("gpt-4o-mini-2024-07-18", 1000000, 0) == pytest.approx(0.15)
+    assert estimate_cost_usd("unknown-model", 1000, 1000) == 0.0
+    assert measure_messages(VISION_MESSAGES) == (len("Is the mug here?") + 26 + 24, 2)
+
+
+def test_aggregates_per_call_site_and_question(tmp_path):
+    events_path = str(tmp_path / "events.jsonl")
+    telemetry = LLMTelemetry(events_path=events_path)
+    telemetry.set_question("q1")
+    telemetry.record("room", "gpt-4o", 1000, 100, 0.5, [{"role": "user", "content": "rooms"}])
+    telemetry.record("vision", "gpt-4o", 2000, 50, 1.5, VISION_MESSAGES)
+    telemetry.record("vision", "gpt-4o", 2000, 50, 0.01, VISION_MESSAGES, cached=True)
+    telemetry.set_question("q2")
+    telemetry.record("room", "gpt-4o", 0, 0, 2.0, [{"role": "user", "content": "rooms"}], error="APITimeoutError")
+
+    q1 = telemetry.question_summary("q1")
+    assert (q1["calls"], q1["cached_calls"], q1["errors"], q1["image_count"]) == (3, 1, 0, 4)
+    assert q1["call_sites"]["vision"]["prompt_tokens"] == 4000
+    # Cached calls cost nothing
+    assert q1["cost_usd"] == pytest.approx(estimate_cost_usd("gpt-4o", 3000, 150))
+
+    run = telemetry.run_summary()
+    assert run["calls"] == 4 and run["errors"] == 1 and run["error_rate"] == 0.25
+    assert run["call_sites"]["room"]["error_latency_s"] == 2.0
+    assert telemetry.question_summary() == telemetry.question_summary("q2")
+
+    # The event stream summarizes to the same totals
+    with open(events_path) as f:
+        events = [LLMCallEvent(**json.loads(line)) for line in f]
+    assert telemetry.summarize(events) == run
+
+
+@pytest.fixture
+def local_server():
+    server, base_url = start_local_llm_server(port=0)
+    yield server, base_url
+    server.shutdown()
+    server.server_close()
+
+
+def test_interface_records_every_call(tmp_path, local_server):
+    server, base_url = local_server
+    telemetry = LLMTelemetry()
+    oa_interface = OpenAIInterface(response_cache=ResponseCache(str(tmp_path / "responses")), telemetry=telemetry,
+                                   backend=OpenAIBackend(max_retries=0, base_url=base_url))
+    messages = oa_interface.prepare_openai_messages("Reply with \"score\" from 1 to 5.")
+    oa_interface.call_openai_api(messages, call_site="judge")
+    oa_interface.call_openai_api(messages, call_site="judge")  # Served by the response cache
+
+    server.RequestHandlerClass.responder.failure_rate = 1.0
+    with pytest.raises((openai.RateLimitError, openai.InternalServerError)):
+        oa_interface.call_openai_api(oa_interface.prepare_openai_messages("Something else"), call_site="answer")
+
+    summary = telemetry.run_summary()
+    assert summary["call_sites"]["judge"]["calls"] == 2 and summary["call_sites"]["judge"]["cached_calls"] == 1
+    assert summary["call_sites"]["judge"]["prompt_tokens"] > 0 and summary["call_sites"]["judge"]["cost_usd"] > 0
+    assert summary["call_sites"]["answer"]["errors"] == 1 and summary["error_rate"] == pytest.approx(1 / 3, abs=1e-4)
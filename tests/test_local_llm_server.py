@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+
+"""Local LLM stand-in: schema-valid, deterministic answers per prompt family, served over HTTP."""
+
+import json
+
+import httpx
+import openai
+import pytest
+
+from contextual_long_term_reasoning.local_llm_server import LocalLLMResponder, start_local_llm_server
+
+
+def request(text, images=()):
+    content = [{"type": "text", "text": text}] + [{"type": "image_url", "image_url": {"url": url}} for url in images]
+    return {"model": "gpt-4o", "messages": [{"role": "user", "content": content}]}
+
+
+def answer(responder, text, images=()):
+    status_code, body = responder.complete(request(text, images))
+    assert status_code == 200
+    return json.loads(body["choices"][0]["message"]["content"])
+
+
+def test_answers_match_the_prompt_schemas():
+    responder = LocalLLMResponder()
+    rooms = answer(responder, "Room Node r1\nRoom Name: kitchen\n\nRoom Node r2\nRoom Name: bedroom\n"
+                              " {\"room_id\": [\"rx\", ...], \"probability\": [0.XX, ...]}")
+    assert sorted(rooms["room_id"]) == ["r1", "r2"] and len(rooms["probability"]) == 2
+    assert rooms["probability"] == sorted(rooms["probability"], reverse=True)
+
+    places = answer(responder, "Place Node 4 \n Place Node 9 \n \"place_number\": [xx, ...]")
+    assert set(places["place_number"]) <= {4, 9}
+
+    verdicts = answer(responder, "One entry per image in \"verdicts\"", images=["data:a", "data:b", "data:c"])
+    assert len(verdicts["verdicts"]) == 3 and len(verdicts["confidence"]) == 3
+    assert set(verdicts["verdicts"]) <= {"True", "False"}
+
+    estimate = answer(responder, "{\"probability\": number between 0 and 1, \"number_of_rooms\": number}")
+    assert 0.0 <= estimate["probability"] <= 1.0 and estimate["number_of_rooms"] >= 1
+
+
+def test_same_request_same_answer():
+    responder = LocalLLMResponder(found_probability=0.5)
+    text = "Answer with 'True' or 'False'."
+    assert answer(responder, text, ["data:a"]) == answer(LocalLLMResponder(found_probability=0.5), text, ["data:a"])
+    # Vision answers depend on the images
+    answers = {answer(responder, text, [f"data:{i}"])["answer"] for i in range(32)}
+    assert answers == {"True", "False"}
+
+
+def test_injected_failures_follow_the_seed():
+    responder = LocalLLMResponder(failure_rate=0.5, failure_status_codes=(503,), seed=3)
+    status_codes = [responder.complete(request("hello"))[0] for _ in range(40)]
+    assert set(status_codes) == {200, 503}
+    assert responder.stats_failures == status_codes.count(503) and responder.stats_requests == 40
+    replay = LocalLLMResponder(failure_rate=0.5, failure_status_codes=(503,), seed=3)
+    assert [replay.complete(request("hello"))[0] for _ in range(40)] == status_codes
+
+
+@pytest.fixture
+def local_server():
+    server, base_url = start_local_llm_server(port=0)
+    yield base_url
+    server.shutdown()
+    server.server_close()
+
+
+def test_openai_client_against_the_server(local_server):
+    client = openai.OpenAI(api_key="test-key", base_url=local_server, max_retries=0)
+    completion = client.chat.completions.create(**request("Reply with \"score\" from 1 to 5."))
+    assert 1 <= json.loads(completion.choices[0].message.content)["score"] <= 5
+    assert completion.usage.prompt_tokens > 0
+
+    health = httpx.get(local_server + "/health").json()
+    assert health == {"status": "ok", "requests": 1, "failures": 0}
+    assert httpx.post(local_server + "/embeddings", json={}).status_code == 404
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+
+"""Term normalization, lookups and match confidences of the cross-episode object index."""
+
+import pytest
+
+from contextual_long_term_reasoning.mind_palace_generation import RoomNode, SceneGraph
+from contextual_long_term_reasoning.object_index import ObjectIndex, caption_terms, normalize_object_term
+
+
+@pytest.fixture
+def mind_palace(make_place_nodes):
+    def make_scene_graph(places):
+        # places: [(place_id, room_id, objects, caption)]
+        place_nodes = make_place_nodes([{"node_id": place_id, "room_parent": room_id, "text_object_seen": objects,
+                                         "text_contextual_description": caption}
+                                        for place_id, room_id, objects, caption in places])
+        return SceneGraph("scene", "", room_nodes={}, place_nodes=place_nodes)
+
+    # Newest episode first, like the mind palace
+    return {
+        "now": make_scene_graph([(1, "r1", ["Coffee Mugs", "table"], "A wooden table."),
+                                 (2, "r2", ["couch"], "A red teakettle on the stove.")]),
+        "yesterday": make_scene_graph([(1, "r1", ["mug"], None),
+                                       (2, "r1", ["mug", "laptop computer"], None),
+                                       (3, "r3", None, "Knives next to the sink.")]),
+    }
+
+
+def test_normalize_object_term():
+    assert normalize_object_term("Orange Juices") == "orange juice"
+    assert normalize_object_term("couches") == "sofa"
+    assert normalize_object_term("TV") == "television"
+    assert normalize_object_term("shelves") == "shelf"
+    assert normalize_object_term("glass") == "glass"
+    assert normalize_object_term("bus") == "bus"
+    assert normalize_object_term("") == ""
+
+
+def test_caption_terms():
+    # Bigrams only join neighbouring content words
+    assert caption_terms("The knives are next to the kitchen sink.") == {"knife", "next", "kitchen", "sink", "kitchen sink"}
+
+
+def test_lookup_across_episodes(mind_palace):
+    object_index = ObjectIndex.from_mind_palace(mind_palace)
+    assert object_index.episodes == ["now", "yesterday"]
+    postings = object_index.lookup("mugs")
+    assert {(posting.episode, posting.episode_index, posting.place_id) for posting in postings} == \
+        {("yesterday", 1, 1), ("yesterday", 1, 2)}
+    assert {posting.place_id for posting in object_index.lookup("sofa")} == {2}
+    assert {posting.place_id for posting in object_index.lookup("laptop")} == {2}
+    # Captions only when asked for
+    assert [posting.source for posting in object_index.lookup("knife")] == ["caption"]
+    assert object_index.lookup("knife", sources=("object",)) == []
+    # The head noun of an unknown multi word query
+    assert {posting.place_id for posting in object_index.lookup("coffee mug")} == {1}
+    assert {posting.episode for posting in object_index.lookup("blue mug")} == {"yesterday"}
+
+
+def test_counts(mind_palace):
+    object_index = ObjectIndex.from_mind_palace(mind_palace)
+    assert object_index.episode_counts("mug") == {"yesterday": 2}
+    assert object_index.episode_counts(["mug", "table"]) == {"now": 1, "yesterday": 2}
+    assert object_index.room_counts("mug", "yesterday") == {"r1": 2}
+    assert object_index.room_counts("mug", "now") == {}
+
+
+def test_match_confidences(mind_palace):
+    object_index = ObjectIndex.from_mind_palace(mind_palace)
+    # Exact object tag
+    assert {confidence for _, confidence in object_index.match("mug")} == {1.0}
+    # Head noun only
+    assert {confidence for _, confidence in object_index.match("red mug")} == {0.8}
+    # Caption hits count 0.8 of a tag
+    assert [confidence for _, confidence in object_index.match("sink")] == [pytest.approx(0.8)]
+    # Closest spelling
+    matches = object_index.match("tea kettle")
+    assert [posting.place_id for posting, _ in matches] == [2]
+    assert 0.0 < matches[0][1] < 0.8
+    assert object_index.match("giraffe") == []
+
+
+def test_describe(mind_palace):
+    object_index = ObjectIndex.from_mind_palace(mind_palace)
+    room_node = RoomNode("r1", [0.0, 0.0, 0.0], (1.0, 0.0, 0.0, 0.0), 0.0)
+    room_node.room_name = "kitchen"
+    mind_palace["yesterday"].room_nodes["r1"] = room_node
+    assert object_index.describe("mug", mind_palace) == "yesterday: 2 places (kitchen (r1): 2)"
+    assert object_index.describe("giraffe") == "The object was not recorded in any time instance."
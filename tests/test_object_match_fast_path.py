@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+
+"""Object match fast path: exact tags skip the LLM retrieval, weaker matches are only a hint in the prompt."""
+
+import json
+
+import pytest
+
+from contextual_long_term_reasoning.belief_manager import BeliefManager
+from contextual_long_term_reasoning.mind_palace_exploration import PlaceExploration, RoomExploration
+
+ROOMS = {"r1": "kitchen", "r2": "living room", "r3": "bedroom"}
+PAST = "friday afternoon"
+
+
+def respond(call_site, messages):
+    # An LLM that always picks the kitchen and its first place
+    if call_site == "room":
+        return json.dumps({"reasoning": "kitchens hold mugs", "rooms": ["kitchen"], "room_id": ["r1"], "probability": [0.5]})
+    if call_site == "place":
+        return json.dumps({"reasoning": "counter", "place_number": [0]})
+    raise AssertionError(call_site)
+
+
+def prompt_text(messages):
+    content = messages[0]["content"]
+    return content if isinstance(content, str) else " ".join(part.get("text", "") for part in content)
+
+
+@pytest.fixture
+def belief_manager(make_scene_graph):
+    # Place 4 (living room) is tagged with a mug
+    scene_graph = make_scene_graph(ROOMS, name="friday", objects_of_place=lambda place_id: ["mug"] if place_id == 4 else ["chair"])
+    belief_manager = BeliefManager("Where is my mug?", {PAST: scene_graph})
+    belief_manager.y_object_to_search = "mug"
+    return belief_manager
+
+
+@pytest.mark.parametrize("b_fast_path", [True, False])
+def test_exact_tag_skips_the_llm(script_llm, belief_manager, b_fast_path):
+    room_exploration = RoomExploration()
+    place_exploration = PlaceExploration()
+    room_exploration.b_object_match_fast_path = b_fast_path
+    place_exploration.b_object_match_fast_path = b_fast_path
+    room_llm = script_llm(room_exploration.oa_interface, respond)
+    place_llm = script_llm(place_exploration.oa_interface, respond)
+
+    r_room_to_explore, _ = room_exploration.plan(belief_manager, PAST, 0)
+    p_place_to_explore = place_exploration.plan(belief_manager, PAST, r_room_to_explore)
+    if b_fast_path:
+        assert (r_room_to_explore, p_place_to_explore) == ("r2", [4])
+        assert room_llm.calls == [] and place_llm.calls == []
+        assert room_exploration.stats_object_match_hits == 1 and place_exploration.stats_object_match_hits == 1
+    else:
+        # Baseline: the LLM decides
+        assert (r_room_to_explore, p_place_to_explore) == ("r1", [0])
+        assert room_llm.call_sites() == ["room"] and place_llm.call_sites() == ["place"]
+        assert "may have been seen" not in prompt_text(room_llm.calls[0][1])
+
+
+def test_head_noun_match_is_only_a_hint(script_llm, belief_manager):
+    # "red mug" only matches the "mug" tag by its head noun (0.8): the LLM still decides, with the match in the prompt
+    belief_manager.y_object_to_search = "red mug"
+    room_exploration = RoomExploration()
+    place_exploration = PlaceExploration()
+    room_exploration.b_object_match_fast_path = True
+    place_exploration.b_object_match_fast_path = True
+    room_llm = script_llm(room_exploration.oa_interface, respond)
+    place_llm = script_llm(place_exploration.oa_interface, respond)
+
+    r_room_to_explore, _ = room_exploration.plan(belief_manager, PAST, 0)
+    assert r_room_to_explore == "r1"
+    assert room_llm.call_sites() == ["room"]
+    room_prompt = prompt_text(room_llm.calls[0][1])
+    assert "may have been seen in these rooms" in room_prompt and "living room (room_id = r2)" in room_prompt
+
+    assert place_exploration.plan(belief_manager, PAST, "r2") == [0]
+    assert place_llm.call_sites() == ["place"]
+    assert "may have been seen at these places (the match can be wrong): [4]" in prompt_text(place_llm.calls[0][1])
+    assert room_exploration.stats_object_match_hits == 0 and place_exploration.stats_object_match_hits == 0
+
+
+def test_explored_places_are_not_matched(script_llm, belief_manager):
+    room_exploration = RoomExploration()
+    room_exploration.b_object_match_fast_path = True
+    room_llm = script_llm(room_exploration.oa_interface, respond)
+    belief_manager.H_a_place_exploration_action_history = [4]
+
+    r_room_to_explore, _ = room_exploration.plan(belief_manager, PAST, 0)
+    assert r_room_to_explore == "r1"
+    assert room_llm.call_sites() == ["room"]
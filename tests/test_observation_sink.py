@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+
+"""Observation sink: background writes, dropped observations and thread-safe counters."""
+
+import os
+import threading
+
+from contextual_long_term_reasoning.observation_sink import LazyImage, ObservationSink
+
+
+def test_writes_images_and_grids(tmp_path, make_images):
+    frames = make_images(3)
+    sink = ObservationSink(output_dir=str(tmp_path / "out"), max_queue_size=4, b_block_when_full=True)
+    sink.submit([LazyImage(path) for path in frames[:2]], label="friday afternoon: [0, 1]")
+    sink.submit([LazyImage(frames[2])])
+    sink.close()
+    assert (sink.num_saved, sink.num_grids, sink.num_dropped, sink.num_failed) == (3, 2, 0, 0)
+    assert sorted(os.listdir(tmp_path / "out")) == ["000000.png", "000001.png", "000002.png", "grid_000000.png", "grid_000001.png"]
+    # PNG frames are copied byte for byte
+    with open(frames[2], 'rb') as f, open(tmp_path / "out" / "000002.png", 'rb') as g:
+        assert f.read() == g.read()
+
+
+def test_failed_writes_are_counted(tmp_path, make_images):
+    frames = make_images(1)
+    sink = ObservationSink(output_dir=str(tmp_path / "out"), b_plot_grid=False, b_block_when_full=True)
+    sink.submit([LazyImage(str(tmp_path / "missing.png"))])
+    sink.submit([LazyImage(frames[0])])
+    sink.close()
+    assert (sink.num_saved, sink.num_failed) == (1, 1)
+
+
+def test_concurrent_submitters_account_for_every_observation(tmp_path, make_images, monkeypatch):
+    frames = make_images(1)
+    sink = ObservationSink(output_dir=str(tmp_path / "out"), b_plot_grid=False, max_queue_size=4)
+    release = threading.Event()
+    write = sink.write
+
+    def slow_write(images, label):
+        release.wait(10.0)
+        write(images, label)
+    monkeypatch.setattr(sink, "write", slow_write)
+
+    def submit():
+        for _ in range(50):
+            sink.submit([LazyImage(frames[0])])
+    threads = [threading.Thread(target=submit) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # The writer is held, so the queue filled up and the rest was dropped instead of blocking
+    assert sink.num_dropped >= 200 - 5
+    release.set()
+    sink.flush()
+    assert sink.num_saved + sink.num_dropped == 200 and sink.num_failed == 0
+    sink.close()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+
+"""OpenAI backend: token bucket rate limiting and retries of transient failures, sync and async."""
+
+import asyncio
+import json
+
+import httpx
+import openai
+import pytest
+
+from contextual_long_term_reasoning.local_llm_server import start_local_llm_server
+from contextual_long_term_reasoning.openai_backend import OpenAIBackend, TokenBucket, estimate_request_tokens
+
+REQUEST = {"model": "gpt-4o", "messages": [{"role": "user", "content": "Reply with \"score\" from 1 to 5."}]}
+
+
+def test_token_bucket_reservations_queue_up():
+    bucket = TokenBucket(60)  # One token per second
+    assert bucket.reserve(59) == 0.0
+    assert bucket.reserve(1) == pytest.approx(0.0, abs=0.01)
+    # The bucket is empty: the next callers wait in order
+    assert bucket.reserve(2) == pytest.approx(2.0, abs=0.01)
+    assert bucket.reserve(1) == pytest.approx(3.0, abs=0.01)
+    # A reservation larger than the capacity waits for a full bucket at most
+    assert TokenBucket(60).reserve(1000) == 0.0
+
+
+def test_request_tokens_count_images_and_completion():
+    messages = [{"role": "user", "content": [{"type": "text", "text": "x" * 400},
+                                             {"type": "image_url", "image_url": {"url": "data:image/png;base64,AAAA"}}]}]
+    assert estimate_request_tokens(messages, max_tokens=300) == 100 + 765 + 300
+
+
+@pytest.fixture
+def flaky_server():
+    # Half of the requests fail with a retryable status
+    server, base_url = start_local_llm_server(port=0, failure_rate=0.5, failure_status_codes=(429, 503), seed=1)
+    yield server, base_url
+    server.shutdown()
+    server.server_close()
+
+
+def test_transient_failures_are_retried(flaky_server):
+    server, base_url = flaky_server
+    backend = OpenAIBackend(max_retries=20, backoff_base=0.001, backoff_max=0.01, base_url=base_url)
+    for _ in range(5):
+        completion = backend.create_chat_completion(**REQUEST)
+        assert 1 <= json.loads(completion.choices[0].message.content)["score"] <= 5
+    responder = server.RequestHandlerClass.responder
+    assert responder.stats_failures > 0 and responder.stats_requests == 5 + responder.stats_failures
+
+
+def test_async_calls_share_the_retries(flaky_server):
+    server, base_url = flaky_server
+    backend = OpenAIBackend(max_concurrency=2, max_retries=20, backoff_base=0.001, backoff_max=0.01, base_url=base_url)
+
+    async def run():
+        return await asyncio.gather(*[backend.acreate_chat_completion(**REQUEST) for _ in range(4)])
+    assert len(asyncio.run(run())) == 4
+    # The client of the closed loop is dropped on the next use
+    assert len(asyncio.run(run())) == 4
+    assert len(backend._async_clients) == 1
+
+
+def test_gives_up_after_max_retries(flaky_server):
+    server, base_url = flaky_server
+    server.RequestHandlerClass.responder.failure_rate = 1.0
+    backend = OpenAIBackend(max_retries=2, backoff_base=0.001, backoff_max=0.01, base_url=base_url)
+    with pytest.raises((openai.RateLimitError, openai.InternalServerError)):
+        backend.create_chat_completion(**REQUEST)
+    assert server.RequestHandlerClass.responder.stats_requests == 3
+
+
+def status_error(error_class, status_code, headers=None):
+    response = httpx.Response(status_code, headers=headers, request=httpx.Request("POST", "http://127.0.0.1/v1/chat/completions"))
+    return error_class("error", response=response, body=None)
+
+
+def test_only_transient_errors_are_retryable():
+    backend = OpenAIBackend(backoff_base=0.001, backoff_max=0.01)
+    assert backend.is_retryable(status_error(openai.RateLimitError, 429))
+    assert backend.is_retryable(status_error(openai.InternalServerError, 503))
+    assert backend.is_retryable(openai.APITimeoutError(request=httpx.Request("POST", "http://127.0.0.1")))
+    assert not backend.is_retryable(status_error(openai.BadRequestError, 400))
+    assert not backend.is_retryable(status_error(openai.AuthenticationError, 401))
+    assert not backend.is_retryable(ValueError("not an API error"))
+    # The server's Retry-After is a lower bound of the backoff
+    assert backend.backoff_delay(0, status_error(openai.RateLimitError, 429, {"retry-after": "2"})) == 2.0
+    assert backend.backoff_delay(3, status_error(openai.RateLimitError, 429)) <= 0.01
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+
+"""Vision message building: image order and per-image failures."""
+
+import json
+
+from conftest import message_images
+from contextual_long_term_reasoning.eqa_reasoning import EQAReasoning
+from contextual_long_term_reasoning.image_payload_cache import encode_image_payload
+from contextual_long_term_reasoning.mind_palace_exploration import MindPalaceExploration
+from contextual_long_term_reasoning.openai_interface import OpenAIInterface
+
+
+def test_vision_message_keeps_order_and_reports_failures(tmp_path, make_images):
+    image_paths = make_images(6)
+    undecodable_path = str(tmp_path / "broken.png")
+    with open(undecodable_path, "w") as f:
+        f.write("not an image")
+    missing_path = str(tmp_path / "missing.png")
+    paths = [image_paths[0], missing_path, image_paths[1], undecodable_path] + image_paths[2:]
+
+    oa_interface = OpenAIInterface()
+    messages, image_failures = oa_interface.prepare_openai_vision_messages("before", "after", paths,
+                                                                          return_image_failures=True)
+    assert image_failures == [(missing_path, "file not found"), (undecodable_path, "image could not be decoded")]
+    content = messages[0]["content"]
+    assert content[0] == {"text": "before", "type": "text"} and content[-1] == {"text": "after", "type": "text"}
+    assert message_images(messages) == [encode_image_payload(path, oa_interface.image_size) for path in image_paths]
+
+    # Without the flag only the messages are returned, as before
+    assert oa_interface.prepare_openai_vision_messages("before", "after", paths) == messages
+
+
+def test_image_analysis_skips_the_request_without_usable_images(tmp_path, make_images, script_llm):
+    exploration = MindPalaceExploration()
+    llm = script_llm(exploration.oa_interface, lambda call_site, messages: json.dumps({"answer": "True", "reasoning": "a mug"}))
+
+    class Belief(object):
+        Q_user_question = "Where is my mug?"
+        y_object_to_search = "mug"
+
+    b_found, _, _ = exploration.vlm_image_analysis([str(tmp_path / "missing.png")], Belief())
+    assert not b_found and llm.calls == []
+
+    b_found, _, _ = exploration.vlm_image_analysis([str(tmp_path / "missing.png")] + make_images(1), Belief())
+    assert b_found
+    assert len(message_images(llm.calls[0][1])) == 1
+
+
+def test_answer_prompt_says_when_the_observation_image_is_missing(tmp_path, make_images):
+    eqa_reasoning = EQAReasoning()
+    messages = eqa_reasoning.prepare_observation_messages("before", "after", [str(tmp_path / "missing.png")])
+    assert [part["text"] for part in messages[0]["content"]] == [
+        "before", "(The image could not be loaded, rely on the observations above.)\n", "after"]
+    messages = eqa_reasoning.prepare_observation_messages("before", "after", make_images(1))
+    assert len(message_images(messages)) == 1 and len(messages[0]["content"]) == 3
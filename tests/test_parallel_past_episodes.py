@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+
+"""Concurrent exploration of past episodes on belief forks, merged back in a fixed order."""
+
+import threading
+import time
+
+import pytest
+
+from contextual_long_term_reasoning.belief_manager import BeliefManager, WorldModel
+from contextual_long_term_reasoning.mind_palace_exploration import MindPalaceExploration
+
+ROOMS = {"r1": "kitchen", "r2": "living room"}
+# Newest first, like the mind palace
+EPISODES = ["now (saturday morning)", "friday afternoon", "thursday afternoon", "wednesday morning"]
+
+
+@pytest.fixture
+def mind_palace(make_scene_graph):
+    return {episode: make_scene_graph(ROOMS, places_per_room=2, name=f"episode_{i}") for i, episode in enumerate(EPISODES)}
+
+
+def fake_explore_episode(found_episodes, delays, calls):
+    # explore_episode stand-in: records a find on the belief it is given, slower for some episodes
+    lock = threading.Lock()
+
+    def explore_episode(belief_manager, world_model, T_episode_to_explore, robot_place):
+        time.sleep(delays.get(T_episode_to_explore, 0.0))
+        with lock:
+            calls.append((T_episode_to_explore, belief_manager))
+        if T_episode_to_explore in found_episodes:
+            belief_manager.update_history(f"seen on {T_episode_to_explore}", [], [], T_episode_to_explore, "r1", [0])
+            return True, robot_place
+        return False, robot_place
+    return explore_episode
+
+
+def test_forks_merge_oldest_first_whatever_the_finish_order(monkeypatch, mind_palace):
+    exploration = MindPalaceExploration()
+    exploration.b_parallel_past_episodes = True
+    calls = []
+    # The newest past episode finishes last
+    monkeypatch.setattr(exploration, "explore_episode", fake_explore_episode(
+        set(EPISODES[1:]), {EPISODES[1]: 0.2, EPISODES[2]: 0.1}, calls))
+    belief_manager = BeliefManager("Where is my mug?", mind_palace)
+    belief_manager.update_history("seen before", [], [], EPISODES[1], "r2", [2])
+
+    plan = [EPISODES[1], EPISODES[3], EPISODES[2]]
+    results, _ = exploration.explore_episodes(belief_manager, WorldModel(mind_palace), plan, 0)
+    assert results == [(episode, True) for episode in plan]  # Plan order
+    # Every episode ran on its own fork, which started from the belief before the fan out
+    assert all(belief is not belief_manager for _, belief in calls)
+    assert len({id(belief) for _, belief in calls}) == 3
+    assert all(belief.S_exploration_summary[0].endswith("seen before") for _, belief in calls)
+    assert [action.episode for action in belief_manager.H_a_action_history] == [EPISODES[1], EPISODES[3], EPISODES[2], EPISODES[1]]
+    assert belief_manager.S_exploration_summary[0].endswith("seen before")
+    assert [observation.insights for observation in belief_manager.H_o_observation_history[1:]] == [
+        f"seen on {EPISODES[3]}", f"seen on {EPISODES[2]}", f"seen on {EPISODES[1]}"]
+
+
+def test_present_episode_stays_sequential(monkeypatch, mind_palace):
+    exploration = MindPalaceExploration()
+    exploration.b_parallel_past_episodes = True
+    calls = []
+    monkeypatch.setattr(exploration, "explore_episode", fake_explore_episode({EPISODES[0]}, {}, calls))
+    belief_manager = BeliefManager("Where is my mug?", mind_palace)
+
+    plan = [EPISODES[0], EPISODES[1], EPISODES[2], EPISODES[0]]
+    results, _ = exploration.explore_episodes(belief_manager, WorldModel(mind_palace), plan, 0)
+    assert results == [(EPISODES[0], True), (EPISODES[1], False), (EPISODES[2], False), (EPISODES[0], True)]
+    # The present is explored on the belief itself, the past episodes between on forks
+    assert sorted(episode for episode, belief in calls if belief is belief_manager) == [EPISODES[0], EPISODES[0]]
+    assert len(belief_manager.H_a_action_history) == 2
+
+
+def test_disabled_by_default(monkeypatch, mind_palace):
+    exploration = MindPalaceExploration()
+    assert not exploration.b_parallel_past_episodes
+    calls = []
+    monkeypatch.setattr(exploration, "explore_episode", fake_explore_episode(set(), {}, calls))
+    belief_manager = BeliefManager("Where is my mug?", mind_palace)
+    exploration.explore_episodes(belief_manager, WorldModel(mind_palace), EPISODES[1:], 0)
+    assert [episode for episode, _ in calls] == EPISODES[1:]
+    assert all(belief is belief_manager for _, belief in calls)
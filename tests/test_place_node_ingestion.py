@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+
+"""Place node ingestion: resuming from the per-chunk checkpoint after a crash."""
+
+import os
+import pickle
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from contextual_long_term_reasoning import mind_palace_generation
+from contextual_long_term_reasoning.mind_palace_generation import LoadingHabitatSceneGraph
+
+SCENE = "scene"
+NUM_FRAMES = 7
+
+
+@pytest.fixture
+def loader(tmp_path):
+    # Habitat layout: <state>/<scene>/<index>.pkl with the agent state, <frames>/<scene>/<index>-rgb.png
+    state_dir, frames_dir = tmp_path / "state", tmp_path / "frames"
+    (state_dir / SCENE).mkdir(parents=True)
+    (frames_dir / SCENE).mkdir(parents=True)
+    for i in range(NUM_FRAMES):
+        agent_state = SimpleNamespace(position=np.array([float(i), 0.0, 1.0]), rotation=SimpleNamespace(w=1.0, x=0.0, y=0.0, z=0.0))
+        with open(state_dir / SCENE / f"{i:05}.pkl", 'wb') as f:
+            pickle.dump({"agent_state": agent_state}, f)
+        (frames_dir / SCENE / f"{i:05}-rgb.png").write_bytes(b"")
+    return LoadingHabitatSceneGraph(SCENE, str(frames_dir), str(state_dir))
+
+
+@pytest.fixture
+def ingested_frames(monkeypatch):
+    # File indices the ingestion processed, the worker raises at the frame in crash_at
+    ingested = []
+    crash_at = []
+    load_place_node_from_frame = mind_palace_generation.load_place_node_from_frame
+
+    def load(job):
+        if job[0] in crash_at:
+            crash_at.clear()
+            raise KeyboardInterrupt
+        ingested.append(job[0])
+        return load_place_node_from_frame(job)
+    monkeypatch.setattr(mind_palace_generation, "load_place_node_from_frame", load)
+    return SimpleNamespace(ingested=ingested, crash_at=crash_at)
+
+
+def test_resume_after_a_crash_mid_chunk(loader, ingested_frames):
+    ingested_frames.crash_at.append(5)
+    with pytest.raises(KeyboardInterrupt):
+        loader.load_place_nodes(False, False, num_workers=1, checkpoint_every=2)
+    # Frames 0-3 were checkpointed in two chunks, frame 4 was in the chunk being filled
+    partial_dir = loader.partial_place_nodes_dir()
+    assert sorted(os.listdir(partial_dir)) == ["chunk_000000.pkl", "chunk_000001.pkl"]
+    assert sorted(loader.load_partial_place_nodes()) == [0, 1, 2, 3]
+
+    del ingested_frames.ingested[:]
+    place_nodes = loader.load_place_nodes(False, False, num_workers=1, checkpoint_every=2)
+    assert ingested_frames.ingested == [4, 5, 6]
+    assert list(place_nodes) == list(range(NUM_FRAMES))
+    assert [place_nodes[i].position for i in place_nodes] == [[float(i), 0.0, 1.0] for i in range(NUM_FRAMES)]
+    # The finished episode is saved and its checkpoint removed
+    assert not os.path.exists(partial_dir)
+    assert list(loader.load_place_nodes(False, True)) == list(range(NUM_FRAMES))
+
+
+def test_unreadable_chunks_are_ingested_again(loader, ingested_frames):
+    ingested_frames.crash_at.append(5)
+    with pytest.raises(KeyboardInterrupt):
+        loader.load_place_nodes(False, False, num_workers=1, checkpoint_every=2)
+    partial_dir = loader.partial_place_nodes_dir()
+    # A truncated chunk, and the temporary file of a write that was killed
+    with open(os.path.join(partial_dir, "chunk_000001.pkl"), 'r+b') as f:
+        f.truncate(10)
+    with open(os.path.join(partial_dir, "chunk_000002.pkl.tmp"), 'wb') as f:
+        f.write(b"\x80")
+
+    del ingested_frames.ingested[:]
+    place_nodes = loader.load_place_nodes(False, False, num_workers=1, checkpoint_every=2)
+    assert ingested_frames.ingested == [2, 3, 4, 5, 6]
+    assert list(place_nodes) == list(range(NUM_FRAMES))
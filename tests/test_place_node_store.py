@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+
+"""Round trip of place nodes through the columnar store and behavior of the memory-mapped views."""
+
+import pickle
+
+import numpy as np
+import pytest
+
+from contextual_long_term_reasoning.mind_palace_generation import PlaceNode
+from contextual_long_term_reasoning.place_node_store import (PlaceNodeStore, place_node_store_exists,
+                                                             save_place_node_store)
+
+PLACES = [
+    {"node_id": place_id, "position": [place_id * 0.5, 0.0, -1.0], "yaw": 0.25 * place_id, "room_parent": room_id,
+     "text_object_seen": objects, "text_contextual_description": caption, "image_path": f"frames/{place_id:05d}.png"}
+    for place_id, room_id, objects, caption in [(7, "r1", ["mug", "table"], "A kitchen table with a mug."),
+                                                (3, "r1", [], None),
+                                                (12, None, None, "A hallway."),
+                                                (5, "r2", ["sofa", "mug", "lamp"], "A living room, ünïcode.")]]
+
+
+@pytest.fixture
+def store_and_nodes(tmp_path, make_place_nodes):
+    place_nodes = make_place_nodes(PLACES)
+    store_dir = str(tmp_path / "store")
+    save_place_node_store(place_nodes, store_dir)
+    return PlaceNodeStore(store_dir), place_nodes
+
+
+def test_round_trip(store_and_nodes):
+    store, place_nodes = store_and_nodes
+    assert list(store) == list(place_nodes)  # Insertion order is kept
+    assert len(store) == len(place_nodes)
+    assert 7 in store and 8 not in store
+    for place_id, place_node in place_nodes.items():
+        view = store[place_id]
+        assert view.node_id == place_id
+        assert view.position == place_node.position
+        assert view.orientation == place_node.orientation
+        assert view.yaw == place_node.yaw
+        assert view.room_parent == place_node.room_parent
+        assert view.image_path == place_node.image_path
+        assert view.text_object_seen == place_node.text_object_seen
+        assert view.text_contextual_description == place_node.text_contextual_description
+
+
+def test_columns_are_memory_mapped(store_and_nodes):
+    store, _ = store_and_nodes
+    assert isinstance(store.positions, np.memmap)
+    assert not store.positions.flags.writeable
+    np.testing.assert_array_equal(store.node_ids, [7, 3, 12, 5])
+
+
+def test_room_reassignment_stays_in_memory(store_and_nodes):
+    store, _ = store_and_nodes
+    room_version = store.room_version
+    store[3].room_parent = "r9"
+    assert store[3].room_parent == "r9"
+    assert store.room_version == room_version + 1
+    # The files are unchanged, a fresh store sees the saved room
+    assert PlaceNodeStore(store.store_dir)[3].room_parent == "r1"
+
+
+def test_pickle_reopens_the_files(store_and_nodes):
+    store, _ = store_and_nodes
+    store[3].room_parent = "r9"
+    payload = pickle.dumps(store)
+    assert len(payload) < 1000  # The directory and the overrides, not the columns
+    copy = pickle.loads(payload)
+    assert copy[3].room_parent == "r9"
+    assert copy[5].text_object_seen == ["sofa", "mug", "lamp"]
+
+
+def test_to_place_nodes(store_and_nodes):
+    store, place_nodes = store_and_nodes
+    materialized = store.to_place_nodes()
+    assert all(isinstance(place_node, PlaceNode) for place_node in materialized.values())
+    assert materialized[5].text_contextual_description == place_nodes[5].text_contextual_description
+
+
+def test_incomplete_and_unsupported_stores(tmp_path, store_and_nodes):
+    assert not place_node_store_exists(str(tmp_path / "missing"))
+    store, _ = store_and_nodes
+    assert place_node_store_exists(store.store_dir)
+    with open(f"{store.store_dir}/meta.json", "w") as f:
+        f.write('{"version": -1}')
+    with pytest.raises(ValueError):
+        PlaceNodeStore(store.store_dir)
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+
+"""Ranking, filters and the cache file of the hashed TF-IDF place retrieval index."""
+
+import numpy as np
+
+from contextual_long_term_reasoning.place_retrieval_index import (HashedTfidfVectorizer, PlaceRetrievalIndex,
+                                                                  query_terms)
+
+
+PLACES = [
+    {"node_id": place_id, "room_parent": room_id, "text_object_seen": objects, "text_contextual_description": caption}
+    for place_id, room_id, objects, caption in [
+        (1, "r1", ["mug", "coffee maker"], "A kitchen counter with a coffee maker."),
+        (2, "r1", ["refrigerator"], "A white fridge next to the counter."),
+        (3, "r2", ["sofa", "television"], "A living room with a couch facing the tv."),
+        (4, "r2", ["mug"], "A mug on the coffee table."),
+        (5, "r3", None, None)]]
+
+
+def test_vectorizer_rows_are_unit_length():
+    vectorizer = HashedTfidfVectorizer(64)
+    matrix = vectorizer.fit_transform([["mug", "table"], ["mug"], []])
+    assert matrix.dtype == np.float32 and matrix.flags.c_contiguous
+    np.testing.assert_allclose(np.linalg.norm(matrix, axis=1), [1.0, 1.0, 0.0], atol=1e-6)
+    # crc32 hashing is stable across processes, unlike hash()
+    assert vectorizer.hash_term("mug") == HashedTfidfVectorizer(64).hash_term("mug")
+
+
+def test_query_terms():
+    assert "sofa" in query_terms("Where is the couch?")
+    assert set(query_terms(["mugs", "fridge"])) >= {"mug", "refrigerator"}
+
+
+def test_search_ranks_matching_places_first(make_place_nodes):
+    index = PlaceRetrievalIndex.from_place_nodes(make_place_nodes(PLACES))
+    results = index.search("Where did I leave my mug?", k=3)
+    assert {place_id for place_id, _ in results[:2]} == {1, 4}
+    assert results[0][1] >= results[1][1] >= results[2][1]
+    assert index.search("fridge", k=1)[0][0] == 2
+    assert index.search("couch", k=1)[0][0] == 3
+
+
+def test_search_filters(make_place_nodes):
+    index = PlaceRetrievalIndex.from_place_nodes(make_place_nodes(PLACES))
+    assert [place_id for place_id, _ in index.search("mug", k=5, room_id="r2")] == [4, 3]
+    assert 4 not in [place_id for place_id, _ in index.search("mug", k=5, exclude_place_ids=[4])]
+    assert index.search("mug", room_id="unknown room") == []
+    assert len(index.search("mug", k=100)) == 5
+
+
+def test_search_many_matches_search(make_place_nodes):
+    index = PlaceRetrievalIndex.from_place_nodes(make_place_nodes(PLACES))
+    queries = ["mug", "television", ["sofa", "refrigerator"]]
+    assert index.search_many(queries, k=3) == [index.search(query, k=3) for query in queries]
+
+
+def test_cache_round_trip(tmp_path, make_place_nodes):
+    place_nodes = make_place_nodes(PLACES)
+    index = PlaceRetrievalIndex.from_place_nodes(place_nodes)
+    signature = PlaceRetrievalIndex.signature(place_nodes)
+    path = str(tmp_path / "place_retrieval.npz")
+    index.save(path, signature)
+
+    loaded = PlaceRetrievalIndex.load(path, signature)
+    assert loaded.place_ids == index.place_ids
+    assert list(loaded.room_of_place) == list(index.room_of_place)
+    assert loaded.search("mug", k=3) == index.search("mug", k=3)
+
+    place_nodes[4].text_object_seen = ["lamp"]
+    assert PlaceRetrievalIndex.signature(place_nodes) != signature
+    assert PlaceRetrievalIndex.load(path, PlaceRetrievalIndex.signature(place_nodes)) is None
+    assert PlaceRetrievalIndex.load(str(tmp_path / "missing.npz"), signature) is None
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+
+"""Prompt budget: listings and summaries fit the token budget and keep the most relevant context."""
+
+import pytest
+
+from contextual_long_term_reasoning.prompt_budget import PromptBudget, text_terms
+
+ROOMS = {f"r{i}": name for i, name in enumerate(["kitchen", "living room", "bedroom", "bathroom", "garage", "office"])}
+FILLER = [f"item{i}" for i in range(30)]
+
+
+def objects_of_place(place_id):
+    # The mug was only seen in the garage (places 12-13), every place lists many other objects
+    return (["mug"] if place_id in (12, 13) else []) + FILLER
+
+
+@pytest.fixture
+def scene_graph(make_scene_graph):
+    return make_scene_graph(ROOMS, places_per_room=3, objects_of_place=objects_of_place)
+
+
+def test_text_terms_fold_plurals_and_drop_stopwords():
+    assert text_terms("Where are the mugs and my dress?") == {"mugs", "mug", "dress"}
+
+
+def test_summary_keeps_the_latest_entries():
+    budget = PromptBudget()
+    summary = [f"The robot explored room number {i} and found nothing there." for i in range(20)]
+    fitted = budget.fit_summary(summary, 60)
+    assert fitted.startswith("(") and "earlier entries omitted" in fitted
+    assert summary[-1] in fitted and summary[0] not in fitted
+    assert budget.fit_summary(summary[:2], 1000) == str(summary[:2])
+
+
+def test_room_listing_shrinks_objects_before_dropping_rooms(scene_graph):
+    budget = PromptBudget()
+    full_listing = scene_graph.print_room_nodes()
+    assert budget.fit_room_listing(scene_graph, "mug", 10 ** 6) == budget.fit_room_listing(scene_graph, "mug", 10 ** 6)
+
+    listing = budget.fit_room_listing(scene_graph, "Where is my mug?", budget.count_tokens(full_listing) // 2)
+    assert budget.count_tokens(listing) <= budget.count_tokens(full_listing) // 2
+    # Every room is still listed, the relevant object is kept first
+    assert all(f"Room Node {room_id}" in listing for room_id in ROOMS)
+    assert "mug" in listing and "item29" not in listing
+
+
+def test_room_listing_drops_the_least_relevant_rooms_last(scene_graph):
+    budget = PromptBudget(max_objects_per_room=0)
+    one_room = budget.count_tokens(scene_graph.print_room_nodes(room_ids={"r4"}, room_objects={"r4": []}))
+    listing = budget.fit_room_listing(scene_graph, "mug in the garage", one_room + 2, explored_room_ids={"r0"})
+    assert "Room Node r4" in listing and "Room Node r0" not in listing
+
+
+def test_place_listing_prefers_unexplored_relevant_places(scene_graph):
+    budget = PromptBudget()
+    one_place = budget.count_tokens(scene_graph.print_place_node(12))
+    listing = budget.fit_place_listing(scene_graph, "r4", "mug", one_place, explored_place_ids={12})
+    assert "Place Node 13" in listing and "Place Node 12" not in listing
+    # Candidates restrict the listing, at least one place is always listed
+    listing = budget.fit_place_listing(scene_graph, "r4", "mug", 0, candidate_place_ids={14})
+    assert "Place Node 14" in listing and "Place Node 13" not in listing
+
+
+def test_prompts_fit_the_budget(scene_graph):
+    budget = PromptBudget(max_prompt_tokens=300)
+    summaries = [f"The robot retrieved the {name} and did not find the mug." for name in ROOMS.values()] * 5
+
+    def build_prompt(room_listing, exploration_summary, room_exploration_summary):
+        return "Find the mug.\n" + room_listing + "\n" + exploration_summary + "\n" + room_exploration_summary
+
+    prompt = budget.fit_room_prompt(build_prompt, scene_graph, "mug", summaries, summaries[:3])
+    # The greedy fit may overshoot by one minimal room entry at most
+    minimal_room = budget.count_tokens(scene_graph.print_room_nodes(room_ids={"r4"}, room_objects={"r4": []}))
+    assert budget.count_tokens(prompt) <= 300 + minimal_room
+    assert "garage" in prompt and "earlier entries omitted" in prompt
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+
+"""RAM tagging: tag cache by image content and batched tagging of the cache misses only."""
+
+import pytest
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("ram")
+
+from contextual_long_term_reasoning.ram_interface import RAMTagCache, RecognizeAnything, filter_tags  # noqa: E402
+
+
+def test_tag_cache_is_keyed_by_content_and_model(tmp_path):
+    cache = RAMTagCache(cache_dir=str(tmp_path), model_signature="ram_swin_l_384_torch")
+    assert cache.get("abc") is None
+    cache.put("abc", ["mug", "table"])
+    assert cache.get("abc") == ["mug", "table"]
+    # Another process reads the disk layer, another model does not share the tags
+    assert RAMTagCache(cache_dir=str(tmp_path), model_signature="ram_swin_l_384_torch").get("abc") == ["mug", "table"]
+    assert RAMTagCache(cache_dir=str(tmp_path), model_signature="ram_swin_l_384_int8").get("abc") is None
+
+
+def test_filter_tags_drops_rooms():
+    assert filter_tags("mug | kitchen | living room | table") == ["mug", "table"]
+
+
+@pytest.fixture
+def recognizer(tmp_path):
+    # RecognizeAnything without loading the model weights: every image is tagged "mug | kitchen | table"
+    recognizer = object.__new__(RecognizeAnything)
+    recognizer.backend = "torch"
+    recognizer.device = torch.device("cpu")
+    recognizer.onnx_session = None
+    recognizer.transform = lambda image: torch.zeros(3, 4, 4)
+    recognizer.tag_cache = RAMTagCache(cache_dir=str(tmp_path / "tags"))
+    recognizer.batches = []
+
+    def generate_tags(images):
+        recognizer.batches.append(len(images))
+        return ["mug | kitchen | table"] * len(images)
+    recognizer.generate_tags = generate_tags
+    return recognizer
+
+
+def test_batches_only_the_cache_misses(tmp_path, make_images, recognizer):
+    frames = make_images(5)
+    missing_path = str(tmp_path / "missing.png")
+    assert recognizer.recognize_batch(frames[:3], batch_size=2, num_workers=0) == [["mug", "table"]] * 3
+    assert recognizer.batches == [2, 1]
+
+    # Cached frames are not tagged again, unreadable frames are None
+    results = recognizer.recognize_batch([frames[0], missing_path] + frames[3:], batch_size=2, num_workers=0)
+    assert results == [["mug", "table"], None, ["mug", "table"], ["mug", "table"]]
+    assert recognizer.batches == [2, 1, 2]
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+
+"""Key stability, replay misses and LRU eviction of the response cache."""
+
+import os
+import time
+
+import pytest
+
+from contextual_long_term_reasoning.response_cache import ResponseCache, ResponseCacheMiss
+
+
+def test_key_ignores_message_form_and_whitespace(tmp_path):
+    cache = ResponseCache(str(tmp_path))
+    key = cache.make_key("gpt-4o", 0, 0.0, 100, [{"role": "user", "content": "Where is the mug?"}])
+    same_key = cache.make_key("gpt-4o", 0, 0.0, 100,
+                              [{"role": "user", "content": [{"type": "text", "text": "  Where is the mug?\n"}]}])
+    assert key == same_key
+    # A second instance (another process) derives the same key
+    assert ResponseCache(str(tmp_path)).make_key("gpt-4o", 0, 0.0, 100, [{"role": "user", "content": "Where is the mug?"}]) == key
+
+
+def test_key_depends_on_request_parameters(tmp_path):
+    cache = ResponseCache(str(tmp_path))
+    messages = [{"role": "user", "content": "Where is the mug?"}]
+    keys = {
+        cache.make_key("gpt-4o", 0, 0.0, 100, messages),
+        cache.make_key("gpt-4o-mini", 0, 0.0, 100, messages),
+        cache.make_key("gpt-4o", 1, 0.0, 100, messages),
+        cache.make_key("gpt-4o", 0, 0.5, 100, messages),
+        cache.make_key("gpt-4o", 0, 0.0, 200, messages),
+        cache.make_key("gpt-4o", 0, 0.0, 100, [{"role": "user", "content": "Where is the cup?"}]),
+        cache.make_key("gpt-4o", 0, 0.0, 100, [{"role": "user", "content": [
+            {"type": "image_url", "image_url": {"url": "data:image/jpeg;base64,AAAA"}}]}]),
+    }
+    assert len(keys) == 7
+
+
+def test_store_lookup_and_replay_miss(tmp_path):
+    cache = ResponseCache(str(tmp_path))
+    cache.store("ab" * 32, {"content": "kitchen"})
+    assert cache.lookup("ab" * 32) == {"content": "kitchen"}
+    assert cache.lookup("cd" * 32) is None
+    assert (cache.stats_hits, cache.stats_misses) == (1, 1)
+
+    replay = ResponseCache(str(tmp_path), mode="replay")
+    assert replay.lookup("ab" * 32) == {"content": "kitchen"}
+    with pytest.raises(ResponseCacheMiss):
+        replay.lookup("cd" * 32)
+    replay.store("cd" * 32, {"content": "bedroom"})
+    assert not os.path.exists(replay.key_path("cd" * 32))
+
+
+def test_bypass_never_touches_disk(tmp_path):
+    cache_dir = str(tmp_path / "cache")
+    cache = ResponseCache(cache_dir, mode="bypass")
+    cache.store("ab" * 32, {"content": "kitchen"})
+    assert cache.lookup("ab" * 32) is None
+    assert not os.path.exists(cache_dir)
+
+
+def test_unknown_mode(tmp_path):
+    with pytest.raises(ValueError):
+        ResponseCache(str(tmp_path), mode="offline")
+
+
+def test_eviction_drops_least_recently_used(tmp_path):
+    entry = {"content": "x" * 1000}
+    cache = ResponseCache(str(tmp_path), max_size_mb=3500 / (1024 * 1024))
+    keys = [f"{i:02d}" * 32 for i in range(3)]
+    for i, key in enumerate(keys):
+        cache.store(key, entry)
+        past = time.time() - 100 + i
+        os.utime(cache.key_path(key), (past, past))
+    # Reading the oldest entry makes it the most recent one
+    assert cache.lookup(keys[0]) == entry
+
+    cache.store("03" * 32, entry)
+    assert not os.path.exists(cache.key_path(keys[1]))
+    assert all(os.path.exists(cache.key_path(key)) for key in (keys[0], keys[2], "03" * 32))
+    assert cache._size_bytes == sum(size for _, size, _ in cache.scan_entries())
+
+
+def test_overwrite_keeps_size_accurate(tmp_path):
+    cache = ResponseCache(str(tmp_path))
+    cache.store("ab" * 32, {"content": "x" * 1000})
+    cache.store("ab" * 32, {"content": "x" * 10})
+    assert cache._size_bytes == sum(size for _, size, _ in cache.scan_entries())
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+
+"""Room nodes built in one group-by pass match the per-room loop over the places."""
+
+import random
+
+import numpy as np
+import pytest
+
+from contextual_long_term_reasoning.mind_palace_generation import LoadingHabitatSceneGraph
+from contextual_long_term_reasoning.place_node_store import PlaceNodeStore, save_place_node_store
+
+OBJECTS = ["mug", "table", "sofa", "lamp", "bed", "sink"]
+
+
+def random_places(num_places=200, seed=0):
+    rng = random.Random(seed)
+    places = []
+    for place_id in rng.sample(range(10 * num_places), num_places):
+        objects = rng.choice([None, [], rng.sample(OBJECTS, rng.randint(1, 4))])
+        if objects and rng.random() < 0.2:
+            objects = objects + objects[:1]  # A place can list an object twice
+        places.append({"node_id": place_id, "position": [rng.uniform(-10, 10), rng.uniform(0, 3), rng.uniform(-10, 10)],
+                       "room_parent": rng.choice(["r0", "r1", "r2", "r3", None]), "text_object_seen": objects})
+    return places
+
+
+def reference_room_nodes(place_nodes):
+    # The loop load_room_nodes replaced, over the rooms the places belong to:
+    # {room_id: (mean position, objects seen, place ids)}
+    reference = {}
+    for room_id in {place_nodes[place_id].room_parent for place_id in place_nodes} - {None}:
+        object_texts = []
+        positions = []
+        place_ids = []
+        for place_id in place_nodes:
+            if place_nodes[place_id].room_parent == room_id:
+                if place_nodes[place_id].text_object_seen is not None:
+                    object_texts = list(set(object_texts + place_nodes[place_id].text_object_seen))
+                positions.append(place_nodes[place_id].position)
+                place_ids.append(place_id)
+        reference[room_id] = (np.mean(positions, axis=0).tolist(), set(object_texts), place_ids)
+    return reference
+
+
+@pytest.fixture
+def place_nodes(make_place_nodes):
+    return make_place_nodes(random_places())
+
+
+def test_matches_the_per_room_loop(place_nodes):
+    room_nodes = LoadingHabitatSceneGraph("scene", "", "").load_room_nodes(place_nodes)
+    reference = reference_room_nodes(place_nodes)
+    assert set(room_nodes) == set(reference)
+    for room_id, (position, objects, place_ids) in reference.items():
+        room_node = room_nodes[room_id]
+        assert room_node.position == pytest.approx(position)
+        assert set(room_node.text_object_seen) == objects
+        assert room_node.place_ids == place_ids
+
+
+def test_objects_are_counted_once_per_place(place_nodes):
+    room_nodes = LoadingHabitatSceneGraph("scene", "", "").load_room_nodes(place_nodes)
+    for room_id, room_node in room_nodes.items():
+        expected = {obj: sum(1 for place_id in room_node.place_ids if obj in (place_nodes[place_id].text_object_seen or []))
+                    for obj in room_node.text_object_seen}
+        assert room_node.object_counts == expected
+        # Most seen first
+        assert room_node.text_object_seen == sorted(expected, key=lambda obj: (-expected[obj], obj))
+
+
+def test_columnar_store_gives_the_same_rooms(tmp_path, place_nodes):
+    save_place_node_store(place_nodes, str(tmp_path / "store"))
+    loader = LoadingHabitatSceneGraph("scene", "", "")
+    room_nodes = loader.load_room_nodes(place_nodes)
+    store_room_nodes = loader.load_room_nodes(PlaceNodeStore(str(tmp_path / "store")))
+    assert set(store_room_nodes) == set(room_nodes)
+    for room_id, room_node in room_nodes.items():
+        store_room_node = store_room_nodes[room_id]
+        assert store_room_node.position == pytest.approx(room_node.position)
+        assert store_room_node.place_ids == room_node.place_ids
+        assert store_room_node.object_counts == room_node.object_counts
+        assert store_room_node.text_object_seen == room_node.text_object_seen
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+
+"""Branch and bound of the room planner against brute force enumeration of all visiting orders."""
+
+import itertools
+
+import numpy as np
+import pytest
+
+from contextual_long_term_reasoning.room_planner import ExpectedCostRoomPlanner
+
+
+def random_instance(rng, num_rooms):
+    points = rng.uniform(0.0, 20.0, size=(num_rooms + 1, 2))
+    distances = np.linalg.norm(points[:, None, :] - points[None, :, :], axis=2)
+    return distances[0, 1:], distances[1:, 1:], rng.uniform(0.0, 1.0, size=num_rooms)
+
+
+def brute_force(planner, start_distances, room_distances, probabilities, failure_cost, b_mutually_exclusive, depth):
+    if b_mutually_exclusive:
+        probabilities = probabilities / probabilities.sum()
+    costs = [(planner.order_cost(list(order), start_distances, room_distances, probabilities, failure_cost,
+                                 b_mutually_exclusive), list(order))
+             for order in itertools.permutations(range(len(probabilities)), depth)]
+    return min(costs, key=lambda item: item[0])
+
+
+@pytest.mark.parametrize("b_mutually_exclusive", [False, True])
+@pytest.mark.parametrize("depth", [1, 2, 3, 4])
+def test_matches_brute_force(b_mutually_exclusive, depth):
+    rng = np.random.default_rng(depth)
+    planner = ExpectedCostRoomPlanner(depth=depth)
+    for trial in range(20):
+        num_rooms = int(rng.integers(depth, 8))
+        start_distances, room_distances, probabilities = random_instance(rng, num_rooms)
+        failure_cost = float(rng.choice([0.0, 30.0, 200.0]))
+        order, cost = planner.plan(start_distances, room_distances, probabilities, failure_cost, b_mutually_exclusive)
+        best_cost, _ = brute_force(planner, start_distances, room_distances, probabilities, failure_cost,
+                                   b_mutually_exclusive, depth)
+        assert len(order) == depth and len(set(order)) == depth
+        assert cost == pytest.approx(best_cost, rel=1e-9, abs=1e-9)
+        # The returned cost is the cost of the returned order
+        normalized = probabilities / probabilities.sum() if b_mutually_exclusive else probabilities
+        assert planner.order_cost(order, start_distances, room_distances, normalized, failure_cost,
+                                  b_mutually_exclusive) == pytest.approx(cost)
+
+
+def test_prunes_on_larger_instances():
+    rng = np.random.default_rng(0)
+    start_distances, room_distances, probabilities = random_instance(rng, 12)
+    planner = ExpectedCostRoomPlanner(depth=4)
+    order, cost = planner.plan(start_distances, room_distances, probabilities, failure_cost=100.0)
+    best_cost, _ = brute_force(planner, start_distances, room_distances, probabilities, 100.0, False, 4)
+    assert cost == pytest.approx(best_cost)
+    assert planner.stats_pruned > 0
+    assert planner.stats_nodes < 12 * 11 * 10 * 9
+
+
+def test_obvious_choice():
+    # A certain room next door beats an unlikely one further away
+    order, cost = ExpectedCostRoomPlanner(depth=2).plan([1.0, 10.0], [[0.0, 9.0], [9.0, 0.0]], [1.0, 0.1])
+    assert order == [0, 1]
+    assert cost == pytest.approx(1.0)
+
+
+def test_edge_cases():
+    planner = ExpectedCostRoomPlanner(depth=3)
+    assert planner.plan([], np.zeros((0, 0)), []) == ([], 0.0)
+    order, cost = planner.plan([2.0], [[0.0]], [0.5], failure_cost=10.0)
+    assert order == [0] and cost == pytest.approx(0.5 * 2.0 + 0.5 * 10.0)
+    # No probability mass at all spreads it evenly over the rooms
+    order, _ = planner.plan([1.0, 2.0], [[0.0, 1.0], [1.0, 0.0]], [0.0, 0.0], b_mutually_exclusive=True, depth=2)
+    assert order == [0, 1]
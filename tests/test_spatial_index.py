@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+
+"""Nearest, radius and per-room queries of the spatial index against brute force distances."""
+
+import numpy as np
+import pytest
+
+from contextual_long_term_reasoning import spatial_index
+from contextual_long_term_reasoning.mind_palace_generation import SceneGraph
+from contextual_long_term_reasoning.spatial_index import PlaceSpatialIndex
+
+
+def random_places(num_places=200, seed=0):
+    # Scattered over a 20 m cube, four interleaved rooms
+    rng = np.random.default_rng(seed)
+    return [{"node_id": place_id, "position": rng.uniform(-10.0, 10.0, size=3).tolist(), "room_parent": f"r{place_id % 4}"}
+            for place_id in range(num_places)]
+
+
+def brute_force(place_nodes, position, room_id=None):
+    distances = [(place_id, float(np.linalg.norm(np.asarray(place_node.position) - position)))
+                 for place_id, place_node in place_nodes.items() if room_id is None or place_node.room_parent == room_id]
+    return sorted(distances, key=lambda item: item[1])
+
+
+@pytest.fixture(params=["kdtree", "numpy"])
+def index_and_nodes(request, monkeypatch, make_place_nodes):
+    if request.param == "numpy":
+        monkeypatch.setattr(spatial_index, "cKDTree", None)
+    elif spatial_index.cKDTree is None:
+        pytest.skip("scipy is not installed")
+    place_nodes = make_place_nodes(random_places())
+    return PlaceSpatialIndex(place_nodes), place_nodes
+
+
+def test_nearest(index_and_nodes):
+    index, place_nodes = index_and_nodes
+    position = np.array([1.0, -2.0, 0.5])
+    expected = brute_force(place_nodes, position)
+    assert [place_id for place_id, _ in index.nearest(position, k=5)] == [place_id for place_id, _ in expected[:5]]
+    assert index.nearest(position, k=1)[0][1] == pytest.approx(expected[0][1])
+    assert len(index.nearest(position, k=1000)) == len(place_nodes)
+
+
+def test_within_radius(index_and_nodes):
+    index, place_nodes = index_and_nodes
+    position = np.array([0.0, 0.0, 0.0])
+    expected = [place_id for place_id, distance in brute_force(place_nodes, position) if distance <= 6.0]
+    assert [place_id for place_id, _ in index.within_radius(position, 6.0)] == expected
+    assert index.within_radius(np.array([100.0, 100.0, 100.0]), 1.0) == []
+
+
+def test_nearest_in_room(index_and_nodes):
+    index, place_nodes = index_and_nodes
+    position = np.array([3.0, 3.0, -3.0])
+    for room_id in ("r0", "r3"):
+        expected = brute_force(place_nodes, position, room_id)
+        assert [place_id for place_id, _ in index.nearest_in_room(position, room_id, k=3)] == \
+            [place_id for place_id, _ in expected[:3]]
+    assert index.nearest_in_room(position, "unknown room") == []
+
+
+def test_nearest_id(make_place_nodes):
+    index = PlaceSpatialIndex(make_place_nodes([{"node_id": place_id} for place_id in (10, 20, 40)]))
+    assert index.nearest_id(24) == 20
+    assert PlaceSpatialIndex({}).nearest_id(24) is None
+
+
+def test_scene_graph_rebuilds_after_room_reassignment(make_place_nodes):
+    place_nodes = make_place_nodes(random_places(20))
+    scene_graph = SceneGraph("scene", "", room_nodes={}, place_nodes=place_nodes)
+    position = place_nodes[1].position
+    assert scene_graph.nearest_place_in_room(position, "r0")[0][0] != 1
+    index = scene_graph.spatial_index()
+    assert scene_graph.spatial_index() is index  # Reused while nothing changes
+
+    place_nodes[1].room_parent = "r0"
+    assert scene_graph.nearest_place_in_room(position, "r0")[0] == (1, 0.0)
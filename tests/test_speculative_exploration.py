@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+
+"""Speculative room search of past episodes: the first room to find the object wins, the others are cancelled."""
+
+import threading
+import time
+
+import pytest
+
+from contextual_long_term_reasoning.belief_manager import BeliefManager, WorldModel
+from contextual_long_term_reasoning.mind_palace_exploration import MindPalaceExploration
+
+ROOMS = {"r1": "kitchen", "r2": "living room", "r3": "bedroom"}
+PAST = "friday afternoon"
+
+
+@pytest.fixture
+def mind_palace(make_scene_graph):
+    return {"now (saturday morning)": make_scene_graph(ROOMS, name="now"), PAST: make_scene_graph(ROOMS, name="friday")}
+
+
+@pytest.fixture
+def exploration(monkeypatch):
+    exploration = MindPalaceExploration()
+    exploration.b_speculative_room_exploration = True
+    exploration.param_speculative_top_k = 3
+    # Rooms in id order, one place at a time in id order: no model calls for the planning
+    monkeypatch.setattr(exploration.room_exploration, "rank_rooms",
+                        lambda belief_manager, T_episode, robot_place, explored_room_ids: [
+                            room_id for room_id in ROOMS if room_id not in explored_room_ids])
+
+    def next_place(belief_manager, T_episode, room_id):
+        scene_graph = belief_manager.M_mind_palace[T_episode]
+        places = [place_id for place_id in scene_graph.place_nodes if scene_graph.place_nodes[place_id].room_parent == room_id
+                  and place_id not in belief_manager.H_a_place_exploration_action_history]
+        return places[:1]
+    monkeypatch.setattr(exploration.place_exploration, "plan", next_place)
+    return exploration
+
+
+def screen_by_place(mind_palace, verdict_of_place):
+    # screen_images stand-in: verdict_of_place(place_id) -> object found, called with the place of the single image
+    place_of_image = {place_node.image_path: place_id for place_id, place_node in mind_palace[PAST].place_nodes.items()}
+
+    def screen_images(image_paths, belief_manager, cancel_event=None):
+        place_id = place_of_image[image_paths[0]]
+        if verdict_of_place(place_id):
+            return True, f"found at {place_id}", [0]
+        return False, "", []
+    return screen_images
+
+
+def test_winner_does_not_wait_for_the_other_rooms(monkeypatch, mind_palace, exploration):
+    release = threading.Event()
+    finished = []
+
+    def verdict(place_id):
+        if place_id in (0, 6):
+            # r1 and r3: a slow vision call, still in flight when r2 finds the object
+            release.wait(10.0)
+            finished.append(place_id)
+            return True
+        return place_id == 4  # r2 finds the object at its second place
+
+    monkeypatch.setattr(exploration, "screen_images", screen_by_place(mind_palace, verdict))
+    belief_manager = BeliefManager("Where is my mug?", mind_palace)
+    belief_manager.y_object_to_search = "mug"
+
+    start_time = time.perf_counter()
+    b_found, _ = exploration.explore_episode(belief_manager, WorldModel(mind_palace), PAST, 0)
+    assert b_found
+    assert time.perf_counter() - start_time < 5.0
+    assert finished == []
+    assert exploration.stats_cancelled_rooms == 2
+    # Only the winner's place history is merged
+    assert belief_manager.H_a_place_exploration_action_history == [3]
+    assert [(action.room_id, action.goal_poses) for action in belief_manager.H_a_action_history] == [("r2", [4])]
+
+    # The cancelled rooms drop their late positives instead of reporting them (r3 may not even have started)
+    release.set()
+    deadline = time.time() + 5.0
+    while 0 not in finished and time.time() < deadline:
+        time.sleep(0.01)
+    time.sleep(0.05)
+    assert 0 in finished
+    assert len(belief_manager.H_a_action_history) == 1
+    assert belief_manager.H_a_place_exploration_action_history == [3]
+
+
+def test_not_found_merges_every_room_in_rank_order(monkeypatch, mind_palace, exploration):
+    monkeypatch.setattr(exploration, "screen_images", screen_by_place(mind_palace, lambda place_id: False))
+    belief_manager = BeliefManager("Where is my mug?", mind_palace)
+    belief_manager.y_object_to_search = "mug"
+
+    b_found, _ = exploration.explore_episode(belief_manager, WorldModel(mind_palace), PAST, 0)
+    assert not b_found
+    assert sorted(belief_manager.H_a_place_exploration_action_history) == list(range(9))
+    assert belief_manager.H_r_explored_room_ids == ["r1", "r2", "r3"]
+    assert belief_manager.H_a_action_history == []
+    assert exploration.stats_total_images_retrieved == 9
+
+
+def test_set_vision_check_skips_the_call_once_cancelled(make_images, script_llm, exploration):
+    llm = script_llm(exploration.oa_interface, lambda call_site, messages: '{"answer": "True", "reasoning": "a mug"}')
+
+    class Belief(object):
+        Q_user_question = "Where is my mug?"
+        y_object_to_search = "mug"
+
+    cancel_event = threading.Event()
+    cancel_event.set()
+    for mode in ("set", "batch"):
+        exploration.param_vision_screening = mode
+        assert exploration.screen_images(make_images(2), Belief(), cancel_event) == (False, "", [])
+    assert llm.calls == []
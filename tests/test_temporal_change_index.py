@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+
+"""Appear, disappear and move detection of the temporal change index."""
+
+from contextual_long_term_reasoning.mind_palace_generation import SceneGraph
+from contextual_long_term_reasoning.temporal_change_index import TemporalChangeIndex, room_object_counts
+
+# episode -> room -> {object: places}, newest first like the mind palace
+EPISODE_ROOM_COUNTS = {
+    "now": {"kitchen": {"mug": 2}, "office": {"laptop": 1, "lamp": 1}},
+    "yesterday": {"kitchen": {"plant": 1}, "office": {"mug": 1, "laptop": 1, "lamp": 1}},
+    "last week": {"kitchen": {"plant": 1}, "office": {"mug": 1, "laptop": 1}},
+}
+
+
+def test_changes_between_consecutive_episodes():
+    change_index = TemporalChangeIndex.from_room_object_counts(EPISODE_ROOM_COUNTS)
+    assert change_index.episodes == ["last week", "yesterday", "now"]
+    changes = {(change.object, change.change, change.episode_before, change.episode_after) for change in change_index.changes}
+    assert changes == {
+        ("lamp", "appear", "last week", "yesterday"),
+        ("mug", "move", "yesterday", "now"),
+        ("plant", "disappear", "yesterday", "now"),
+    }
+    mug_move = change_index.query("mugs")[0]
+    assert (mug_move.rooms_before, mug_move.rooms_after) == (("office",), ("kitchen",))
+
+
+def test_min_places():
+    # A single sighting is not enough, so only the mug counts and it appears in the kitchen
+    change_index = TemporalChangeIndex.from_room_object_counts(EPISODE_ROOM_COUNTS, min_places=2)
+    assert [(change.object, change.change) for change in change_index.changes] == [("mug", "appear")]
+
+
+def test_query_filters():
+    change_index = TemporalChangeIndex.from_room_object_counts(EPISODE_ROOM_COUNTS)
+    assert len(change_index) == 3
+    assert [change.object for change in change_index.query(change="disappear")] == ["plant"]
+    assert {change.object for change in change_index.query(episode="now")} == {"mug", "plant"}
+    assert change_index.query("mug", change="appear") == []
+    assert [change.object for change in change_index.query("blue mug")] == ["mug"]  # Head noun
+    assert change_index.query("giraffe") == []
+
+
+def test_changed_episodes_and_describe():
+    change_index = TemporalChangeIndex.from_room_object_counts(EPISODE_ROOM_COUNTS)
+    assert change_index.changed_episodes("mug") == ["now", "yesterday"]
+    assert change_index.changed_episodes(["mug", "lamp"]) == ["now", "yesterday", "last week"]
+    assert change_index.describe("mug") == "mug moved between yesterday and now from office to kitchen"
+    assert change_index.describe("laptop") == "No change of the object was recorded between the time instances."
+    assert change_index.to_records()[0]["object"] == "lamp"
+
+
+def test_from_mind_palace_counts_places_of_each_room(make_place_nodes):
+    def make_scene_graph(places):
+        place_nodes = make_place_nodes([{"node_id": place_id, "room_parent": room_id, "text_object_seen": objects}
+                                        for place_id, room_id, objects in places])
+        return SceneGraph("scene", "", room_nodes={"r1": None, "r2": None}, place_nodes=place_nodes)
+
+    mind_palace = {"now": make_scene_graph([(1, "r2", ["Mugs"]), (2, "r2", ["mug", "mug"])]),
+                   "before": make_scene_graph([(1, "r1", ["mug"])])}
+    assert room_object_counts(mind_palace["now"]) == {"r1": {}, "r2": {"mug": 2}}
+    change_index = TemporalChangeIndex.from_mind_palace(mind_palace)
+    assert [(change.object, change.change, change.rooms_before, change.rooms_after) for change in change_index.changes] == \
+        [("mug", "move", ("r1",), ("r2",))]
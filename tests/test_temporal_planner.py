@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+
+"""Temporal planner: memoized reward estimates, uncached failures and answering once the object is found."""
+
+import json
+
+import pytest
+
+from contextual_long_term_reasoning.belief_manager import BeliefManager
+from contextual_long_term_reasoning.mind_palace_exploration import TemporalPlanner
+
+ROOMS = {"r1": "kitchen", "r2": "living room", "r3": "bedroom"}
+EPISODES = ["now (saturday morning)", "friday afternoon", "thursday evening"]
+ESTIMATES = {"now (saturday morning)": (0.1, 3), "friday afternoon": (0.9, 1), "thursday evening": (0.3, 2)}
+
+
+def estimator(estimates=ESTIMATES, failing=()):
+    # Answers the reward estimate of the episode named in the prompt, a malformed answer for the failing ones
+    def respond(call_site, messages):
+        assert call_site == "planner"
+        prompt = messages[0]["content"]
+        prompt = prompt if isinstance(prompt, str) else prompt[0]["text"]
+        episode = next(episode for episode in EPISODES if ("now" in episode and "explore the environment now" in prompt)
+                       or ("now" not in episode and "at the time: " + episode + "." in prompt))
+        if episode in failing:
+            return "no estimate"
+        probability, num_rooms = estimates[episode]
+        return json.dumps({"probability": probability, "number_of_rooms": num_rooms, "reasoning": "scripted"})
+    return respond
+
+
+@pytest.fixture
+def belief_manager(make_scene_graph):
+    mind_palace = {episode: make_scene_graph(ROOMS, name=f"scene_{i}") for i, episode in enumerate(EPISODES)}
+    belief_manager = BeliefManager("Where is my mug?", mind_palace)
+    belief_manager.y_object_to_search = "mug"
+    return belief_manager
+
+
+@pytest.fixture
+def planner(belief_manager):
+    return TemporalPlanner(belief_manager.M_mind_palace, num_workers=2)
+
+
+def test_repeated_plan_hits_the_reward_cache(script_llm, planner, belief_manager):
+    llm = script_llm(planner.llm_interface, estimator())
+    action = planner.plan(belief_manager)
+    assert planner.action_name(action) == "friday afternoon"
+    assert len(llm.calls) == 3 and planner.stats_llm_calls == 3
+    Q_action_value_function_dict = dict(planner.Q_action_value_function_dict)
+
+    assert planner.plan(belief_manager) == action
+    assert len(llm.calls) == 3 and planner.stats_cache_hits == 3
+    # Same belief, same rollouts
+    assert planner.Q_action_value_function_dict == Q_action_value_function_dict
+
+    # A changed belief asks again
+    belief_manager.y_reasoning_to_search_object = "Mugs are kept in the kitchen."
+    planner.plan(belief_manager)
+    assert len(llm.calls) == 6
+
+
+def test_failed_estimates_are_not_memoized(script_llm, planner, belief_manager):
+    llm = script_llm(planner.llm_interface, estimator(failing=("friday afternoon",)))
+    planner.plan(belief_manager)
+    assert planner.stats_fallbacks == 1 and len(llm.calls) == 3
+    assert ("Where is my mug?", "friday afternoon", belief_manager.belief_digest()) not in planner.reward_cache
+
+    # Only the failed episode is asked again
+    planner.plan(belief_manager)
+    assert planner.stats_fallbacks == 2 and planner.stats_cache_hits == 2
+    assert llm.call_sites() == ["planner"] * 4
+
+
+def test_answers_once_the_object_is_found(script_llm, planner, belief_manager):
+    script_llm(planner.llm_interface, estimator())
+    assert planner.plan(belief_manager) != -1
+    belief_manager.update_history("The mug is on the kitchen counter.", [], [], "friday afternoon", "r1", [])
+    assert planner.plan(belief_manager) == -1
+    assert planner.action_name(-1) == "answer"
+
+
+def test_greedy_policy_breaks_ties_towards_now(planner):
+    assert planner.greedy_policy({0: 1.0, 1: 1.0, 2: 1.0, -1: 0.5}) == 0
+    assert planner.greedy_policy({0: 1.0, 1: 2.0, 2: 1.0, -1: 2.0}) == 1
+    assert planner.greedy_policy({-1: 0.0}) == -1
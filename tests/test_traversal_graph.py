@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+
+"""Walking distances of the traversal graph, its cache file and the sparse mode of large scenes."""
+
+import numpy as np
+import pytest
+
+pytest.importorskip("scipy")
+
+from contextual_long_term_reasoning.traversal_graph import TraversalGraph
+
+# A U shaped walk: along x, up y by 4 and back along x. Both legs are 4 apart, beyond the adjacency radius.
+U_WALK_POINTS = [(x, 0.0) for x in range(5)] + [(4.0, y) for y in range(1, 5)] + [(x, 4.0) for x in range(3, -1, -1)]
+U_WALK = [{"node_id": place_id, "position": [float(x), float(y), 0.0],
+           "room_parent": "r_start" if place_id < 3 else ("r_end" if place_id >= len(U_WALK_POINTS) - 3 else "r_middle")}
+          for place_id, (x, y) in enumerate(U_WALK_POINTS)]
+
+
+@pytest.fixture
+def make_graph(make_place_nodes):
+    def make(max_dense_places=2000):
+        traversal_graph = TraversalGraph.from_place_nodes(make_place_nodes(U_WALK), adjacency_radius=1.0,
+                                                          max_dense_places=max_dense_places)
+        traversal_graph.compute()
+        return traversal_graph
+    return make
+
+
+def test_distances_follow_the_walk(make_graph):
+    traversal_graph = make_graph()
+    # Start and end of the U are 4 apart in a straight line and 12 along the walk
+    assert traversal_graph.euclidean(0, 12) == pytest.approx(4.0)
+    assert traversal_graph.place_distance(0, 12) == pytest.approx(12.0)
+    assert traversal_graph.place_distance(12, 0) == pytest.approx(12.0)
+    assert traversal_graph.place_distance(3, 3) == 0.0
+
+
+def test_room_distances(make_graph):
+    traversal_graph = make_graph()
+    assert traversal_graph.room_ids == ["r_end", "r_middle", "r_start"]
+    # Each room is represented by its place closest to the centroid: 1 for r_start, 11 for r_end
+    assert traversal_graph.room_distance("r_start", "r_end") == pytest.approx(10.0)
+    assert traversal_graph.room_distance("r_start", "r_start") == 0.0
+    assert traversal_graph.place_to_room_distance(0, "r_end") == pytest.approx(11.0)
+
+
+def test_sparse_rows_match_dense(make_graph):
+    dense = make_graph()
+    sparse = make_graph(max_dense_places=5)
+    assert sparse.place_distances is None
+    for row in range(len(dense.place_ids)):
+        np.testing.assert_allclose(sparse.distance_row(row), dense.distance_row(row), rtol=1e-6)
+    np.testing.assert_allclose(sparse.room_distances, dense.room_distances, rtol=1e-6)
+
+
+def test_radius_edges_shortcut_the_walk(make_place_nodes):
+    # With a radius that reaches across the U the ends are directly connected
+    traversal_graph = TraversalGraph.from_place_nodes(make_place_nodes(U_WALK), adjacency_radius=4.0)
+    traversal_graph.compute()
+    assert traversal_graph.place_distance(0, 12) == pytest.approx(4.0)
+
+
+def test_cache_round_trip(tmp_path, make_graph, make_place_nodes):
+    path = str(tmp_path / "traversal_graph.npz")
+    traversal_graph = make_graph()
+    traversal_graph.save(path)
+
+    loaded = TraversalGraph.from_place_nodes(make_place_nodes(U_WALK), adjacency_radius=1.0)
+    assert loaded.load(path)
+    np.testing.assert_array_equal(loaded.place_distances, traversal_graph.place_distances)
+    assert loaded.room_distance("r_start", "r_end") == pytest.approx(10.0)
+
+    # A different radius, other places or the sparse mode do not reuse the file
+    assert not TraversalGraph.from_place_nodes(make_place_nodes(U_WALK), adjacency_radius=2.0).load(path)
+    moved = make_place_nodes(U_WALK)
+    moved[0].room_parent = "r_middle"
+    assert not TraversalGraph.from_place_nodes(moved, adjacency_radius=1.0).load(path)
+    assert not TraversalGraph.from_place_nodes(make_place_nodes(U_WALK), adjacency_radius=1.0, max_dense_places=5).load(path)
+    assert not TraversalGraph.from_place_nodes(make_place_nodes(U_WALK)).load(str(tmp_path / "missing.npz"))
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+
+"""Per-image vision screening: verdicts map to the images that were actually sent."""
+
+import json
+
+import pytest
+
+from conftest import message_images
+from contextual_long_term_reasoning.image_payload_cache import encode_image_payload
+from contextual_long_term_reasoning.mind_palace_exploration import MindPalaceExploration
+
+
+class Belief(object):
+    Q_user_question = "Where is my mug?"
+    y_object_to_search = "mug"
+
+
+def vision_model(oa_interface, positive_paths):
+    # Answers like a model that sees the object exactly in positive_paths
+    positive_urls = {encode_image_payload(path, oa_interface.image_size) for path in positive_paths}
+
+    def respond(call_site, messages):
+        verdicts = ["True" if url in positive_urls else "False" for url in message_images(messages)]
+        if call_site == "vision_screening":
+            return json.dumps({"answer": verdicts[0], "confidence": 0.9, "reasoning": "checked"})
+        if call_site == "vision":
+            if "verdicts" in messages[0]["content"][0]["text"]:
+                return json.dumps({"verdicts": verdicts, "confidence": [0.9] * len(verdicts), "reasoning": "checked"})
+            return json.dumps({"answer": "True" if "True" in verdicts else "False", "reasoning": "checked"})
+        raise AssertionError(call_site)
+    return respond
+
+
+@pytest.fixture
+def exploration():
+    return MindPalaceExploration()
+
+
+@pytest.mark.parametrize("mode", ["set", "batch", "concurrent"])
+def test_positive_indices_skip_failed_images(tmp_path, make_images, script_llm, exploration, mode):
+    frames = make_images(3)
+    missing_path = str(tmp_path / "missing.png")
+    image_paths = [frames[0], missing_path, frames[1], frames[2]]
+    llm = script_llm(exploration.oa_interface, vision_model(exploration.oa_interface, [frames[2]]))
+    exploration.param_vision_screening = mode
+
+    b_found, _, positive_indices = exploration.screen_images(image_paths, Belief())
+    assert b_found
+    if mode == "set":
+        # One verdict for the set: every image that was sent counts, the missing one does not
+        assert positive_indices == [0, 2, 3]
+    else:
+        assert positive_indices == [3]
+    # No request ever carries a failed image or goes out without an image
+    assert all(len(message_images(messages)) > 0 for _, messages in llm.calls)
+    if mode == "concurrent":
+        assert len(llm.calls) <= 3
+
+
+@pytest.mark.parametrize("mode", ["set", "batch", "concurrent"])
+def test_no_request_without_usable_images(tmp_path, script_llm, exploration, mode):
+    llm = script_llm(exploration.oa_interface, vision_model(exploration.oa_interface, []))
+    exploration.param_vision_screening = mode
+    image_paths = [str(tmp_path / "missing_0.png"), str(tmp_path / "missing_1.png")]
+    b_found, _, positive_indices = exploration.screen_images(image_paths, Belief())
+    assert not b_found and positive_indices == []
+    assert llm.calls == []
+
+
+def test_concurrent_screening_stops_at_a_confident_hit(make_images, script_llm, exploration):
+    frames = make_images(8)
+    llm = script_llm(exploration.oa_interface, vision_model(exploration.oa_interface, [frames[0]]))
+    exploration.param_vision_screening = "concurrent"
+    exploration.param_vision_screening_workers = 1
+
+    b_found, _, positive_indices = exploration.screen_images(frames, Belief())
+    assert b_found and positive_indices == [0]
+    assert len(llm.calls) < len(frames)
+
+
+def test_batch_keeps_confident_positives(make_images, script_llm, exploration):
+    frames = make_images(3)
+    script_llm(exploration.oa_interface, lambda call_site, messages: json.dumps(
+        {"verdicts": ["True", "True", "False"], "confidence": [0.3, 0.9, 0.9], "reasoning": "checked"}))
+    exploration.param_vision_screening = "batch"
+    assert exploration.screen_images(frames, Belief())[2] == [1]